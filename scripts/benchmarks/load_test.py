@@ -0,0 +1,315 @@
+"""Load test of the Slack and Discord command handlers against a local Semantic Scholar stand-in.
+
+Drives `clients.slack.paperfind/paperlike/papercite` from a pool of worker threads, or the Discord coroutines from
+concurrent tasks, on behalf of synthetic users. Slack's `App.client` and Discord's `ctx` are replaced by fakes which
+record the sent messages. Reports throughput and end-to-end latency percentiles, broken down into fetch, format and
+send, e.g.,
+
+    python scripts/benchmarks/load_test.py slack --users 32 --commands 8 --latency 0.2
+    python scripts/benchmarks/load_test.py discord --users 64 --commands 4 --output outputs/load_discord.json
+
+"""
+
+import argparse
+import asyncio
+import contextvars
+import datetime
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any
+
+import paperbot as pb
+import paperbot.clients.discord as discord_client
+import paperbot.clients.slack as slack_client
+import paperbot.fetch.semantic_scholar as ss
+import paperbot.fetch.semantic_scholar_async as ss_async
+from paperbot.fetch.fetcher import RESULT_CACHE
+from paperbot.fetch.standin import VOCABULARY, StandInServer, make_corpus
+
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logging.getLogger("paperbot").setLevel(logging.WARNING)
+
+STAGES = ("fetch", "format", "send")
+
+# stage timings of the command running in the current thread or task.
+_timings: contextvars.ContextVar[dict[str, float]] = contextvars.ContextVar("timings")
+
+
+class FakeSlackApp:
+    """Stands in for `slack_bolt.App`, recording the messages posted with `client.chat_postMessage`."""
+
+    def __init__(self, send_latency: float):
+        self.send_latency = send_latency
+        self.messages: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self.client = SimpleNamespace(chat_postMessage=self._post_message)
+
+    def _post_message(self, channel: str, text: str, **kwargs: Any):
+        time.sleep(self.send_latency)
+        with self._lock:
+            self.messages.append((channel, text))
+
+
+class FakeDiscordContext:
+    """Stands in for a `discord.ext.commands.Context` of a command message."""
+
+    def __init__(self, user: str, content: str, send_latency: float, messages: list[str]):
+        self.author = SimpleNamespace(name=user)
+        self.message = SimpleNamespace(content=content)
+        self.send_latency = send_latency
+        self.messages = messages
+
+    async def send(self, text: str):
+        """Send a message to the channel."""
+        await asyncio.sleep(self.send_latency)
+        self.messages.append(text)
+
+
+def make_commands(
+    corpus: list[dict[str, Any]],
+    n_users: int,
+    n_commands: int,
+    n_titles: int,
+    seed: int,
+) -> list[list[tuple[str, str]]]:
+    """(command, arguments) sent by each user. Titles are drawn from `n_titles` papers, so repeats hit the caches."""
+    rng = random.Random(seed)
+    titles = [paper["title"] for paper in rng.sample(corpus, min(n_titles, len(corpus)))]
+
+    def make_command() -> tuple[str, str]:
+        command = rng.choice(("paperfind", "paperlike", "papercite"))
+
+        if command == "paperfind":
+            words = rng.sample(VOCABULARY, 2)
+            since = datetime.date(rng.randint(2016, 2024), rng.randint(1, 12), 1)
+            return command, f"'{words[0]} + {words[1]}' {since.isoformat()}"
+
+        return command, f"'{rng.choice(titles)}'"
+
+    return [[make_command() for _ in range(n_commands)] for _ in range(n_users)]
+
+
+def instrument(module: Any, name: str, stage: str):
+    """Replace `module.name` by a wrapper adding its duration to the `stage` timing of the current command."""
+    fn = getattr(module, name)
+
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _add_timing(stage, time.perf_counter() - start)
+
+        setattr(module, name, async_wrapper)
+        return
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _add_timing(stage, time.perf_counter() - start)
+
+    setattr(module, name, wrapper)
+
+
+def _add_timing(stage: str, seconds: float):
+    timings = _timings.get(None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def instrument_handlers():
+    """Time the stages of the command handlers by wrapping the functions they call."""
+    for name in ("fetch_papers_from_query", "fetch_similar_papers", "fetch_papers_citing"):
+        instrument(pb, name, "fetch")
+        instrument(pb, f"{name}_async", "fetch")
+
+    for name in ("format_query_papers", "format_similar_papers", "format_papers_citing"):
+        instrument(pb, name, "format")
+
+    instrument(slack_client, "_send_message", "send")
+    instrument(discord_client, "_send", "send")
+
+
+def run_slack(users: list[list[tuple[str, str]]], workers: int, send_latency: float) -> tuple[list[dict], float]:
+    """Run the commands of all users on a pool of `workers` threads, like the socket mode handler does."""
+    app = FakeSlackApp(send_latency)
+    handlers = {
+        "paperfind": slack_client.paperfind,
+        "paperlike": slack_client.paperlike,
+        "papercite": slack_client.papercite,
+    }
+
+    def run_command(user: int, command: str, arguments: str) -> dict[str, float]:
+        timings = {"start": time.perf_counter()}
+        _timings.set(timings)
+
+        body = {"user_name": f"user{user}", "channel_id": f"C{user}", "text": arguments}
+        handlers[command](app, body)
+
+        timings["total"] = time.perf_counter() - timings.pop("start")
+        return {"command": command, **timings}
+
+    def run_user(user: int) -> list[dict[str, float]]:
+        return [run_command(user, command, arguments) for command, arguments in users[user]]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load-test") as executor:
+        results = [result for user_results in executor.map(run_user, range(len(users))) for result in user_results]
+
+    return results, time.perf_counter() - start
+
+
+def run_discord(users: list[list[tuple[str, str]]], send_latency: float) -> tuple[list[dict], float]:
+    """Run the commands of all users as concurrent tasks on one event loop, like discord.py does."""
+    handlers = {
+        "paperfind": discord_client.paperfind,
+        "paperlike": discord_client.paperlike,
+        "papercite": discord_client.papercite,
+    }
+
+    async def run_command(user: int, command: str, arguments: str) -> dict[str, float]:
+        timings = {"start": time.perf_counter()}
+        _timings.set(timings)
+
+        ctx = FakeDiscordContext(f"user{user}", f"!{command} {arguments}", send_latency, [])
+        await handlers[command](ctx)
+
+        timings["total"] = time.perf_counter() - timings.pop("start")
+        return {"command": command, **timings}
+
+    async def run_user(user: int) -> list[dict[str, float]]:
+        return [await run_command(user, command, arguments) for command, arguments in users[user]]
+
+    async def run_all() -> list[list[dict[str, float]]]:
+        try:
+            return await asyncio.gather(*(run_user(user) for user in range(len(users))))
+        finally:
+            await ss_async.get_default_client().close()
+
+    start = time.perf_counter()
+    results = [result for user_results in asyncio.run(run_all()) for result in user_results]
+
+    return results, time.perf_counter() - start
+
+
+def summarize(results: list[dict[str, float]], elapsed: float) -> dict[str, Any]:
+    """Throughput and latency percentiles, in total and by stage."""
+    summary: dict[str, Any] = {
+        "commands": len(results),
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(results) / elapsed,
+    }
+
+    for stage in ("total", *STAGES):
+        summary[stage] = _percentiles([result.get(stage, 0.0) for result in results])
+
+    return summary
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return {"mean": value, "p50": value, "p95": value, "p99": value, "max": value}
+
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return {
+        "mean": statistics.fmean(values),
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "max": max(values),
+    }
+
+
+def _log_summary(summary: dict[str, Any]):
+    logger.info(
+        f"{summary['commands']} commands in {summary['elapsed_s']:.2f}s ({summary['throughput_per_s']:.1f} commands/s)"
+    )
+    logger.info(f"{'stage':<8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for stage in ("total", *STAGES):
+        row = summary[stage]
+        logger.info(f"{stage:<8} " + " ".join(f"{row[key] * 1e3:9.1f}" for key in ("mean", "p50", "p95", "p99", "max")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("client", choices=("slack", "discord"), help="Command handlers to drive")
+    parser.add_argument("--users", type=int, help="Number of concurrent synthetic users", default=16)
+    parser.add_argument("--commands", type=int, help="Number of commands sent by each user", default=4)
+    parser.add_argument("--workers", type=int, help="Number of Slack worker threads (default: one per user)")
+    parser.add_argument("--papers", type=int, help="Number of papers in the stand-in corpus", default=20_000)
+    parser.add_argument("--titles", type=int, help="Number of distinct titles of paperlike/papercite", default=50)
+    parser.add_argument("--latency", type=float, help="Seconds the stand-in waits before responding", default=0.1)
+    parser.add_argument("--page-size", type=int, help="Max number of papers in a bulk search page", default=1000)
+    parser.add_argument("--rate-limit-every", type=int, help="Stand-in responds 429 to every n-th request", default=0)
+    parser.add_argument("--rate", type=float, help="Requests per second allowed by the rate limiter", default=1000.0)
+    parser.add_argument("--send-latency", type=float, help="Seconds each sent message takes", default=0.05)
+    parser.add_argument("--message-delay", type=float, help="Override the delay between split messages")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the in-memory result cache")
+    parser.add_argument("--seed", type=int, help="Seed of the corpus and the commands", default=0)
+    parser.add_argument("--output", type=str, help="Path of the JSON summary")
+
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.papers, seed=args.seed)
+    users = make_commands(corpus, args.users, args.commands, args.titles, args.seed)
+
+    if args.no_cache:
+        RESULT_CACHE.max_entries = 0
+    if args.message_delay is not None:
+        slack_client.DELAY_BETWEEN_MESSAGES_IN_SECONDS = args.message_delay
+        discord_client.DELAY_BETWEEN_MESSAGES_IN_SECONDS = args.message_delay
+
+    instrument_handlers()
+
+    server = StandInServer(
+        corpus,
+        latency=args.latency,
+        page_size=args.page_size,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=0.1,
+    )
+
+    with server:
+        rate_limiter = ss.RateLimiter(rate=args.rate, burst=max(1, int(args.rate)))
+
+        if args.client == "slack":
+            ss.set_default_client(ss.SemanticScholarClient(base_url=server.url, rate_limiter=rate_limiter))
+            results, elapsed = run_slack(users, args.workers or args.users, args.send_latency)
+        else:
+            ss_async.set_default_client(
+                ss_async.AsyncSemanticScholarClient(base_url=server.url, rate_limiter=rate_limiter)
+            )
+            results, elapsed = run_discord(users, args.send_latency)
+
+    summary = summarize(results, elapsed)
+    summary["config"] = vars(args)
+    summary["server"] = {"requests": server.n_requests, "rate_limited": server.n_rate_limited}
+    summary["result_cache"] = RESULT_CACHE.stats()
+
+    _log_summary(summary)
+    logger.info(f"stand-in served {server.n_requests} requests ({server.n_rate_limited} rate limited)")
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=2)
@@ -0,0 +1,214 @@
+"""Micro-benchmarks of the stages a command goes through after Semantic Scholar responded.
+
+Runs every stage on synthetic corpora, writes the timings as JSON and optionally compares them to a baseline:
+
+    python scripts/benchmarks/run_benchmarks.py --sizes 10000 100000 --output outputs/benchmarks.json
+    python scripts/benchmarks/run_benchmarks.py --baseline outputs/benchmarks.json --threshold 0.2
+
+Exits with status 1 if a benchmark is slower than its baseline by more than the threshold.
+
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+
+import paperbot.clients.discord as discord_client
+import paperbot.clients.slack as slack_client
+from paperbot.argparser import parse_arguments
+from paperbot.fetch.fetcher import _extract_paper_data, _remove_duplicate_papers, _sort_papers_by_date
+from paperbot.fetch.paper import PaperBatch
+from paperbot.fetch.standin import make_corpus
+from paperbot.format.formatter import FORMATTERS, format_papers_citing, format_query_papers, format_similar_papers
+
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+COMMANDS = (
+    '\'("machine learning" | "ML") + "AMP"\' 2022-01-01',
+    "'single cell' 2023-06-01 --split --no_extra",
+    "'Attention is All You Need'",
+    "https://arxiv.org/abs/1706.03762",
+    "'(protein | peptide) + (design | generation) -review' 2024-01-01 --no_query --split",
+    "denovo_peptide_design 2024-01-01 --template",
+)
+
+SINCE = datetime.date(2015, 1, 1)
+
+Benchmark = tuple[str, int | None, Callable[[], Any]]
+
+
+def make_benchmarks(sizes: list[int]) -> list[Benchmark]:
+    """(name, corpus size, function) of all benchmarks."""
+    benchmarks: list[Benchmark] = [("parse_arguments", None, lambda: [parse_arguments(c) for c in COMMANDS])]
+
+    for size in sizes:
+        raw_papers = make_corpus(size)
+        papers = [_extract_paper_data(raw) for raw in raw_papers]
+        # every tenth paper is returned twice, like overlapping pages do.
+        papers_with_duplicates = papers + papers[::10]
+        sorted_papers = _sort_papers_by_date(papers)
+        paper = papers[0]
+
+        benchmarks += [
+            ("_extract_paper_data", size, lambda raw_papers=raw_papers: [_extract_paper_data(p) for p in raw_papers]),
+            ("PaperBatch.from_json", size, lambda raw_papers=raw_papers: PaperBatch.from_json(raw_papers)),
+            ("_remove_duplicate_papers", size, lambda papers=papers_with_duplicates: _remove_duplicate_papers(papers)),
+            ("_sort_papers_by_date", size, lambda papers=papers: _sort_papers_by_date(papers)),
+        ]
+
+        for format_type in FORMATTERS:
+            benchmarks += [
+                (
+                    f"format_query_papers[{format_type}]",
+                    size,
+                    lambda papers=sorted_papers, f=format_type: format_query_papers("q", papers, SINCE, format_type=f),
+                ),
+                (
+                    f"format_similar_papers[{format_type}]",
+                    size,
+                    lambda papers=sorted_papers, paper=paper, f=format_type: format_similar_papers(
+                        paper, papers, paper["title"], format_type=f
+                    ),
+                ),
+                (
+                    f"format_papers_citing[{format_type}]",
+                    size,
+                    lambda papers=sorted_papers, paper=paper, f=format_type: format_papers_citing(
+                        paper, papers, paper["title"], format_type=f
+                    ),
+                ),
+            ]
+
+        slack_text = format_query_papers("q", sorted_papers, SINCE, format_type="slack")
+        discord_text = format_query_papers("q", sorted_papers, SINCE, format_type="discord")
+
+        benchmarks += [
+            ("slack._split_into_blocks", size, lambda text=slack_text: slack_client._split_into_blocks(text)),
+            ("discord._split_into_blocks", size, lambda text=discord_text: discord_client._split_into_blocks(text)),
+            (
+                "discord._break_text_with_newlines",
+                size,
+                lambda text=discord_text: discord_client._break_text_with_newlines(
+                    text, discord_client.MAX_MESSAGE_LENGTH
+                ),
+            ),
+        ]
+
+    return benchmarks
+
+
+def measure(fn: Callable[[], Any], repeats: int, min_time: float) -> dict[str, Any]:
+    """Time `fn`, calling it enough times per repeat for each repeat to take at least `min_time` seconds."""
+    start = time.perf_counter()
+    fn()
+    once = time.perf_counter() - start
+
+    number = max(1, int(min_time / once)) if once > 0 else 1
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+
+    return {
+        "number": number,
+        "repeats": repeats,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """Names of the benchmarks whose median is slower than the baseline by more than `threshold`."""
+    regressions = []
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        ratio = result["median_s"] / base["median_s"]
+        status = "REGRESSION" if ratio > 1 + threshold else "ok"
+        logger.info(
+            f"{name:<55} {base['median_s'] * 1e3:10.3f}ms -> {result['median_s'] * 1e3:10.3f}ms  x{ratio:.2f}  {status}"
+        )
+
+        if ratio > 1 + threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", help="Number of papers of each corpus", default=DEFAULT_SIZES)
+    parser.add_argument("--repeats", type=int, help="Number of timed repeats of each benchmark", default=5)
+    parser.add_argument("--min-time", type=float, help="Min seconds of each timed repeat", default=0.05)
+    parser.add_argument("--filter", type=str, help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--output", type=str, help="Path of the JSON results")
+    parser.add_argument("--baseline", type=str, help="Path of JSON results to compare against")
+    parser.add_argument("--threshold", type=float, help="Max allowed slowdown relative to the baseline", default=0.2)
+
+    args = parser.parse_args()
+
+    results = {}
+    for name, size, fn in make_benchmarks(args.sizes):
+        if args.filter and (args.filter not in name):
+            continue
+
+        key = f"{name}@{size}" if size is not None else name
+        results[key] = {"size": size, **measure(fn, args.repeats, args.min_time)}
+        logger.info(f"{key:<55} {results[key]['median_s'] * 1e3:10.3f}ms")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            logger.error(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
@@ -0,0 +1,105 @@
+"""Check the cold import time of the paperbot modules against a budget, e.g., in CI.
+
+Each module is imported in fresh interpreters with `python -X importtime`, and the fastest of `--repeat` runs is
+compared to its budget. The command exits with 1 if a module is over its budget, or if it imports a module it
+must not, e.g., `import paperbot` importing aiohttp. The second check catches regressions of the lazy imports of
+`paperbot/__init__.py` on any machine, while the budgets are in milliseconds of the machine running the check.
+
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --budget paperbot.clients.slack=300 --repeat 10
+
+"""
+
+import argparse
+import logging
+import subprocess
+import sys
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# module -> (budget in milliseconds, modules it must not import).
+BUDGETS = {
+    "paperbot": (20.0, ("requests", "aiohttp", "slack_bolt", "discord", "paperbot.fetch", "paperbot.format")),
+    "paperbot.clients.slack": (250.0, ("aiohttp", "slack_bolt", "discord", "paperbot.fetch.fetcher_async")),
+    "paperbot.clients.discord": (400.0, ("slack_bolt",)),
+}
+
+
+def measure(module: str) -> tuple[float, dict[str, float]]:
+    """Cumulative milliseconds to import `module` in a fresh interpreter, and the self milliseconds by module."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    total = None
+    self_times = {}
+
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue
+
+        self_times[name.strip()] = int(self_us) / 1000
+        if name == f" {module}":
+            total = int(cumulative_us) / 1000
+
+    if total is None:
+        raise RuntimeError(f"No import time of {module} in:\n{process.stderr}")
+
+    return total, self_times
+
+
+def check(module: str, budget: float, forbidden: tuple[str, ...], repeat: int) -> bool:
+    """Whether `module` imports within `budget` milliseconds without importing `forbidden` modules."""
+    runs = [measure(module) for _ in range(repeat)]
+    total, self_times = min(runs, key=lambda run: run[0])
+
+    ok = True
+    imported = [name for name in forbidden if name in self_times]
+    if imported:
+        logging.error(f"{module} imports {', '.join(imported)}")
+        ok = False
+
+    if total > budget:
+        slowest = sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:10]
+        logging.error(
+            f"{module} imports in {total:.1f}ms, over its budget of {budget:.0f}ms. Slowest imports: "
+            + ", ".join(f"{name} ({ms:.1f}ms)" for name, ms in slowest)
+        )
+        ok = False
+    else:
+        logging.info(f"{module} imports in {total:.1f}ms (budget: {budget:.0f}ms)")
+
+    return ok
+
+
+def _parse_budget(text: str) -> tuple[str, float]:
+    module, _, budget = text.partition("=")
+    return module, float(budget)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the cold import time of the paperbot modules")
+    parser.add_argument("--repeat", type=int, help="Number of imports per module, the fastest counts", default=5)
+    parser.add_argument(
+        "--budget",
+        type=_parse_budget,
+        action="append",
+        help="Budget of a module in milliseconds, e.g., paperbot=20. Can be repeated",
+        default=[],
+    )
+
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for module, budget in args.budget:
+        budgets[module] = (budget, budgets.get(module, (budget, ()))[1])
+
+    results = [check(module, budget, forbidden, args.repeat) for module, (budget, forbidden) in budgets.items()]
+    sys.exit(0 if all(results) else 1)
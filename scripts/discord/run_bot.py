@@ -2,35 +2,88 @@ import logging
 import os
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
 import paperbot.clients.discord as client
+import paperbot.fetch.semantic_scholar_async as ss
+from paperbot import memory, metrics, watch
+from paperbot.fetch import local, precomputed
+from paperbot.fetch.cache import ResponseCache
+from paperbot.fetch.local import LocalBackend
+from paperbot.profiling import Profiler
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 
 
 load_dotenv()
 
+if os.environ.get("PAPERBOT_CACHE_PATH"):
+    ss.set_default_client(ss.AsyncSemanticScholarClient(cache=ResponseCache(os.environ["PAPERBOT_CACHE_PATH"])))
+
+if os.environ.get("PAPERBOT_LOCAL_MIRROR_PATH"):
+    local.set_default_backend(LocalBackend(os.environ["PAPERBOT_LOCAL_MIRROR_PATH"]))
+
+if os.environ.get("PAPERBOT_WATCH_PATH"):
+    watch.set_default_store(watch.WatchStore(os.environ["PAPERBOT_WATCH_PATH"]))
+
+if os.environ.get("PAPERBOT_TEMPLATE_STORE_PATH"):
+    precomputed.set_default_store(precomputed.TemplateStore(os.environ["PAPERBOT_TEMPLATE_STORE_PATH"]))
+
+memory.configure_from_env()
+
 intents = discord.Intents.default()
 intents.message_content = True
 
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+profiler = Profiler.from_env()
+
+
 @bot.command()
 async def paperfind(ctx):
-    await client.paperfind(ctx)
+    with profiler.profile("paperfind", ctx.message.content):
+        await client.paperfind(ctx)
 
 
 @bot.command()
 async def paperlike(ctx):
-    await client.paperlike(ctx)
+    with profiler.profile("paperlike", ctx.message.content):
+        await client.paperlike(ctx)
 
 
 @bot.command()
 async def papercite(ctx):
-    await client.papercite(ctx)
+    with profiler.profile("papercite", ctx.message.content):
+        await client.papercite(ctx)
+
+
+@bot.command()
+async def paperwatch(ctx):
+    """Watch a query from the channel, see `paperbot.clients.discord.paperwatch`."""
+    with profiler.profile("paperwatch", ctx.message.content):
+        await client.paperwatch(ctx)
+
+
+@tasks.loop(seconds=float(os.environ.get("PAPERBOT_WATCH_CHECK_SECONDS", 3600)))
+async def run_watches():
+    """Run the due watches."""
+    # an exception would stop the loop, so a failing run is retried on the next iteration instead.
+    try:
+        await client.run_watches(bot)
+    except Exception:
+        logging.exception("Running the due watches failed")
+
+
+@bot.event
+async def on_ready():
+    """Start running the due watches periodically once connected, if watches are enabled."""
+    if (watch.get_default_store() is not None) and not run_watches.is_running():
+        run_watches.start()
 
 
 if __name__ == "__main__":
+    if os.environ.get("PAPERBOT_METRICS_PORT"):
+        metrics.start_http_server(int(os.environ["PAPERBOT_METRICS_PORT"]))
+
     bot.run(os.environ["DISCORD_BOT_TOKEN"])
@@ -8,6 +8,7 @@ from sklearn.decomposition import PCA
 from tqdm import tqdm
 
 import paperbot as pb
+import paperbot.fetch.semantic_scholar as ss
 from paperbot.evaluate import Specter2, p_score, precision, recall
 
 logger = logging.getLogger(__name__)
@@ -16,18 +17,22 @@ logging.basicConfig(level=logging.INFO)
 
 
 def _fetch_papers(titles, max_attempts=5):
+    # the client waits for the shared rate limiter and backs off between attempts.
+    client = ss.SemanticScholarClient(max_retries=max_attempts - 1)
+
     papers = []
     for title in tqdm(titles):
-        for k in range(max_attempts):
-            try:
-                paper = pb.fetch_single_paper(title)
-                papers += [paper]
-                break
-            except requests.HTTPError as err:
-                attempt = k + 1
-                if attempt == max_attempts:
-                    error_msg = f"Failed to fetch a paper after doing {max_attempts} attempts. Consider increasing `max_attempts`."
-                    raise RuntimeError(error_msg) from err
+        try:
+            paper = pb.fetch_single_paper(title, client=client)
+            papers += [paper]
+        except requests.HTTPError as err:
+            # only rate limited requests and server errors are retried, other errors are raised at once.
+            status = err.response.status_code if err.response is not None else None
+            error_msg = (
+                f"The client gave up fetching the paper '{title}' (status: {status}). "
+                "Consider increasing `max_attempts` if it was rate limited or a server error."
+            )
+            raise RuntimeError(error_msg) from err
 
     return papers
 
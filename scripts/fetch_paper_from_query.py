@@ -4,6 +4,7 @@ import logging
 import os
 
 import paperbot
+from paperbot.profiling import Profiler
 
 logging.basicConfig(level=logging.INFO)
 
@@ -64,4 +65,5 @@ if __name__ == "__main__":
     limit = args.limit
     save_titles = args.save
 
-    fetch_papers(query, since, until, limit, save_titles)
+    with Profiler.from_env().profile("fetch_paper_from_query", vars(args)):
+        fetch_papers(query, since, until, limit, save_titles)
@@ -2,6 +2,7 @@ import argparse
 import logging
 
 import paperbot
+from paperbot.profiling import Profiler
 
 logging.basicConfig(level=logging.INFO)
 
@@ -26,4 +27,5 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    fetch_papers(args.title, args.limit)
+    with Profiler.from_env().profile("fetch_papers_citing", vars(args)):
+        fetch_papers(args.title, args.limit)
@@ -0,0 +1,73 @@
+"""Load Semantic Scholar dataset shards into a local mirror, see `paperbot.fetch.local`.
+
+    # a full release
+    python scripts/ingest_s2_datasets.py mirror.sqlite load papers shards/papers/*.jsonl.gz --release 2024-06-18
+    python scripts/ingest_s2_datasets.py mirror.sqlite load abstracts shards/abstracts/*.jsonl.gz --release 2024-06-18
+
+    # the diff to the next release
+    python scripts/ingest_s2_datasets.py mirror.sqlite diff papers --updates updates/*.jsonl.gz --release 2024-06-25
+
+    # synthetic sample shards, for offline development
+    python scripts/ingest_s2_datasets.py mirror.sqlite sample shards/ --papers 10000
+
+The shards and diffs of a release are listed by the Semantic Scholar datasets API, which requires an API key.
+
+"""
+
+import argparse
+import logging
+import time
+
+from paperbot.fetch.local import LocalBackend
+from paperbot.fetch.standin import make_corpus, write_dataset_shards
+
+logging.basicConfig(level=logging.INFO)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load Semantic Scholar dataset shards into a local mirror")
+    parser.add_argument("database", type=str, help="Path of the SQLite database of the mirror")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    load_parser = subparsers.add_parser("load", help="Load the shards of a release")
+    load_parser.add_argument("dataset", choices=("papers", "abstracts"), help="Dataset of the shards")
+    load_parser.add_argument("shards", type=str, nargs="+", help="Paths of the jsonl.gz shards")
+    load_parser.add_argument("--release", type=str, help="Id of the release")
+
+    diff_parser = subparsers.add_parser("diff", help="Apply the diff to a newer release")
+    diff_parser.add_argument("dataset", choices=("papers", "abstracts"), help="Dataset of the diff")
+    diff_parser.add_argument("--updates", type=str, nargs="*", help="Paths of the update shards", default=[])
+    diff_parser.add_argument("--deletes", type=str, nargs="*", help="Paths of the delete shards", default=[])
+    diff_parser.add_argument("--release", type=str, help="Id of the release the diff leads to")
+
+    sample_parser = subparsers.add_parser("sample", help="Write synthetic sample shards and load them")
+    sample_parser.add_argument("directory", type=str, help="Directory of the sample shards")
+    sample_parser.add_argument("--papers", type=int, help="Number of papers", default=10_000)
+    sample_parser.add_argument("--shards", type=int, help="Number of shards per dataset", default=4)
+    sample_parser.add_argument("--seed", type=int, help="Seed of the corpus", default=0)
+
+    args = parser.parse_args()
+
+    backend = LocalBackend(args.database)
+    start = time.perf_counter()
+
+    if args.command == "load":
+        n_records = backend.load(args.shards, args.dataset, release_id=args.release)
+        logging.info(f"Loaded {n_records} {args.dataset} records in {time.perf_counter() - start:.1f}s")
+
+    elif args.command == "diff":
+        previous_release = backend.release(args.dataset)
+        n_updated, n_deleted = backend.apply_diff(args.updates, args.deletes, args.dataset, release_id=args.release)
+        logging.info(
+            f"Updated {n_updated} and deleted {n_deleted} {args.dataset} records "
+            f"({previous_release} -> {args.release}) in {time.perf_counter() - start:.1f}s"
+        )
+
+    else:
+        paths = write_dataset_shards(make_corpus(args.papers, seed=args.seed), args.directory, args.shards)
+        for dataset, dataset_paths in paths.items():
+            n_records = backend.load(dataset_paths, dataset, release_id="sample")
+            logging.info(f"Loaded {n_records} sample {dataset} records")
+
+    logging.info(f"The mirror holds {backend.count()} papers")
+    backend.close()
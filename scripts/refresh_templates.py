@@ -0,0 +1,63 @@
+"""Precompute the results of the template queries, see `paperbot.fetch.precomputed`.
+
+    # once, e.g., from cron
+    python scripts/refresh_templates.py precomputed/templates.sqlite
+
+    # every hour
+    python scripts/refresh_templates.py precomputed/templates.sqlite --every 3600
+
+Bots serve `--template` commands from the store when `PAPERBOT_TEMPLATE_STORE_PATH` points to the same file.
+
+"""
+
+import argparse
+import datetime
+import logging
+import time
+
+from dotenv import load_dotenv
+
+import paperbot
+from paperbot.fetch.precomputed import DEFAULT_LIMIT, DEFAULT_WORKERS, TemplateStore, refresh_templates
+
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+
+def refresh(store: TemplateStore, queries_dir: str, since: datetime.date, limit: int, workers: int):
+    """Refresh every template of `queries_dir`."""
+    templates = paperbot.get_template_registry(queries_dir).queries()
+
+    start = time.perf_counter()
+    outcomes = refresh_templates(store, templates, since, limit=limit, workers=workers)
+    n_failed = sum(isinstance(outcome, Exception) for outcome in outcomes.values())
+
+    logging.info(
+        f"Refreshed {len(outcomes) - n_failed}/{len(outcomes)} templates in {time.perf_counter() - start:.1f}s: "
+        + ", ".join(
+            f"{name} ({outcome if isinstance(outcome, int) else 'failed'})" for name, outcome in outcomes.items()
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the results of the template queries")
+    parser.add_argument("database", type=str, help="Path of the SQLite database of the results")
+    parser.add_argument("--queries", type=str, help="Directory of the template queries", default="queries/")
+    parser.add_argument("--since", type=str, help="Oldest publication date commands can ask for", default="2015-01-01")
+    parser.add_argument("--limit", type=int, help="Max number of papers per template", default=DEFAULT_LIMIT)
+    parser.add_argument("--workers", type=int, help="Max number of templates fetched at once", default=DEFAULT_WORKERS)
+    parser.add_argument("--every", type=float, help="Seconds between refreshes. Refreshes once if not set")
+
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    store = TemplateStore(args.database)
+    since = datetime.date.fromisoformat(args.since)
+
+    while True:
+        refresh(store, args.queries, since, args.limit, args.workers)
+
+        if args.every is None:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,37 @@
+import argparse
+import logging
+
+from paperbot.fetch.standin import StandInServer, make_corpus
+
+logging.basicConfig(level=logging.INFO)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a synthetic corpus through a local stand-in of Semantic Scholar"
+    )
+    parser.add_argument("--port", type=int, help="Port to serve on", default=8765)
+    parser.add_argument("--papers", type=int, help="Number of papers in the corpus", default=10_000)
+    parser.add_argument("--seed", type=int, help="Seed of the corpus", default=0)
+    parser.add_argument("--latency", type=float, help="Seconds to wait before each response", default=0.0)
+    parser.add_argument("--page-size", type=int, help="Max number of papers in a bulk search page", default=1000)
+    parser.add_argument("--rate-limit-every", type=int, help="Respond 429 to every n-th request", default=0)
+    parser.add_argument("--retry-after", type=float, help="Seconds to ask clients to wait after a 429", default=1.0)
+
+    args = parser.parse_args()
+
+    server = StandInServer(
+        make_corpus(args.papers, seed=args.seed),
+        port=args.port,
+        latency=args.latency,
+        page_size=args.page_size,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+    )
+
+    logging.info(f"Serving {args.papers} papers on {server.url}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,3 +1,4 @@
+import functools
 import logging
 import os
 
@@ -5,8 +6,6 @@ from dotenv import load_dotenv
 from slack_bolt import App
 from slack_bolt.adapter.aws_lambda import SlackRequestHandler
 
-import paperbot.clients.slack as client
-
 SUPPORT_SPLIT_FLAG = False
 
 load_dotenv()
@@ -18,35 +17,55 @@ def respond_to_slack_within_3_seconds(ack):
     ack("processing...")
 
 
+@functools.cache
+def _load_client():
+    # imported on the first command rather than at cold start, since the ack only needs slack_bolt, see
+    # `scripts/check_import_time.py`.
+    import paperbot.clients.slack as client
+    import paperbot.fetch.semantic_scholar as ss
+    from paperbot import memory, watch
+    from paperbot.fetch import precomputed
+    from paperbot.fetch.cache import ResponseCache
+    from paperbot.profiling import Profiler
+
+    # the Lambda is memory capped, so bulk search pages are decoded incrementally.
+    cache = ResponseCache(os.environ["PAPERBOT_CACHE_PATH"]) if os.environ.get("PAPERBOT_CACHE_PATH") else None
+    ss.set_default_client(ss.SemanticScholarClient(cache=cache, incremental=True))
+
+    if os.environ.get("PAPERBOT_TEMPLATE_STORE_PATH"):
+        precomputed.set_default_store(precomputed.TemplateStore(os.environ["PAPERBOT_TEMPLATE_STORE_PATH"]))
+
+    # must outlive the function's instances, e.g., on a mounted EFS volume.
+    if os.environ.get("PAPERBOT_WATCH_PATH"):
+        watch.set_default_store(watch.WatchStore(os.environ["PAPERBOT_WATCH_PATH"]))
+
+    memory.configure_from_env()
+
+    # e.g., PAPERBOT_PROFILE_DIR=/tmp/profiles, the only writable directory of a Lambda.
+    return client, Profiler.from_env()
+
+
+def _profiled(command, body, **kwargs):
+    client, profiler = _load_client()
+    with profiler.profile(command, body["text"]):
+        getattr(client, command)(app, body, **kwargs)
+
+
 app.command("/paperfind")(
     ack=respond_to_slack_within_3_seconds,
-    lazy=[
-        lambda body: client.paperfind(
-            app,
-            body,
-            support_split_flag=SUPPORT_SPLIT_FLAG,
-        )
-    ],
+    lazy=[lambda body: _profiled("paperfind", body, support_split_flag=SUPPORT_SPLIT_FLAG)],
 )
 app.command("/paperlike")(
     ack=respond_to_slack_within_3_seconds,
-    lazy=[
-        lambda body: client.paperlike(
-            app,
-            body,
-            support_split_flag=SUPPORT_SPLIT_FLAG,
-        )
-    ],
+    lazy=[lambda body: _profiled("paperlike", body, support_split_flag=SUPPORT_SPLIT_FLAG)],
 )
 app.command("/papercite")(
     ack=respond_to_slack_within_3_seconds,
-    lazy=[
-        lambda body: client.papercite(
-            app,
-            body,
-            support_split_flag=SUPPORT_SPLIT_FLAG,
-        )
-    ],
+    lazy=[lambda body: _profiled("papercite", body, support_split_flag=SUPPORT_SPLIT_FLAG)],
+)
+app.command("/paperwatch")(
+    ack=respond_to_slack_within_3_seconds,
+    lazy=[lambda body: _profiled("paperwatch", body)],
 )
 
 SlackRequestHandler.clear_all_log_handlers()
@@ -54,5 +73,11 @@ logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s
 
 
 def handler(event, context):
+    # a scheduled EventBridge rule, e.g., rate(1 hour), runs the due watches instead of a command.
+    if event.get("source") == "aws.events":
+        client, _ = _load_client()
+        client.run_watches(app)
+        return {"statusCode": 200}
+
     request_handler = SlackRequestHandler(app=app)
     return request_handler.handle(event, context)
@@ -1,35 +1,81 @@
 import logging
 import os
+import threading
+import time
 
 from dotenv import load_dotenv
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 
 import paperbot.clients.slack as client
+import paperbot.fetch.semantic_scholar as ss
+from paperbot import memory, metrics, watch
+from paperbot.fetch import local, precomputed
+from paperbot.fetch.cache import ResponseCache
+from paperbot.fetch.local import LocalBackend
+from paperbot.profiling import Profiler
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 
 load_dotenv()
 
+if os.environ.get("PAPERBOT_CACHE_PATH"):
+    ss.set_default_client(ss.SemanticScholarClient(cache=ResponseCache(os.environ["PAPERBOT_CACHE_PATH"])))
+
+if os.environ.get("PAPERBOT_LOCAL_MIRROR_PATH"):
+    local.set_default_backend(LocalBackend(os.environ["PAPERBOT_LOCAL_MIRROR_PATH"]))
+
+if os.environ.get("PAPERBOT_WATCH_PATH"):
+    watch.set_default_store(watch.WatchStore(os.environ["PAPERBOT_WATCH_PATH"]))
+
+if os.environ.get("PAPERBOT_TEMPLATE_STORE_PATH"):
+    precomputed.set_default_store(precomputed.TemplateStore(os.environ["PAPERBOT_TEMPLATE_STORE_PATH"]))
+
+memory.configure_from_env()
+
 app = App(token=os.environ["SLACK_BOT_TOKEN"])
 
+profiler = Profiler.from_env()
+
 
 @app.command("/paperfind")
 def paperfind(ack, body):
     ack()
-    client.paperfind(app, body)
+    with profiler.profile("paperfind", body["text"]):
+        client.paperfind(app, body)
 
 
 @app.command("/paperlike")
 def paperlike(ack, body):
     ack()
-    client.paperlike(app, body)
+    with profiler.profile("paperlike", body["text"]):
+        client.paperlike(app, body)
 
 
 @app.command("/papercite")
 def papercite(ack, body):
     ack()
-    client.papercite(app, body)
+    with profiler.profile("papercite", body["text"]):
+        client.papercite(app, body)
+
+
+@app.command("/paperwatch")
+def paperwatch(ack, body):
+    """Watch a query from the channel, see `paperbot.clients.slack.paperwatch`."""
+    ack()
+    with profiler.profile("paperwatch", body["text"]):
+        client.paperwatch(app, body)
+
+
+def run_watches_periodically(interval: float):
+    """Run the due watches every `interval` seconds, forever."""
+    while True:
+        # a failing run, e.g., of the store, is retried on the next tick rather than ending the thread.
+        try:
+            client.run_watches(app)
+        except Exception:
+            logging.exception("Running the due watches failed")
+        time.sleep(interval)
 
 
 # silence the 'unhandled message' logging warnings
@@ -39,4 +85,11 @@ def handle_message_events(body):
 
 
 if __name__ == "__main__":
+    if os.environ.get("PAPERBOT_METRICS_PORT"):
+        metrics.start_http_server(int(os.environ["PAPERBOT_METRICS_PORT"]))
+
+    if watch.get_default_store() is not None:
+        interval = float(os.environ.get("PAPERBOT_WATCH_CHECK_SECONDS", 3600))
+        threading.Thread(target=run_watches_periodically, args=(interval,), daemon=True).start()
+
     SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start()
@@ -1,22 +1,84 @@
-from paperbot.argparser import ArgumentParserException, parse_arguments
-from paperbot.fetch.fetcher import (
-    fetch_papers_citing,
-    fetch_papers_from_query,
-    fetch_similar_papers,
-    fetch_single_paper,
-)
-from paperbot.format.formatter import format_papers_citing, format_query_papers, format_similar_papers
-from paperbot.utils import read_queries_from_dir
+"""Retrieve scientific papers from Semantic Scholar for chat clients.
+
+The public names below are imported lazily, on first access, so that a process only pays for the modules it uses,
+e.g., the Slack bot doesn't import the async fetcher and aiohttp. See `scripts/check_import_time.py`.
+
+"""
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from paperbot.argparser import ArgumentParserException, parse_arguments
+    from paperbot.fetch.fetcher import (
+        fetch_papers_citing,
+        fetch_papers_from_query,
+        fetch_similar_papers,
+        fetch_single_paper,
+    )
+    from paperbot.fetch.fetcher_async import fetch_papers_citing as fetch_papers_citing_async
+    from paperbot.fetch.fetcher_async import fetch_papers_from_query as fetch_papers_from_query_async
+    from paperbot.fetch.fetcher_async import fetch_similar_papers as fetch_similar_papers_async
+    from paperbot.fetch.fetcher_async import fetch_single_paper as fetch_single_paper_async
+    from paperbot.fetch.paper import Paper, PaperBatch
+    from paperbot.format.formatter import format_papers_citing, format_query_papers, format_similar_papers
+    from paperbot.utils import TemplateRegistry, get_template_registry, read_queries_from_dir
+
+# public name -> (module, name in the module).
+_LAZY_ATTRIBUTES = {
+    "fetch_papers_citing": ("paperbot.fetch.fetcher", "fetch_papers_citing"),
+    "fetch_papers_citing_async": ("paperbot.fetch.fetcher_async", "fetch_papers_citing"),
+    "fetch_papers_from_query": ("paperbot.fetch.fetcher", "fetch_papers_from_query"),
+    "fetch_papers_from_query_async": ("paperbot.fetch.fetcher_async", "fetch_papers_from_query"),
+    "fetch_similar_papers": ("paperbot.fetch.fetcher", "fetch_similar_papers"),
+    "fetch_similar_papers_async": ("paperbot.fetch.fetcher_async", "fetch_similar_papers"),
+    "fetch_single_paper": ("paperbot.fetch.fetcher", "fetch_single_paper"),
+    "fetch_single_paper_async": ("paperbot.fetch.fetcher_async", "fetch_single_paper"),
+    "format_papers_citing": ("paperbot.format.formatter", "format_papers_citing"),
+    "format_query_papers": ("paperbot.format.formatter", "format_query_papers"),
+    "format_similar_papers": ("paperbot.format.formatter", "format_similar_papers"),
+    "Paper": ("paperbot.fetch.paper", "Paper"),
+    "PaperBatch": ("paperbot.fetch.paper", "PaperBatch"),
+    "ArgumentParserException": ("paperbot.argparser", "ArgumentParserException"),
+    "parse_arguments": ("paperbot.argparser", "parse_arguments"),
+    "read_queries_from_dir": ("paperbot.utils", "read_queries_from_dir"),
+    "get_template_registry": ("paperbot.utils", "get_template_registry"),
+    "TemplateRegistry": ("paperbot.utils", "TemplateRegistry"),
+}
 
 __all__ = [
     "fetch_papers_citing",
+    "fetch_papers_citing_async",
     "fetch_papers_from_query",
+    "fetch_papers_from_query_async",
     "fetch_similar_papers",
+    "fetch_similar_papers_async",
     "fetch_single_paper",
+    "fetch_single_paper_async",
     "format_papers_citing",
     "format_query_papers",
     "format_similar_papers",
+    "Paper",
+    "PaperBatch",
     "ArgumentParserException",
     "parse_arguments",
     "read_queries_from_dir",
+    "get_template_registry",
+    "TemplateRegistry",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name, attribute = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    value = getattr(importlib.import_module(module_name), attribute)
+    # later accesses find the name without calling `__getattr__`.
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_ATTRIBUTES])
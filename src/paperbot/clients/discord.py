@@ -3,10 +3,11 @@ import datetime
 import logging
 import os
 
-import requests
+import aiohttp
 
 import paperbot as pb
-from paperbot import ArgumentParserException
+from paperbot import ArgumentParserException, memory, metrics, watch
+from paperbot.fetch import precomputed
 
 logger = logging.getLogger(__name__)
 
@@ -18,20 +19,28 @@ PAPERFIND_HELP_INFO = """
 
 PAPERLIKE_HELP_INFO = """
 **Usage**
-- Use `!paperlike <title>` to fetch similar papers.
+- Use `!paperlike <title or DOI/arXiv link>` to fetch similar papers.
 - Example: `!paperlike 'Attention is All You Need'`
 """
 
 PAPERCITE_HELP_INFO = """
 **Usage**
-- Use `!papercite <title>` to fetch papers citing this paper.
+- Use `!papercite <title or DOI/arXiv link>` to fetch papers citing this paper.
 - Example: `!papercite 'Could a Neuroscientist Understand a Microprocessor?'`
 """
 
+PAPERWATCH_HELP_INFO = """
+**Usage**
+- Use `!paperwatch <query> <since>` to post papers published after `<since>`, then new papers every week.
+- Use `!paperwatch --list` to list the watches of this channel, and `!paperwatch --remove=<id>` to stop one.
+- Example: `!paperwatch amp 2022-01-01 --template`
+"""
+
 DELAY_BETWEEN_MESSAGES_IN_SECONDS = 0.1  # Discord API rate limit
 MAX_MESSAGE_LENGTH = 2_000  # Discord max message length
 
 
+@metrics.timed_command("discord", "paperfind")
 async def paperfind(
     ctx,
     *,
@@ -45,10 +54,13 @@ async def paperfind(
 
     raw_arguments = _get_raw_arguments(ctx)
     logger.info(f"{user} - '!paperfind {raw_arguments}'")
+    metrics.annotate(arguments=raw_arguments)
 
     try:
-        args, opt_args = pb.parse_arguments(raw_arguments)
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(raw_arguments)
     except ArgumentParserException:
+        metrics.annotate(outcome="usage")
         await _send(ctx, PAPERFIND_HELP_INFO)
         return
 
@@ -64,18 +76,20 @@ async def paperfind(
     show_query = support_split_flag and "no_query" not in opt_args
 
     if is_template:
-        template_queries = pb.read_queries_from_dir(template_queries_path)
+        with metrics.stage("template"):
+            template = pb.get_template_registry(template_queries_path).get(query_or_template)
 
-        if query_or_template not in template_queries:
+        if template is None:
             path = os.path.join(template_queries_path, f"{query_or_template}.txt")
             path = path.replace("\n", "\\n")
             await _send(ctx, f"Template query `{path}` not found.")
             return
 
-        query = template_queries[query_or_template]
+        query = template.query
+        query_as_written = template.text
         limit = template_query_paper_limit
     else:
-        query = query_or_template
+        query = query_as_written = query_or_template
         limit = query_paper_limit
 
     try:
@@ -84,29 +98,51 @@ async def paperfind(
         await _send(ctx, "Invalid date format. Please use YYYY-MM-DD.")
         return
 
+    papers = None
+    if is_template:
+        with metrics.stage("precomputed"):
+            # the store reads SQLite and decodes the stored papers, so it runs in a thread like the local mirror.
+            papers = await asyncio.to_thread(precomputed.lookup, query_or_template, query, since, limit)
+        metrics.annotate(precomputed=papers is not None)
+
+    if papers is None:
+        try:
+            with metrics.stage("fetch"):
+                papers = await _fetch_papers_within_budget(query, since, limit)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            metrics.annotate(outcome="fetch_failed")
+            await _send(ctx, "Request to Semantic Scholar failed. Please try again later.")
+            return
+        except memory.MemoryBudgetExceeded:
+            metrics.annotate(outcome="over_budget")
+            await _send(ctx, "Too many papers match the query. Please narrow it down or use a later date.")
+            return
+
+    query_to_show = query_as_written if show_query else None
     try:
-        papers = pb.fetch_papers_from_query(query, since=since, limit=limit)
-    except requests.exceptions.RequestException:
-        await _send(ctx, "Request to Semantic Scholar failed. Please try again later.")
+        text_content, _ = _format_papers_within_budget(query_to_show, papers, since, add_preamble, split_message)
+    except memory.MemoryBudgetExceeded:
+        metrics.annotate(outcome="over_budget")
+        await _send(ctx, "Too many papers match the query. Please narrow it down or use a later date.")
         return
 
-    query_to_show = query if show_query else None
-    text = pb.format_query_papers(query_to_show, papers, since, add_preamble, "discord")
-
-    text_content = _split_into_blocks(text) if split_message else text
-    await _send(ctx, text_content)  # type: ignore
+    await _send(ctx, text_content)
 
 
+@metrics.timed_command("discord", "paperlike")
 async def paperlike(ctx, *, paper_limit: int = 50):
     """Fetch similar papers and send them to the channel."""
     user = ctx.author.name
 
     raw_arguments = _get_raw_arguments(ctx)
     logger.info(f"{user} - '!paperlike {raw_arguments}'")
+    metrics.annotate(arguments=raw_arguments)
 
     try:
-        args, opt_args = pb.parse_arguments(raw_arguments)
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(raw_arguments)
     except ArgumentParserException:
+        metrics.annotate(outcome="usage")
         await _send(ctx, PAPERLIKE_HELP_INFO)
         return
 
@@ -119,26 +155,34 @@ async def paperlike(ctx, *, paper_limit: int = 50):
     split_message = "split" in opt_args
 
     try:
-        paper, similar_papers = pb.fetch_similar_papers(title, limit=paper_limit)
-    except requests.exceptions.RequestException:
+        with metrics.stage("fetch"):
+            paper, similar_papers = await pb.fetch_similar_papers_async(title, limit=paper_limit)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        metrics.annotate(outcome="fetch_failed")
         await _send(ctx, "Request to Semantic Scholar failed. Please try again later.")
         return
 
-    text = pb.format_similar_papers(paper, similar_papers, title, add_preamble, "discord")
-    text_content = _split_into_blocks(text) if split_message else text
+    with metrics.stage("format"):
+        text = pb.format_similar_papers(paper, similar_papers, title, add_preamble, "discord")
+    with metrics.stage("chunk"):
+        text_content = _split_into_blocks(text) if split_message else text
     await _send(ctx, text_content)  # type: ignore
 
 
+@metrics.timed_command("discord", "papercite")
 async def papercite(ctx, *, paper_limit: int = 50):
     """Fetch similar papers and send them to the channel."""
     user = ctx.author.name
 
     raw_arguments = _get_raw_arguments(ctx)
     logger.info(f"{user} - '!papercite {raw_arguments}'")
+    metrics.annotate(arguments=raw_arguments)
 
     try:
-        args, opt_args = pb.parse_arguments(raw_arguments)
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(raw_arguments)
     except ArgumentParserException:
+        metrics.annotate(outcome="usage")
         await _send(ctx, PAPERCITE_HELP_INFO)
         return
 
@@ -151,26 +195,209 @@ async def papercite(ctx, *, paper_limit: int = 50):
     split_message = "split" in opt_args
 
     try:
-        paper, similar_papers = pb.fetch_papers_citing(title, limit=paper_limit)
-    except requests.exceptions.RequestException:
+        with metrics.stage("fetch"):
+            paper, similar_papers = await pb.fetch_papers_citing_async(title, limit=paper_limit)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        metrics.annotate(outcome="fetch_failed")
         await _send(ctx, "Request to Semantic Scholar failed. Please try again later.")
         return
 
-    text = pb.format_papers_citing(paper, similar_papers, title, add_preamble, "discord")
-    text_content = _split_into_blocks(text) if split_message else text
+    with metrics.stage("format"):
+        text = pb.format_papers_citing(paper, similar_papers, title, add_preamble, "discord")
+    with metrics.stage("chunk"):
+        text_content = _split_into_blocks(text) if split_message else text
     await _send(ctx, text_content)  # type: ignore
 
 
+@metrics.timed_command("discord", "paperwatch")
+async def paperwatch(ctx, *, store: watch.WatchStore = None, template_queries_path: str = "queries"):
+    """Watch a query, sending its papers to the channel now and its new papers every week."""
+    user = ctx.author.name
+    channel_id = str(ctx.channel.id)
+
+    raw_arguments = _get_raw_arguments(ctx)
+    logger.info(f"{user} - '!paperwatch {raw_arguments}'")
+    metrics.annotate(arguments=raw_arguments)
+
+    store = store or watch.get_default_store()
+    if store is None:
+        await _send(ctx, "Watches are not enabled for this bot.")
+        return
+
+    try:
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(raw_arguments)
+    except ArgumentParserException:
+        metrics.annotate(outcome="usage")
+        await _send(ctx, PAPERWATCH_HELP_INFO)
+        return
+
+    # the store queries SQLite, so its calls run in a thread like the local mirror's.
+    if "list" in opt_args:
+        subscriptions = await asyncio.to_thread(store.subscriptions, "discord", channel_id)
+        lines = [f"`{s.id}` {s.name} (since {s.high_water.isoformat()})" for s in subscriptions]
+        await _send(ctx, "\n".join(lines) if lines else "This channel watches no queries.")
+        return
+
+    if "remove" in opt_args:
+        subscription_id = str(opt_args["remove"])
+        removed = subscription_id.isdigit() and await asyncio.to_thread(
+            store.remove, "discord", channel_id, int(subscription_id)
+        )
+        if removed:
+            await _send(ctx, f"Stopped watch `{subscription_id}`.")
+        else:
+            await _send(ctx, f"This channel has no watch `{subscription_id}`.")
+        return
+
+    if len(args) != 2:
+        await _send(ctx, PAPERWATCH_HELP_INFO)
+        return
+
+    query_or_template = args[0]
+    date_since = args[1]
+
+    if "template" in opt_args:
+        with metrics.stage("template"):
+            template = pb.get_template_registry(template_queries_path).get(query_or_template)
+
+        if template is None:
+            path = os.path.join(template_queries_path, f"{query_or_template}.txt")
+            path = path.replace("\n", "\\n")
+            await _send(ctx, f"Template query `{path}` not found.")
+            return
+
+        query = template.query
+    else:
+        query = query_or_template
+
+    try:
+        since = datetime.date.fromisoformat(date_since)
+    except ValueError:
+        await _send(ctx, "Invalid date format. Please use YYYY-MM-DD.")
+        return
+
+    subscription = await asyncio.to_thread(store.add, "discord", channel_id, query, since, name=query_or_template)
+    await _send(ctx, f"Watching `{subscription.name}` as `{subscription.id}`. New papers are posted weekly.")
+    await _run_watch(ctx.channel, store, subscription)
+
+
+async def run_watches(bot, store: watch.WatchStore = None, *, paper_limit: int = 500):
+    """Run the due watch subscriptions of Discord channels, sending their new papers."""
+    store = store or watch.get_default_store()
+    if store is None:
+        return
+
+    for subscription in await asyncio.to_thread(store.due, "discord"):
+        channel = bot.get_channel(int(subscription.channel))
+        if channel is None:
+            logger.warning(f"Watch {subscription.id} has no channel {subscription.channel}")
+            continue
+
+        with metrics.command("discord", "paperwatch_run", subscription.name):
+            try:
+                await _run_watch(channel, store, subscription, paper_limit=paper_limit)
+            except Exception:
+                metrics.annotate(outcome="error")
+                logger.exception(f"Watch {subscription.id} failed")
+
+
+async def _run_watch(channel, store: watch.WatchStore, subscription: watch.Subscription, *, paper_limit: int = 500):
+    since = subscription.fetch_since(store.lookback_days)
+
+    try:
+        with metrics.stage("fetch"):
+            papers = await _fetch_papers_within_budget(subscription.query, since, paper_limit)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        metrics.annotate(outcome="fetch_failed")
+        logger.warning(f"Watch {subscription.id} failed to fetch, retrying on the next run")
+        return
+    except memory.MemoryBudgetExceeded:
+        metrics.annotate(outcome="over_budget")
+        await _send(channel, "Too many papers match the watched query. Please narrow it down.")
+        return
+
+    new_papers = await asyncio.to_thread(store.unseen, subscription, papers)
+    metrics.annotate(new_papers=len(new_papers))
+
+    # a paper is marked as posted after it is sent, so a failed send posts it again on the next run. To stay within
+    # the memory budget, the oldest papers are posted first, and the next run posts the others.
+    if new_papers:
+        try:
+            text, new_papers = _format_papers_within_budget(subscription.name, new_papers, since, keep_newest=False)
+        except memory.MemoryBudgetExceeded:
+            metrics.annotate(outcome="over_budget")
+            await _send(channel, "Too many papers match the watched query. Please narrow it down.")
+            return
+
+        await _send(channel, text)
+
+    await asyncio.to_thread(store.mark_posted, subscription, new_papers)
+
+
+async def _fetch_papers_within_budget(query: str, since: datetime.date, limit: int) -> list[pb.Paper]:
+    # fetching again with a lower limit frees the papers of the first attempt, see `paperbot.memory`.
+    try:
+        return await pb.fetch_papers_from_query_async(query, since=since, limit=limit)
+    except memory.MemoryBudgetExceeded as err:
+        logger.warning(f"{err}, fetching again with a lower limit")
+
+    degraded_limit = memory.degrade_limit(limit)
+    metrics.annotate(degraded_limit=degraded_limit)
+    return await pb.fetch_papers_from_query_async(query, since=since, limit=degraded_limit)
+
+
+def _format_papers_within_budget(
+    query: str | None,
+    papers: list[pb.Paper],
+    since: datetime.date,
+    add_preamble: bool = True,
+    split_message: bool = False,
+    *,
+    keep_newest: bool = True,
+) -> tuple[str | list[str], list[pb.Paper]]:
+    # formatting fewer papers frees the text of the first attempt, see `paperbot.memory`. Returns the papers formatted.
+    try:
+        return _format_papers(query, papers, since, add_preamble, split_message), papers
+    except memory.MemoryBudgetExceeded as err:
+        logger.warning(f"{err}, formatting fewer papers")
+
+    degraded_limit = memory.degrade_limit(len(papers))
+    metrics.annotate(degraded_limit=degraded_limit)
+
+    # papers are sorted oldest first.
+    papers = papers[-degraded_limit:] if keep_newest else papers[:degraded_limit]
+    return _format_papers(query, papers, since, add_preamble, split_message), papers
+
+
+def _format_papers(
+    query: str | None, papers: list[pb.Paper], since: datetime.date, add_preamble: bool, split_message: bool
+) -> str | list[str]:
+    with metrics.stage("format"):
+        text = pb.format_query_papers(query, papers, since, add_preamble, "discord")
+        memory.check_budget()
+
+    if not split_message:
+        return text
+
+    with metrics.stage("chunk"):
+        blocks = _split_into_blocks(text)
+        memory.check_budget()
+    return blocks
+
+
 async def _send(ctx, text: str | list[str]):
     messages = [text] if isinstance(text, str) else text
 
     for message in messages:
-        sendable_messages = _break_text_with_newlines(message, max_length=MAX_MESSAGE_LENGTH)
-        sendable_messages = list(filter(lambda s: s.strip() != "", sendable_messages))
+        with metrics.stage("chunk"):
+            sendable_messages = _break_text_with_newlines(message, max_length=MAX_MESSAGE_LENGTH)
+            sendable_messages = list(filter(lambda s: s.strip() != "", sendable_messages))
 
         for sendable_message in sendable_messages:
             await asyncio.sleep(DELAY_BETWEEN_MESSAGES_IN_SECONDS)
-            await ctx.send(sendable_message)
+            with metrics.stage("send"):
+                await ctx.send(sendable_message)
 
 
 def _get_raw_arguments(ctx) -> str:
@@ -2,13 +2,16 @@ import datetime
 import logging
 import os
 import time
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import requests
-from slack_bolt.app import App
 
 import paperbot as pb
-from paperbot import ArgumentParserException
+from paperbot import ArgumentParserException, memory, metrics, watch
+from paperbot.fetch import precomputed
+
+if TYPE_CHECKING:
+    from slack_bolt.app import App
 
 logger = logging.getLogger(__name__)
 
@@ -20,22 +23,30 @@ PAPERFIND_HELP_INFO = """
 
 PAPERLIKE_HELP_INFO = """
 *Usage*
-- Use `/paperlike <title>` to fetch similar papers.
+- Use `/paperlike <title or DOI/arXiv link>` to fetch similar papers.
 - Example: `/paperlike 'Attention is All You Need'`
 """
 
 
 PAPERCITE_HELP_INFO = """
 *Usage*
-- Use `/papercite <title>` to fetch papers citing this paper.
+- Use `/papercite <title or DOI/arXiv link>` to fetch papers citing this paper.
 - Example: `/papercite 'Could a Neuroscientist Understand a Microprocessor?'`
 """
 
+PAPERWATCH_HELP_INFO = """
+*Usage*
+- Use `/paperwatch <query> <since>` to post papers published after `<since>`, then new papers every week.
+- Use `/paperwatch --list` to list the watches of this channel, and `/paperwatch --remove=<id>` to stop one.
+- Example: `/paperwatch amp 2022-01-01 --template`
+"""
+
 DELAY_BETWEEN_MESSAGES_IN_SECONDS = 1  # Slack API rate limit
 
 
+@metrics.timed_command("slack", "paperfind")
 def paperfind(
-    app: App,
+    app: "App",
     body: dict[str, Any],
     *,
     query_paper_limit: int = 100,
@@ -48,10 +59,13 @@ def paperfind(
     text = body["text"]
 
     logger.info(f"{user} - '/paperfind {text}'")
+    metrics.annotate(arguments=text)
 
     try:
-        args, opt_args = pb.parse_arguments(text)
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(text)
     except ArgumentParserException:
+        metrics.annotate(outcome="usage")
         _send_message(app, channel_id, PAPERFIND_HELP_INFO)
         return
 
@@ -68,18 +82,20 @@ def paperfind(
     split_message = support_split_flag and "split" in opt_args
 
     if is_template:
-        template_queries = pb.read_queries_from_dir(template_queries_path)
+        with metrics.stage("template"):
+            template = pb.get_template_registry(template_queries_path).get(query_or_template)
 
-        if query_or_template not in template_queries:
+        if template is None:
             path = os.path.join(template_queries_path, f"{query_or_template}.txt")
             path = path.replace("\n", "\\n")
             _send_message(app, channel_id, f"Template query `{path}` not found.")
             return
 
-        query = template_queries[query_or_template]
+        query = template.query
+        query_as_written = template.text
         limit = template_query_paper_limit
     else:
-        query = query_or_template
+        query = query_as_written = query_or_template
         limit = query_paper_limit
 
     try:
@@ -88,29 +104,52 @@ def paperfind(
         _send_message(app, channel_id, "Invalid date format. Please use `YYYY-MM-DD`.")
         return
 
+    papers = None
+    if is_template:
+        with metrics.stage("precomputed"):
+            papers = precomputed.lookup(query_or_template, query, since, limit)
+        metrics.annotate(precomputed=papers is not None)
+
+    if papers is None:
+        try:
+            with metrics.stage("fetch"):
+                papers = _fetch_papers_within_budget(query, since, limit)
+        except requests.exceptions.RequestException:
+            metrics.annotate(outcome="fetch_failed")
+            _send_message(app, channel_id, "Request to Semantic Scholar failed. Please try again later.")
+            return
+        except memory.MemoryBudgetExceeded:
+            metrics.annotate(outcome="over_budget")
+            _send_message(
+                app, channel_id, "Too many papers match the query. Please narrow it down or use a later date."
+            )
+            return
+
+    query_to_show = query_as_written if show_query else None
     try:
-        papers = pb.fetch_papers_from_query(query, since=since, limit=limit)
-    except requests.exceptions.RequestException:
-        _send_message(app, channel_id, "Request to Semantic Scholar failed. Please try again later.")
+        text_content, _ = _format_papers_within_budget(query_to_show, papers, since, add_preamble, split_message)
+    except memory.MemoryBudgetExceeded:
+        metrics.annotate(outcome="over_budget")
+        _send_message(app, channel_id, "Too many papers match the query. Please narrow it down or use a later date.")
         return
 
-    query_to_show = query if show_query else None
-    text = pb.format_query_papers(query_to_show, papers, since, add_preamble, format_type="slack")
-
-    text_content = _split_into_blocks(text) if split_message else text
     _send_message(app, channel_id, text_content)
 
 
-def paperlike(app: App, body: dict[str, Any], *, paper_limit: int = 50, support_split_flag: bool = True):
+@metrics.timed_command("slack", "paperlike")
+def paperlike(app: "App", body: dict[str, Any], *, paper_limit: int = 50, support_split_flag: bool = True):
     user = body["user_name"]
     channel_id = body["channel_id"]
     text = body["text"]
 
     logger.info(f"{user} - '/paperlike {text}'")
+    metrics.annotate(arguments=text)
 
     try:
-        args, opt_args = pb.parse_arguments(text)
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(text)
     except ArgumentParserException:
+        metrics.annotate(outcome="usage")
         _send_message(app, channel_id, PAPERLIKE_HELP_INFO)
         return
 
@@ -124,27 +163,35 @@ def paperlike(app: App, body: dict[str, Any], *, paper_limit: int = 50, support_
     split_message = support_split_flag and "split" in opt_args
 
     try:
-        paper, similar_papers = pb.fetch_similar_papers(title, limit=paper_limit)
+        with metrics.stage("fetch"):
+            paper, similar_papers = pb.fetch_similar_papers(title, limit=paper_limit)
     except requests.exceptions.RequestException:
+        metrics.annotate(outcome="fetch_failed")
         _send_message(app, channel_id, "Request to Semantic Scholar failed. Please try again later.")
         return
 
-    text = pb.format_similar_papers(paper, similar_papers, title, add_preamble, format_type="slack")
+    with metrics.stage("format"):
+        text = pb.format_similar_papers(paper, similar_papers, title, add_preamble, format_type="slack")
 
-    text_content = _split_into_blocks(text) if split_message else text
+    with metrics.stage("chunk"):
+        text_content = _split_into_blocks(text) if split_message else text
     _send_message(app, channel_id, text_content)
 
 
-def papercite(app: App, body: dict[str, Any], *, paper_limit: int = 50, support_split_flag: bool = True):
+@metrics.timed_command("slack", "papercite")
+def papercite(app: "App", body: dict[str, Any], *, paper_limit: int = 50, support_split_flag: bool = True):
     user = body["user_name"]
     channel_id = body["channel_id"]
     text = body["text"]
 
     logger.info(f"{user} - '/papercite {text}'")
+    metrics.annotate(arguments=text)
 
     try:
-        args, opt_args = pb.parse_arguments(text)
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(text)
     except ArgumentParserException:
+        metrics.annotate(outcome="usage")
         _send_message(app, channel_id, PAPERCITE_HELP_INFO)
         return
 
@@ -157,26 +204,156 @@ def papercite(app: App, body: dict[str, Any], *, paper_limit: int = 50, support_
     split_message = support_split_flag and "split" in opt_args
 
     try:
-        paper, similar_papers = pb.fetch_papers_citing(title, limit=paper_limit)
+        with metrics.stage("fetch"):
+            paper, similar_papers = pb.fetch_papers_citing(title, limit=paper_limit)
     except requests.exceptions.RequestException:
+        metrics.annotate(outcome="fetch_failed")
         _send_message(app, channel_id, "Request to Semantic Scholar failed. Please try again later.")
         return
 
-    text = pb.format_papers_citing(paper, similar_papers, title, add_preamble, format_type="slack")
+    with metrics.stage("format"):
+        text = pb.format_papers_citing(paper, similar_papers, title, add_preamble, format_type="slack")
 
-    text_content = _split_into_blocks(text) if split_message else text
+    with metrics.stage("chunk"):
+        text_content = _split_into_blocks(text) if split_message else text
     _send_message(app, channel_id, text_content)
 
 
+@metrics.timed_command("slack", "paperwatch")
+def paperwatch(
+    app: "App",
+    body: dict[str, Any],
+    *,
+    store: watch.WatchStore = None,
+    template_queries_path: str = "queries/",
+):
+    """Watch a query, posting its papers to the channel now and its new papers every week."""
+    user = body["user_name"]
+    channel_id = body["channel_id"]
+    text = body["text"]
+
+    logger.info(f"{user} - '/paperwatch {text}'")
+    metrics.annotate(arguments=text)
+
+    store = store or watch.get_default_store()
+    if store is None:
+        _send_message(app, channel_id, "Watches are not enabled for this bot.")
+        return
+
+    try:
+        with metrics.stage("parse"):
+            args, opt_args = pb.parse_arguments(text)
+    except ArgumentParserException:
+        metrics.annotate(outcome="usage")
+        _send_message(app, channel_id, PAPERWATCH_HELP_INFO)
+        return
+
+    if "list" in opt_args:
+        subscriptions = store.subscriptions("slack", channel_id)
+        lines = [f"`{s.id}` {s.name} (since {s.high_water.isoformat()})" for s in subscriptions]
+        _send_message(app, channel_id, "\n".join(lines) if lines else "This channel watches no queries.")
+        return
+
+    if "remove" in opt_args:
+        subscription_id = str(opt_args["remove"])
+        if subscription_id.isdigit() and store.remove("slack", channel_id, int(subscription_id)):
+            _send_message(app, channel_id, f"Stopped watch `{subscription_id}`.")
+        else:
+            _send_message(app, channel_id, f"This channel has no watch `{subscription_id}`.")
+        return
+
+    if len(args) != 2:
+        _send_message(app, channel_id, PAPERWATCH_HELP_INFO)
+        return
+
+    query_or_template = args[0]
+    date_since = args[1]
+
+    if "template" in opt_args:
+        with metrics.stage("template"):
+            template = pb.get_template_registry(template_queries_path).get(query_or_template)
+
+        if template is None:
+            path = os.path.join(template_queries_path, f"{query_or_template}.txt")
+            path = path.replace("\n", "\\n")
+            _send_message(app, channel_id, f"Template query `{path}` not found.")
+            return
+
+        query = template.query
+    else:
+        query = query_or_template
+
+    try:
+        since = datetime.date.fromisoformat(date_since)
+    except ValueError:
+        _send_message(app, channel_id, "Invalid date format. Please use `YYYY-MM-DD`.")
+        return
+
+    subscription = store.add("slack", channel_id, query, since, name=query_or_template)
+    _send_message(
+        app, channel_id, f"Watching `{subscription.name}` as `{subscription.id}`. New papers are posted weekly."
+    )
+    _run_watch(app, store, subscription)
+
+
+def run_watches(app: "App", store: watch.WatchStore = None, *, paper_limit: int = 500):
+    """Run the due watch subscriptions of Slack channels, posting their new papers."""
+    store = store or watch.get_default_store()
+    if store is None:
+        return
+
+    for subscription in store.due("slack"):
+        with metrics.command("slack", "paperwatch_run", subscription.name):
+            try:
+                _run_watch(app, store, subscription, paper_limit=paper_limit)
+            except Exception:
+                metrics.annotate(outcome="error")
+                logger.exception(f"Watch {subscription.id} failed")
+
+
+def _run_watch(app: "App", store: watch.WatchStore, subscription: watch.Subscription, *, paper_limit: int = 500):
+    since = subscription.fetch_since(store.lookback_days)
+
+    try:
+        with metrics.stage("fetch"):
+            papers = _fetch_papers_within_budget(subscription.query, since, paper_limit)
+    except requests.exceptions.RequestException:
+        metrics.annotate(outcome="fetch_failed")
+        logger.warning(f"Watch {subscription.id} failed to fetch, retrying on the next run")
+        return
+    except memory.MemoryBudgetExceeded:
+        metrics.annotate(outcome="over_budget")
+        _send_message(app, subscription.channel, "Too many papers match the watched query. Please narrow it down.")
+        return
+
+    new_papers = store.unseen(subscription, papers)
+    metrics.annotate(new_papers=len(new_papers))
+
+    # a paper is marked as posted after it is sent, so a failed send posts it again on the next run. To stay within
+    # the memory budget, the oldest papers are posted first, and the next run posts the others.
+    if new_papers:
+        try:
+            text, new_papers = _format_papers_within_budget(subscription.name, new_papers, since, keep_newest=False)
+        except memory.MemoryBudgetExceeded:
+            metrics.annotate(outcome="over_budget")
+            _send_message(app, subscription.channel, "Too many papers match the watched query. Please narrow it down.")
+            return
+
+        _send_message(app, subscription.channel, text)
+
+    store.mark_posted(subscription, new_papers)
+
+
 def _unbold_text(text: str) -> str:
     if text.startswith("*") and text.endswith("*"):
         return text[1:-1]
     return text
 
 
-def _send_message(app: App, channel_id: str, message: str | list[str], unfurl=False):
+def _send_message(app: "App", channel_id: str, message: str | list[str], unfurl=False):
     if isinstance(message, str):
-        app.client.chat_postMessage(channel=channel_id, text=message, unfurl_links=unfurl, unfurl_media=unfurl)
+        with metrics.stage("send"):
+            app.client.chat_postMessage(channel=channel_id, text=message, unfurl_links=unfurl, unfurl_media=unfurl)
         return
 
     # send multiple messages as a burst
@@ -185,11 +362,64 @@ def _send_message(app: App, channel_id: str, message: str | list[str], unfurl=Fa
     if len(messages) == 0:
         return
 
-    app.client.chat_postMessage(channel=channel_id, text=messages[0], unfurl_links=unfurl, unfurl_media=unfurl)
+    with metrics.stage("send"):
+        app.client.chat_postMessage(channel=channel_id, text=messages[0], unfurl_links=unfurl, unfurl_media=unfurl)
 
     for message in messages[1:]:
         time.sleep(DELAY_BETWEEN_MESSAGES_IN_SECONDS)
-        app.client.chat_postMessage(channel=channel_id, text=message, unfurl_links=unfurl, unfurl_media=unfurl)
+        with metrics.stage("send"):
+            app.client.chat_postMessage(channel=channel_id, text=message, unfurl_links=unfurl, unfurl_media=unfurl)
+
+
+def _fetch_papers_within_budget(query: str, since: datetime.date, limit: int) -> list[pb.Paper]:
+    # fetching again with a lower limit frees the papers of the first attempt, see `paperbot.memory`.
+    try:
+        return pb.fetch_papers_from_query(query, since=since, limit=limit)
+    except memory.MemoryBudgetExceeded as err:
+        logger.warning(f"{err}, fetching again with a lower limit")
+
+    degraded_limit = memory.degrade_limit(limit)
+    metrics.annotate(degraded_limit=degraded_limit)
+    return pb.fetch_papers_from_query(query, since=since, limit=degraded_limit)
+
+
+def _format_papers_within_budget(
+    query: str | None,
+    papers: list[pb.Paper],
+    since: datetime.date,
+    add_preamble: bool = True,
+    split_message: bool = False,
+    *,
+    keep_newest: bool = True,
+) -> tuple[str | list[str], list[pb.Paper]]:
+    # formatting fewer papers frees the text of the first attempt, see `paperbot.memory`. Returns the papers formatted.
+    try:
+        return _format_papers(query, papers, since, add_preamble, split_message), papers
+    except memory.MemoryBudgetExceeded as err:
+        logger.warning(f"{err}, formatting fewer papers")
+
+    degraded_limit = memory.degrade_limit(len(papers))
+    metrics.annotate(degraded_limit=degraded_limit)
+
+    # papers are sorted oldest first.
+    papers = papers[-degraded_limit:] if keep_newest else papers[:degraded_limit]
+    return _format_papers(query, papers, since, add_preamble, split_message), papers
+
+
+def _format_papers(
+    query: str | None, papers: list[pb.Paper], since: datetime.date, add_preamble: bool, split_message: bool
+) -> str | list[str]:
+    with metrics.stage("format"):
+        text = pb.format_query_papers(query, papers, since, add_preamble, format_type="slack")
+        memory.check_budget()
+
+    if not split_message:
+        return text
+
+    with metrics.stage("chunk"):
+        blocks = _split_into_blocks(text)
+        memory.check_budget()
+    return blocks
 
 
 def _split_into_blocks(text: str) -> list[str]:
@@ -0,0 +1,176 @@
+"""On-disk cache of Semantic Scholar responses."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any
+
+from paperbot.fetch import jsonio
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+DEFAULT_TTLS = {
+    "match": 7 * DAY,
+    "paper": 7 * DAY,
+    "recommendations": DAY,
+    "citations": DAY,
+    "bulk": HOUR,
+}
+
+
+class ResponseCache:
+    """SQLite-backed cache of JSON responses keyed by (endpoint, normalized params).
+
+    Payloads are stored as zlib-compressed JSON. Entries expire after the TTL of their endpoint,
+    and the least recently used entries are evicted once the payloads exceed `max_bytes`.
+    A single instance can be shared by threads and coroutines; several processes can share the same file.
+
+    Parameters
+    ----------
+    path
+        Path to the SQLite database file.
+    max_bytes
+        Max total size of the compressed payloads.
+    ttls
+        Seconds an entry is valid, by endpoint. Endpoints without a TTL are not cached.
+
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024**2, ttls: dict[str, float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " endpoint TEXT NOT NULL,"
+            " payload BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+        self._size = self._total_size()
+
+    def get(self, endpoint: str, path: str, params: dict[str, Any] = None) -> Any | None:
+        """Get the cached response, or None if it is missing or expired."""
+        ttl = self.ttls.get(endpoint)
+        if ttl is None:
+            return None
+
+        key = make_key(endpoint, path, params)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute("SELECT payload, size, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            payload, size, created = row
+            if created + ttl < now:
+                self._delete([key])
+                self._size -= size
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+
+        return jsonio.loads(zlib.decompress(payload))
+
+    def set(self, endpoint: str, path: str, params: dict[str, Any], content: Any):
+        """Cache a response."""
+        if endpoint in self.ttls:
+            self.set_raw(endpoint, path, params, jsonio.dumps(content))
+
+    def set_raw(self, endpoint: str, path: str, params: dict[str, Any], data: bytes):
+        """Cache a response given as JSON encoded bytes, e.g., the body of an HTTP response."""
+        if endpoint not in self.ttls:
+            return
+
+        key = make_key(endpoint, path, params)
+        payload = zlib.compress(data)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, payload, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, payload, len(payload), now, now),
+            )
+            self._size += len(payload) - (row[0] if row else 0)
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._size = 0
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        # other processes may share the file, so recount before evicting.
+        self._size = self._total_size()
+        target = int(self.max_bytes * 0.9)
+
+        if self._size <= self.max_bytes:
+            return
+
+        keys = []
+        freed = 0
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if self._size - freed <= target:
+                break
+            keys.append(key)
+            freed += size
+
+        self._delete(keys)
+        self._size -= freed
+
+    def _delete(self, keys: list[str]):
+        if not keys:
+            return
+
+        self._conn.execute("BEGIN")
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM responses WHERE key IN ({placeholders})", batch)
+        self._conn.execute("COMMIT")
+
+    def _total_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def make_key(endpoint: str, path: str, params: dict[str, Any] = None) -> str:
+    """Cache key of a request. Whitespace in string parameters is collapsed, and title matches ignore case."""
+    normalized = {}
+    for name, value in (params or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = " ".join(value.split())
+            if (endpoint == "match") and (name == "query"):
+                value = value.lower()
+        normalized[name] = value
+
+    return json.dumps([endpoint, path, normalized], sort_keys=True, separators=(",", ":"))
@@ -1,90 +1,330 @@
+import contextvars
 import datetime
+import functools
+import heapq
+import re
+import urllib.parse
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+from requests.exceptions import HTTPError
+
 import paperbot.fetch.semantic_scholar as ss
+from paperbot import memory, metrics
+from paperbot.fetch import local
+from paperbot.fetch.index import RefinementCache
+from paperbot.fetch.local import LocalBackend
+from paperbot.fetch.memo import ResultCache, cached
+from paperbot.fetch.paper import Paper, PaperBatch
+from paperbot.fetch.singleflight import SingleFlight, coalesced
+
+DEFAULT_MAX_PAGES = 10  # bulk search pages hold up to 1000 papers each
+
+CITATIONS_PAGE_SIZE = 1000
+MAX_CITING_PAPERS = 9999  # the citations endpoint doesn't serve beyond offset + limit = 9999
+
+PAPER_FIELDS = "paperId,title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount"
+SINGLE_PAPER_FIELDS = f"{PAPER_FIELDS},abstract"
+QUERY_PAPER_FIELDS = "title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount"
+# the local mirror serves abstracts for free, and they are indexed to refine its results, see `REFINEMENTS`.
+MIRROR_PAPER_FIELDS = f"{QUERY_PAPER_FIELDS},abstract"
+
+# post-processed results of the fetch functions, shared by the sync and async variants.
+RESULT_CACHE = ResultCache()
+
+# identical concurrent fetches, e.g., the same templated command posted by several users, share one request.
+SINGLE_FLIGHT = SingleFlight()
+
+# complete results of recent searches of the local mirror, answering narrower queries without searching again.
+REFINEMENTS = RefinementCache()
+
+# runs the requests of a single command concurrently.
+FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="paperbot-fetch")
+
+_SEMANTIC_SCHOLAR_ID = re.compile(r"[0-9a-f]{40}")
+_SEMANTIC_SCHOLAR_URL = re.compile(r"(?:https?://)?(?:www\.)?semanticscholar\.org/paper/(?:[^/]+/)?([0-9a-f]{40})/?")
+_DOI = re.compile(r"(?:doi:\s*)?(10\.\d{4,9}/\S+)", re.IGNORECASE)
+_DOI_URL = re.compile(r"(?:https?://)?(?:dx\.)?doi\.org/(10\.\d{4,9}/\S+)", re.IGNORECASE)
+_ARXIV = re.compile(r"(?:arxiv:\s*)?(\d{4}\.\d{4,5})(?:v\d+)?", re.IGNORECASE)
+_ARXIV_URL = re.compile(
+    r"(?:https?://)?(?:www\.)?arxiv\.org/(?:abs|pdf)/(\d{4}\.\d{4,5})(?:v\d+)?(?:\.pdf)?/?",
+    re.IGNORECASE,
+)
+_PREFIXED_ID = re.compile(r"(CorpusId|MAG|ACL|PMID|PMCID):\S+", re.IGNORECASE)
 
+_MIN_DATE = datetime.date.min.isoformat()
 
-def fetch_single_paper(title: str) -> dict[str, Any] | None:
+
+def fetch_single_paper(title: str, client: ss.SemanticScholarClient = None) -> Paper | None:
     """Fetch a single paper."""
-    fields = "paperId,title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount,abstract"
-    papers = ss.fetch_paper_from_title(title, fields)
+    papers = ss.fetch_paper_from_title(title, SINGLE_PAPER_FIELDS, client=client)
     return _extract_paper_data(papers["data"][0])
 
 
-def fetch_similar_papers(title: str, limit=5) -> tuple[dict[str, Any], list[dict[str, Any]]] | tuple[None, list]:
-    """Fetch similar papers."""
-    fields = "paperId,title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount"
-
-    raw_paper = ss.fetch_paper_from_title(title, fields)
-    if raw_paper is None:
-        return None, []
+@cached(RESULT_CACHE)
+@coalesced(SINGLE_FLIGHT)
+def fetch_similar_papers(
+    title: str,
+    limit=5,
+    client: ss.SemanticScholarClient = None,
+) -> tuple[Paper, list[Paper]] | tuple[None, list]:
+    """Fetch similar papers.
 
-    paper = _extract_paper_data(raw_paper["data"][0])
+    `title` can also be a paper identifier or link, see `_parse_paper_id`.
 
-    fields = "paperId,title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount"
-    raw_similar_papers = ss.fetch_similar_papers_from_id(
-        paper["id"],
+    """
+    fetch_related = functools.partial(
+        ss.fetch_similar_papers_from_id,
         from_pool="all-cs",
         limit=limit,
-        fields=fields,
+        fields=PAPER_FIELDS,
+        client=client,
     )
 
-    similar_papers = [_extract_paper_data(paper) for paper in raw_similar_papers["recommendedPapers"]]
-    similar_papers = _remove_duplicate_papers(similar_papers)
-    similar_papers = _sort_papers_by_date(similar_papers)
+    paper, raw_similar_papers = _fetch_paper_and_related(title, fetch_related, client)
+    if paper is None:
+        return None, []
+
+    with metrics.stage("extract"):
+        similar_papers = [_extract_paper_data(paper) for paper in raw_similar_papers["recommendedPapers"]]
+        similar_papers = _remove_duplicate_papers(similar_papers)
+    with metrics.stage("sort"):
+        similar_papers = _sort_papers_by_date(similar_papers)
 
     return paper, similar_papers
 
 
+@cached(RESULT_CACHE)
+@coalesced(SINGLE_FLIGHT)
 def fetch_papers_from_query(
     query: str,
     since: datetime.date = None,
     until: datetime.date = None,
     limit: int = None,
-) -> list[dict[str, Any]]:
-    """Fetch papers."""
-    fields = "title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount"
+    max_pages: int = DEFAULT_MAX_PAGES,
+    max_papers: int = None,
+    client: ss.SemanticScholarClient = None,
+    backend: LocalBackend = None,
+) -> list[Paper]:
+    """Fetch papers.
+
+    Result pages are streamed from Semantic Scholar, so only a single raw page is held in memory at a time.
+    `max_pages` and `max_papers` bound the number of pages and raw papers requested.
+
+    If `limit` is set, the newest papers are requested first and pages are only fetched until `limit` papers are found,
+    followed by the papers without publication date that can be newer, see `_format_undated_period`.
+    Only the newest `limit` papers are held while the pages arrive.
+
+    Papers are searched in `backend`, or the default backend, see `local.set_default_backend`, instead of
+    Semantic Scholar if one is set. Complete results of the backend, i.e., not cut short by `limit`, `max_pages` or
+    `max_papers`, are indexed, so a query adding conditions to them, e.g., `<query> + diffusion` for the same period,
+    is answered without searching the backend again, see `index.RefinementCache`.
+
+    """
     publication_period = _format_publication_period(since, until)
-
-    raw_papers = ss.fetch_papers_from_query(query, fields, publication_period)
-
-    papers = [_extract_paper_data(paper) for paper in raw_papers["data"]]
-    papers = _remove_duplicate_papers(papers)
-    papers = _sort_papers_by_date(papers)
-    papers = _filter_by_paper_limit(papers, limit) if limit else papers
+    sort = "publicationDate:desc" if limit else None
+    backend = backend or local.get_default_backend()
+
+    if backend is not None:
+        scope = (backend, publication_period)
+        refined_papers = REFINEMENTS.refine(query, scope)
+        if refined_papers is not None:
+            metrics.annotate(refined=True)
+            return refined_papers[-limit:] if limit else refined_papers
+
+        pages = _CountedPages(
+            backend.iter_papers_from_query(
+                query,
+                MIRROR_PAPER_FIELDS,
+                publication_period,
+                sort=sort,
+                max_pages=max_pages,
+                max_papers=max_papers,
+            )
+        )
+    else:
+        pages = ss.iter_papers_from_query(
+            query,
+            QUERY_PAPER_FIELDS,
+            publication_period,
+            sort=sort,
+            max_pages=max_pages,
+            max_papers=max_papers,
+            client=client,
+        )
+
+    if not limit:
+        papers = _sort_papers_by_date(list(_iter_unique_papers(pages)))
+    else:
+        newest_papers = _NewestPapers(limit)
+        unique_ids: set[str] = set()
+        undated_period = None
+
+        # pages arrive newest first, except for the papers without publication date, see `_format_undated_period`.
+        # The ones without year either are the oldest but any later paper is newer, so they're never the oldest kept.
+        for page in pages:
+            newest_papers.extend(_iter_unique_page_papers(page, unique_ids))
+            memory.check_budget()
+
+            if newest_papers.is_full() and (newest_papers.oldest_date() > _MIN_DATE):
+                pages.close()
+                # the mirror sorts papers by their date or year, so only Semantic Scholar sorts them apart.
+                if backend is None:
+                    undated_period = _format_undated_period(newest_papers.oldest_date(), until)
+                break
+
+        if undated_period is not None:
+            undated_pages = ss.iter_papers_from_query(
+                query,
+                QUERY_PAPER_FIELDS,
+                undated_period,
+                max_pages=max_pages,
+                max_papers=max_papers,
+                client=client,
+            )
+            for page in undated_pages:
+                newest_papers.extend(_iter_unique_page_papers(page, unique_ids))
+                memory.check_budget()
+
+        papers = newest_papers.sorted()
+
+    if isinstance(pages, _CountedPages) and pages.is_complete(max_pages, max_papers):
+        REFINEMENTS.put(query, scope, papers)
 
     return papers
 
 
-def fetch_papers_citing(title: str, limit: int = 5) -> tuple[dict[str, Any], list[dict[str, Any]]] | tuple[None, list]:
-    """Fetch papers citing title paper."""
-    fields = "paperId,title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount"
+@cached(RESULT_CACHE)
+@coalesced(SINGLE_FLIGHT)
+def fetch_papers_citing(
+    title: str,
+    limit: int = 5,
+    client: ss.SemanticScholarClient = None,
+) -> tuple[Paper, list[Paper]] | tuple[None, list]:
+    """Fetch papers citing title paper.
 
-    raw_paper = ss.fetch_paper_from_title(title, fields)
-    if raw_paper is None:
-        return None, []
+    `title` can also be a paper identifier or link, see `_parse_paper_id`.
 
-    paper = _extract_paper_data(raw_paper["data"][0])
+    Up to `limit` papers are fetched. The first page is fetched together with the title paper;
+    the remaining pages are planned from its citation count and fetched concurrently.
 
-    fields = "paperId,title,url,externalIds,publicationTypes,publicationDate,year,citationCount,referenceCount"
-    raw_citing_papers = ss.fetch_papers_citing(
-        paper["id"],
-        limit=limit,
-        fields=fields,
+    """
+    limit = min(limit, MAX_CITING_PAPERS)
+    pages = _plan_citation_pages(limit)
+
+    fetch_first_page = functools.partial(
+        ss.fetch_papers_citing,
+        limit=pages[0][1],
+        fields=PAPER_FIELDS,
+        client=client,
     )
 
-    citing_papers = [_extract_paper_data(paper["citingPaper"]) for paper in raw_citing_papers["data"]]
-    citing_papers = _remove_duplicate_papers(citing_papers)
-    citing_papers = _sort_papers_by_date(citing_papers)
+    paper, raw_first_page = _fetch_paper_and_related(title, fetch_first_page, client)
+    if paper is None:
+        return None, []
+
+    raw_pages = [raw_first_page["data"]]
+
+    if "next" in raw_first_page:
+        n_citing_papers = min(limit, paper.get("citation_count", limit))
+        remaining_pages = _plan_citation_pages(n_citing_papers)[1:]
+
+        # the requests are recorded in the trace of the calling command, see `metrics.command`.
+        context = contextvars.copy_context()
+        raw_pages += FETCH_EXECUTOR.map(
+            lambda page: context.copy().run(
+                ss.fetch_papers_citing,
+                paper["id"],
+                limit=page[1],
+                fields=PAPER_FIELDS,
+                offset=page[0],
+                client=client,
+            )["data"],
+            remaining_pages,
+        )
+
+    with metrics.stage("extract"):
+        citing_papers = [_extract_paper_data(paper["citingPaper"]) for page in raw_pages for paper in page]
+        citing_papers = _remove_duplicate_papers(citing_papers)
+    with metrics.stage("sort"):
+        citing_papers = _sort_papers_by_date(citing_papers)
 
     return paper, citing_papers
 
 
-def _filter_by_paper_limit(papers: list[dict[str, Any]], limit: int) -> list[dict[str, Any]]:
-    return papers[-limit:]
+def _fetch_paper_and_related(
+    title: str,
+    fetch_related: Callable[[str], dict[str, Any]],
+    client: ss.SemanticScholarClient,
+) -> tuple[Paper, dict[str, Any]] | tuple[None, None]:
+    paper_id = _parse_paper_id(title)
+
+    if paper_id is None:
+        raw_paper = ss.fetch_paper_from_title(title, PAPER_FIELDS, client=client)
+        if raw_paper is None:
+            return None, None
+
+        paper = _extract_paper_data(raw_paper["data"][0])
+        return paper, fetch_related(paper["id"])
+
+    # the paper id is known, so the paper and its related papers can be fetched concurrently.
+    context = contextvars.copy_context()
+    future_raw_paper = FETCH_EXECUTOR.submit(context.run, ss.fetch_paper_from_id, paper_id, PAPER_FIELDS, client=client)
+
+    try:
+        raw_related = fetch_related(paper_id)
+    except HTTPError:
+        if future_raw_paper.result() is None:
+            return None, None
+        raise
+
+    raw_paper = future_raw_paper.result()
+    if raw_paper is None:
+        return None, None
+
+    return _extract_paper_data(raw_paper), raw_related
+
+
+def _plan_citation_pages(n_papers: int, page_size: int = CITATIONS_PAGE_SIZE) -> list[tuple[int, int]]:
+    """Split the first `n_papers` citations into (offset, limit) pages."""
+    return [(offset, min(page_size, n_papers - offset)) for offset in range(0, max(n_papers, 1), page_size)]
+
 
+def _parse_paper_id(text: str) -> str | None:
+    """Get the Semantic Scholar paper id of a paper identifier or link, or None if `text` is neither.
 
-def _remove_duplicate_papers(papers: list[dict[str, Any]], key: str = "title") -> list[dict[str, Any]]:
+    Supports Semantic Scholar ids and links, DOIs and doi.org links, arXiv ids and links,
+    and ids prefixed with their source, e.g., "CorpusId:215416146".
+
+    """
+    text = text.strip()
+
+    # links posted in Slack are wrapped as <url> or <url|alias>, and as <url> on Discord.
+    if text.startswith("<") and text.endswith(">"):
+        text = text[1:-1].split("|")[0]
+
+    text = urllib.parse.unquote(text)
+
+    if _SEMANTIC_SCHOLAR_ID.fullmatch(text):
+        return text
+
+    if match := _SEMANTIC_SCHOLAR_URL.fullmatch(text):
+        return match.group(1)
+
+    if match := (_DOI_URL.fullmatch(text) or _DOI.fullmatch(text)):
+        return f"DOI:{match.group(1)}"
+
+    if match := (_ARXIV_URL.fullmatch(text) or _ARXIV.fullmatch(text)):
+        return f"ARXIV:{match.group(1)}"
+
+    if _PREFIXED_ID.fullmatch(text):
+        return text
+
+    return None
+
+
+def _remove_duplicate_papers(papers: list[Paper], key: str = "title") -> list[Paper]:
     unique_papers = []
     unique_ids = set()
 
@@ -96,41 +336,27 @@ def _remove_duplicate_papers(papers: list[dict[str, Any]], key: str = "title") -
     return unique_papers
 
 
-def _extract_paper_data(paper: dict[str, Any]) -> dict[str, Any]:
-    id = paper.get("paperId")
-    title = paper.get("title")
-    semantic_scholar_url = paper.get("url")
-    publication_types = paper.get("publicationTypes")
-    publication_date = paper.get("publicationDate")
-    year = paper.get("year")
-    citation_count = paper.get("citationCount")
-    reference_count = paper.get("referenceCount")
-    abstract = paper.get("abstract")
+def _iter_unique_papers(pages: Iterable[list[dict[str, Any]]]) -> Iterator[Paper]:
+    unique_ids: set[str] = set()
 
-    doi = None
-    if "externalIds" in paper:
-        doi = paper["externalIds"].get("DOI")
+    for page in pages:
+        yield from _iter_unique_page_papers(page, unique_ids)
+        # the decoded page and the papers extracted so far are all held here, see `paperbot.memory`.
+        memory.check_budget()
 
-    if (not publication_date) and year:
-        publication_date = f"{year}-01-01"
 
-    url = _get_url_from_doi(doi) if doi else semantic_scholar_url
-    is_paper = "JournalArticle" in publication_types if publication_types else False
+def _iter_unique_page_papers(page: list[dict[str, Any]], unique_ids: set[str]) -> Iterator[Paper]:
+    # duplicates are detected on the title column, so only unique papers are materialized.
+    batch = PaperBatch.from_json(page)
 
-    full_result = {
-        "id": id,
-        "title": title,
-        "url": url,
-        "publication_date": publication_date,
-        "is_paper": is_paper,
-        "citation_count": citation_count,
-        "reference_count": reference_count,
-        "abstract": abstract,
-    }
+    for i, title in enumerate(batch.titles):
+        if title not in unique_ids:
+            unique_ids.add(title)
+            yield batch[i]
 
-    result = {k: v for k, v in full_result.items() if v is not None}
 
-    return result
+def _extract_paper_data(paper: dict[str, Any]) -> Paper:
+    return Paper.from_json(paper)
 
 
 def _get_date_format(date: datetime.date) -> str:
@@ -147,13 +373,89 @@ def _format_publication_period(since: datetime.date, until: datetime.date) -> st
     return f"{since_str}:{until_str}"
 
 
-def _sort_papers_by_date(papers: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    def _get_publication_date(paper: dict[str, Any]) -> datetime.date:
-        date = paper.get("publication_date", datetime.date.min.isoformat())
-        return datetime.datetime.strptime(date, "%Y-%m-%d")
+def _format_undated_period(oldest_date: str, until: datetime.date) -> str | None:
+    """Period of the papers without publication date that can be newer than `oldest_date`, or None if it's empty.
+
+    Semantic Scholar sorts papers without publication date last, whereas they're dated January 1 of their year, see
+    `Paper`. Once the newest papers are found, only such papers of later years than `oldest_date` can be newer.
+
+    """
+    since = datetime.date(int(oldest_date[:4]) + 1, 1, 1)
+    if (until is not None) and (since > until):
+        return None
+
+    return _format_publication_period(since, until)
+
+
+class _CountedPages:
+    """Pages of search results, counting the pages and raw papers read to tell whether they were cut short."""
+
+    def __init__(self, pages: Iterator[list[dict[str, Any]]]):
+        self._pages = pages
+        self.n_pages = 0
+        self.n_papers = 0
+        self.exhausted = False
+
+    def __iter__(self) -> Iterator[list[dict[str, Any]]]:
+        for page in self._pages:
+            self.n_pages += 1
+            self.n_papers += len(page)
+            yield page
+        self.exhausted = True
+
+    def close(self):
+        self._pages.close()  # type: ignore
+
+    def is_complete(self, max_pages: int | None, max_papers: int | None) -> bool:
+        """Whether every matching paper was read, i.e., the pages ran out before reaching either bound."""
+        return (
+            self.exhausted
+            and ((max_pages is None) or (self.n_pages < max_pages))
+            and ((max_papers is None) or (self.n_papers < max_papers))
+        )
+
+
+class _NewestPapers:
+    """Keeps the newest `limit` papers added, in a heap of at most `limit` papers.
+
+    Among papers published on the same date, the ones added first are kept, and they are sorted last.
+
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._heap: list[tuple[str, int, Paper]] = []
+        self._n_added = 0
+
+    def extend(self, papers: Iterable[Paper]):
+        heap = self._heap
+
+        for paper in papers:
+            # the negated count breaks ties, so the papers added first win and Paper objects are never compared.
+            self._n_added += 1
+            entry = (_get_publication_date(paper), -self._n_added, paper)
+
+            if len(heap) < self.limit:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    def is_full(self) -> bool:
+        return len(self._heap) >= self.limit
+
+    def oldest_date(self) -> str:
+        return self._heap[0][0]
+
+    def sorted(self) -> list[Paper]:
+        """The kept papers, oldest first."""
+        return [paper for _, _, paper in sorted(self._heap, key=lambda entry: entry[:2])]
+
 
-    return sorted(papers, key=lambda paper: _get_publication_date(paper))
+def _get_publication_date(paper: Paper) -> str:
+    # ISO dates sort like the dates they represent, so they are compared without being parsed. Papers without
+    # publication date are dated January 1 of their year, see `Paper`, unlike in the order of Semantic Scholar.
+    return paper.publication_date or _MIN_DATE
 
 
-def _get_url_from_doi(doi_id: str) -> str:
-    return f"https://doi.org/{doi_id}"
+def _sort_papers_by_date(papers: list[Paper]) -> list[Paper]:
+    return sorted(papers, key=_get_publication_date)
@@ -0,0 +1,237 @@
+"""Asyncio variant of `paperbot.fetch.fetcher`."""
+
+import asyncio
+import datetime
+import functools
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import paperbot.fetch.semantic_scholar_async as ss
+from paperbot import memory, metrics
+from paperbot.fetch import fetcher, local
+from paperbot.fetch.fetcher import (
+    _MIN_DATE,
+    DEFAULT_MAX_PAGES,
+    MAX_CITING_PAPERS,
+    PAPER_FIELDS,
+    QUERY_PAPER_FIELDS,
+    RESULT_CACHE,
+    SINGLE_FLIGHT,
+    SINGLE_PAPER_FIELDS,
+    _extract_paper_data,
+    _format_publication_period,
+    _format_undated_period,
+    _iter_unique_page_papers,
+    _NewestPapers,
+    _parse_paper_id,
+    _plan_citation_pages,
+    _remove_duplicate_papers,
+    _sort_papers_by_date,
+)
+from paperbot.fetch.local import LocalBackend
+from paperbot.fetch.memo import cached
+from paperbot.fetch.paper import Paper
+from paperbot.fetch.singleflight import coalesced
+
+MAX_CONCURRENT_PAGES = 8
+
+
+async def fetch_single_paper(title: str, client: ss.AsyncSemanticScholarClient = None) -> Paper | None:
+    """Fetch a single paper."""
+    papers = await ss.fetch_paper_from_title(title, SINGLE_PAPER_FIELDS, client=client)
+    return _extract_paper_data(papers["data"][0])
+
+
+@cached(RESULT_CACHE)
+@coalesced(SINGLE_FLIGHT)
+async def fetch_similar_papers(
+    title: str,
+    limit=5,
+    client: ss.AsyncSemanticScholarClient = None,
+) -> tuple[Paper, list[Paper]] | tuple[None, list]:
+    """Fetch similar papers. See `fetcher.fetch_similar_papers`."""
+    fetch_related = functools.partial(
+        ss.fetch_similar_papers_from_id,
+        from_pool="all-cs",
+        limit=limit,
+        fields=PAPER_FIELDS,
+        client=client,
+    )
+
+    paper, raw_similar_papers = await _fetch_paper_and_related(title, fetch_related, client)
+    if paper is None:
+        return None, []
+
+    with metrics.stage("extract"):
+        similar_papers = [_extract_paper_data(paper) for paper in raw_similar_papers["recommendedPapers"]]
+        similar_papers = _remove_duplicate_papers(similar_papers)
+    with metrics.stage("sort"):
+        similar_papers = _sort_papers_by_date(similar_papers)
+
+    return paper, similar_papers
+
+
+@cached(RESULT_CACHE)
+@coalesced(SINGLE_FLIGHT)
+async def fetch_papers_from_query(
+    query: str,
+    since: datetime.date = None,
+    until: datetime.date = None,
+    limit: int = None,
+    max_pages: int = DEFAULT_MAX_PAGES,
+    max_papers: int = None,
+    client: ss.AsyncSemanticScholarClient = None,
+    backend: LocalBackend = None,
+) -> list[Paper]:
+    """Fetch papers. See `fetcher.fetch_papers_from_query`."""
+    backend = backend or local.get_default_backend()
+    if backend is not None:
+        # the local mirror is searched synchronously, so it runs in a thread to keep the event loop responsive.
+        return await asyncio.to_thread(
+            fetcher.fetch_papers_from_query,
+            query,
+            since=since,
+            until=until,
+            limit=limit,
+            max_pages=max_pages,
+            max_papers=max_papers,
+            backend=backend,
+        )
+
+    publication_period = _format_publication_period(since, until)
+    sort = "publicationDate:desc" if limit else None
+
+    pages = ss.iter_papers_from_query(
+        query,
+        QUERY_PAPER_FIELDS,
+        publication_period,
+        sort=sort,
+        max_pages=max_pages,
+        max_papers=max_papers,
+        client=client,
+    )
+
+    unique_ids: set[str] = set()
+
+    if not limit:
+        papers: list[Paper] = []
+        async for page in pages:
+            papers += _iter_unique_page_papers(page, unique_ids)
+            # the decoded page and the papers extracted so far are all held here, see `paperbot.memory`.
+            memory.check_budget()
+
+        return _sort_papers_by_date(papers)
+
+    newest_papers = _NewestPapers(limit)
+    undated_period = None
+
+    # see `fetcher.fetch_papers_from_query`.
+    async for page in pages:
+        newest_papers.extend(_iter_unique_page_papers(page, unique_ids))
+        memory.check_budget()
+
+        if newest_papers.is_full() and (newest_papers.oldest_date() > _MIN_DATE):
+            await pages.aclose()
+            undated_period = _format_undated_period(newest_papers.oldest_date(), until)
+            break
+
+    if undated_period is not None:
+        undated_pages = ss.iter_papers_from_query(
+            query,
+            QUERY_PAPER_FIELDS,
+            undated_period,
+            max_pages=max_pages,
+            max_papers=max_papers,
+            client=client,
+        )
+        async for page in undated_pages:
+            newest_papers.extend(_iter_unique_page_papers(page, unique_ids))
+            memory.check_budget()
+
+    return newest_papers.sorted()
+
+
+@cached(RESULT_CACHE)
+@coalesced(SINGLE_FLIGHT)
+async def fetch_papers_citing(
+    title: str,
+    limit: int = 5,
+    client: ss.AsyncSemanticScholarClient = None,
+) -> tuple[Paper, list[Paper]] | tuple[None, list]:
+    """Fetch papers citing title paper. See `fetcher.fetch_papers_citing`."""
+    limit = min(limit, MAX_CITING_PAPERS)
+    pages = _plan_citation_pages(limit)
+
+    fetch_first_page = functools.partial(
+        ss.fetch_papers_citing,
+        limit=pages[0][1],
+        fields=PAPER_FIELDS,
+        client=client,
+    )
+
+    paper, raw_first_page = await _fetch_paper_and_related(title, fetch_first_page, client)
+    if paper is None:
+        return None, []
+
+    raw_pages = [raw_first_page["data"]]
+
+    if "next" in raw_first_page:
+        n_citing_papers = min(limit, paper.get("citation_count", limit))
+        remaining_pages = _plan_citation_pages(n_citing_papers)[1:]
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+
+        async def fetch_page(offset: int, page_limit: int) -> list[dict[str, Any]]:
+            async with semaphore:
+                raw_page = await ss.fetch_papers_citing(
+                    paper["id"],
+                    limit=page_limit,
+                    fields=PAPER_FIELDS,
+                    offset=offset,
+                    client=client,
+                )
+                return raw_page["data"]
+
+        raw_pages += await asyncio.gather(*(fetch_page(offset, page_limit) for offset, page_limit in remaining_pages))
+
+    with metrics.stage("extract"):
+        citing_papers = [_extract_paper_data(paper["citingPaper"]) for page in raw_pages for paper in page]
+        citing_papers = _remove_duplicate_papers(citing_papers)
+    with metrics.stage("sort"):
+        citing_papers = _sort_papers_by_date(citing_papers)
+
+    return paper, citing_papers
+
+
+async def _fetch_paper_and_related(
+    title: str,
+    fetch_related: Callable[[str], Awaitable[dict[str, Any]]],
+    client: ss.AsyncSemanticScholarClient,
+) -> tuple[Paper, dict[str, Any]] | tuple[None, None]:
+    paper_id = _parse_paper_id(title)
+
+    if paper_id is None:
+        raw_paper = await ss.fetch_paper_from_title(title, PAPER_FIELDS, client=client)
+        if raw_paper is None:
+            return None, None
+
+        paper = _extract_paper_data(raw_paper["data"][0])
+        return paper, await fetch_related(paper["id"])
+
+    # the paper id is known, so the paper and its related papers can be fetched concurrently.
+    raw_paper, raw_related = await asyncio.gather(
+        ss.fetch_paper_from_id(paper_id, PAPER_FIELDS, client=client),
+        fetch_related(paper_id),
+        return_exceptions=True,
+    )
+
+    if isinstance(raw_paper, BaseException):
+        raise raw_paper
+
+    if raw_paper is None:
+        return None, None
+
+    if isinstance(raw_related, BaseException):
+        raise raw_related
+
+    return _extract_paper_data(raw_paper), raw_related
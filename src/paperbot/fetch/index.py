@@ -0,0 +1,331 @@
+"""Inverted index of papers already held, evaluating bulk search queries without searching again.
+
+Papers are indexed by the words of their title and abstract, with positions for phrase matching. Queries are parsed
+by `paperbot.fetch.query` and evaluated by intersecting and unioning posting lists. Words are tokenized, folded and
+stemmed like the `porter unicode61 remove_diacritics 2` tokenizer of the local mirror, so an index of papers of the
+mirror matches what the mirror would.
+
+`RefinementCache` keeps indexes of the complete results of recent searches of the mirror, so a refined query, e.g.,
+a template with one more `+ term`, is answered from the results of the original query, see
+`fetcher.fetch_papers_from_query`. Results of Semantic Scholar aren't refined: they carry no abstracts, its search
+engine stems differently, and a limited or capped fetch doesn't hold all matching papers.
+
+"""
+
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable, Mapping
+from typing import Any
+
+from paperbot.fetch.paper import Paper
+from paperbot.fetch.query import And, Node, Not, Or, Phrase, QuerySyntaxError, Term, is_narrowing, parse_query
+from paperbot.fetch.stemmer import stem
+
+Postings = Mapping[int, list[int]]
+
+# letters and digits; unlike `\w`, underscores separate words, as in the unicode61 tokenizer.
+_WORD = re.compile(r"[^\W_]+")
+
+
+class InvertedIndex:
+    """Positional inverted index of papers.
+
+    Papers are numbered in the order they are added, and each word maps to the papers containing it, with the
+    positions of the word in the paper's title followed by its abstract.
+
+    Parameters
+    ----------
+    papers
+        Papers to add, as `Paper` objects or raw paper dicts.
+
+    """
+
+    def __init__(self, papers: Iterable[Paper | dict[str, Any]] = ()):
+        self.papers: list[Paper | dict[str, Any]] = []
+
+        self._postings: dict[str, dict[int, list[int]]] = {}
+        self._vocabulary: list[str] | None = None
+
+        self.add(papers)
+
+    def __len__(self) -> int:
+        return len(self.papers)
+
+    def add(self, papers: Iterable[Paper | dict[str, Any]]):
+        """Index more papers."""
+        for paper in papers:
+            doc = len(self.papers)
+            self.papers.append(paper)
+
+            text = " ".join(filter(None, (paper.get("title"), paper.get("abstract"))))
+            for position, word in enumerate(_words(text)):
+                self._postings.setdefault(word, {}).setdefault(doc, []).append(position)
+
+        self._vocabulary = None
+
+    def search(self, query: str | Node) -> list[Paper | dict[str, Any]]:
+        """Papers matching a query, in the order they were added."""
+        node = parse_query(query) if isinstance(query, str) else query
+        return [self.papers[doc] for doc in sorted(self.evaluate(node))]
+
+    def evaluate(self, node: Node) -> set[int]:
+        """Numbers of the papers matching a query."""
+        if isinstance(node, Term):
+            return set(self._term_postings(node))
+
+        if isinstance(node, Phrase):
+            return self._phrase(node)
+
+        if isinstance(node, And):
+            return self._and(node)
+
+        if isinstance(node, Or):
+            return self._or(node)
+
+        return set(range(len(self.papers))) - self.evaluate(node.child)
+
+    def estimate(self, node: Node) -> int:
+        """Upper bound of the number of papers matching a query, to evaluate the cheapest children first."""
+        if isinstance(node, Term):
+            if not node.prefix and not node.fuzziness:
+                return len(self._postings.get(_normalize(node.text), ()))
+            return sum(len(self._postings[word]) for word in self._expand(node))
+
+        if isinstance(node, Phrase):
+            return min(len(self._postings.get(_normalize(word), ())) for word in node.words)
+
+        if isinstance(node, And):
+            return min(
+                (self.estimate(child) for child in node.children if not isinstance(child, Not)),
+                default=len(self.papers),
+            )
+
+        if isinstance(node, Or):
+            return min(len(self.papers), sum(self.estimate(child) for child in node.children))
+
+        return len(self.papers)
+
+    def _term_postings(self, term: Term) -> Postings:
+        if not term.prefix and not term.fuzziness:
+            return self._postings.get(_normalize(term.text), {})
+
+        words = self._expand(term)
+        if len(words) == 1:
+            return self._postings[words[0]]
+
+        # positions of several words of a paper are merged, so expanded terms can be used in phrases.
+        merged: dict[int, list[int]] = {}
+        for word in words:
+            for doc, positions in self._postings[word].items():
+                merged.setdefault(doc, []).extend(positions)
+        for positions in merged.values():
+            positions.sort()
+        return merged
+
+    def _expand(self, term: Term) -> list[str]:
+        # words of the index matched by a prefix or fuzzy term. Like FTS5, a prefix is stemmed before it is expanded.
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+
+        text = _normalize(term.text)
+        if term.prefix:
+            start = bisect.bisect_left(self._vocabulary, text)
+            end = bisect.bisect_left(self._vocabulary, text + "￿")
+            return self._vocabulary[start:end]
+
+        return [word for word in self._vocabulary if _within_distance(text, word, term.fuzziness)]
+
+    def _phrase(self, phrase: Phrase) -> set[int]:
+        postings = [self._term_postings(Term(word)) for word in phrase.words]
+
+        # candidates contain all words; the rarest word bounds them.
+        candidates = min(postings, key=len).keys()
+        for word_postings in postings:
+            candidates = [doc for doc in candidates if doc in word_postings]
+            if not candidates:
+                return set()
+
+        max_gap = 1 + phrase.slop
+        matches = set()
+
+        for doc in candidates:
+            starts = postings[0][doc]
+            for start in starts:
+                previous = start
+                for word_postings in postings[1:]:
+                    positions = word_postings[doc]
+                    i = bisect.bisect_right(positions, previous)
+                    if (i == len(positions)) or (positions[i] - previous > max_gap):
+                        break
+                    previous = positions[i]
+                else:
+                    matches.add(doc)
+                    break
+
+        return matches
+
+    def _and(self, node: And) -> set[int]:
+        positives = sorted((child for child in node.children if not isinstance(child, Not)), key=self.estimate)
+        negatives = [child.child for child in node.children if isinstance(child, Not)]
+
+        result = self.evaluate(positives[0]) if positives else set(range(len(self.papers)))
+
+        for child in positives[1:]:
+            if not result:
+                return result
+
+            # a plain term filters by membership in its postings, without building a set of them.
+            if isinstance(child, Term):
+                postings = self._term_postings(child)
+                result = {doc for doc in result if doc in postings}
+            else:
+                result &= self.evaluate(child)
+
+        for child in negatives:
+            if not result:
+                return result
+            result -= self.evaluate(child)
+
+        return result
+
+    def _or(self, node: Or) -> set[int]:
+        result: set[int] = set()
+
+        for child in sorted(node.children, key=self.estimate, reverse=True):
+            # every paper matches already.
+            if len(result) == len(self.papers):
+                break
+            result |= self.evaluate(child)
+
+        return result
+
+
+class RefinementCache:
+    """Indexes of the complete results of recent queries, answering narrower queries from them.
+
+    Only put results known to hold every paper matching the query, with its abstract, e.g., a search of the local mirror
+    which wasn't cut short by a limit, `max_pages` or `max_papers`. Entries expire after `ttl` seconds, like
+    `memo.ResultCache` entries, so a mirror updated meanwhile is searched again.
+
+    Parameters
+    ----------
+    max_entries
+        Max number of indexed results. Set to 0 to disable the cache.
+    ttl
+        Seconds an entry is valid.
+
+    """
+
+    def __init__(self, max_entries: int = 16, ttl: float = 10 * 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries: OrderedDict[tuple[Hashable, str], tuple[float, Node, InvertedIndex]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, query: str, scope: Hashable, papers: Iterable[Paper | dict[str, Any]]):
+        """Index the complete results of `query` in `scope`, e.g., a backend and publication period."""
+        if self.max_entries <= 0:
+            return
+
+        try:
+            node = parse_query(query)
+        except QuerySyntaxError:
+            return
+
+        index = InvertedIndex(papers)
+        with self._lock:
+            self._entries.pop((scope, query), None)
+            self._entries[(scope, query)] = (time.monotonic() + self.ttl, node, index)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refine(self, query: str, scope: Hashable) -> list[Paper | dict[str, Any]] | None:
+        """Papers matching `query`, from the results of a query in `scope` it narrows, in the order they were put.
+
+        Returns None if no results are narrowed by `query`, see `query.is_narrowing`, or if the added conditions
+        can't be evaluated like the mirror does, in which case it must be fetched.
+
+        """
+        try:
+            refined = parse_query(query)
+        except QuerySyntaxError:
+            return None
+
+        for base, index in self._candidates(scope):
+            if not is_narrowing(base, refined):
+                continue
+
+            if refined == base:
+                return list(index.papers)
+
+            # the papers match the base query already, so only the added conditions are evaluated.
+            base_children = set(base.children) if isinstance(base, And) else {base}
+            added = tuple(child for child in refined.children if child not in base_children)  # type: ignore
+            if all(_is_exact(child) for child in added):
+                return index.search(added[0] if len(added) == 1 else And(added))
+
+        return None
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def _candidates(self, scope: Hashable) -> list[tuple[Node, InvertedIndex]]:
+        # unexpired results of the scope, most recently put first.
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (expires, _, _) in self._entries.items() if expires < now]:
+                del self._entries[key]
+            return [
+                (node, index)
+                for (entry_scope, _), (_, node, index) in reversed(self._entries.items())
+                if entry_scope == scope
+            ]
+
+
+def _words(text: str) -> list[str]:
+    # like the tokenizer of the local mirror: lower-cased, without diacritics, split on non-alphanumerics and stemmed.
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [stem(word) for word in _WORD.findall(text)]
+
+
+def _normalize(word: str) -> str:
+    # a word of a query, as it is indexed.
+    words = _words(word)
+    return words[0] if len(words) == 1 else " ".join(words)
+
+
+def _is_exact(node: Node) -> bool:
+    # whether the index evaluates the node like FTS5 does: FTS5 matches fuzzy terms exactly, and a NEAR group, which
+    # a phrase with slop becomes, in any order.
+    if isinstance(node, Term):
+        return not node.fuzziness
+    if isinstance(node, Phrase):
+        return not node.slop
+    if isinstance(node, Not):
+        return _is_exact(node.child)
+    return all(_is_exact(child) for child in node.children)
+
+
+def _within_distance(a: str, b: str, max_distance: int) -> bool:
+    # Levenshtein distance of at most `max_distance`, giving up on a row exceeding it.
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return False
+        previous = current
+
+    return previous[-1] <= max_distance
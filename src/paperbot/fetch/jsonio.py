@@ -0,0 +1,200 @@
+"""JSON decoding of Semantic Scholar responses.
+
+Uses orjson if it is installed, otherwise the standard library.
+
+"""
+
+import codecs
+import json
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",:]}"
+_DECODER = json.JSONDecoder()
+
+
+def loads(data: bytes | str) -> Any:
+    """Decode a JSON document."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(content: Any) -> bytes:
+    """Encode `content` as compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":")).encode()
+
+
+def iter_object_members(chunks: Iterable[bytes], stream_key: str) -> Iterator[tuple[str, Any]]:
+    """Decode a JSON object from `chunks` incrementally, yielding its (key, value) members as they are decoded.
+
+    The array under `stream_key` is not materialized; its elements are yielded one by one as (stream_key, element).
+
+    """
+    decoder = IncrementalObjectDecoder(stream_key)
+
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+
+    yield from decoder.close()
+
+
+class IncrementalObjectDecoder:
+    """Push-based decoder of a JSON object whose members are emitted as soon as they are complete.
+
+    Only the current member, or the current element of the array under `stream_key`, is buffered, so the peak memory
+    of decoding a page of papers is a single paper rather than the whole page.
+
+    Parameters
+    ----------
+    stream_key
+        Key of the array whose elements are emitted one by one.
+
+    """
+
+    def __init__(self, stream_key: str):
+        self.stream_key = stream_key
+
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._key: str | None = None
+
+    def feed(self, data: bytes) -> list[tuple[str, Any]]:
+        """Add the next chunk of the document and return the members completed by it."""
+        self._buffer = self._buffer[self._pos :] + self._text_decoder.decode(data)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> list[tuple[str, Any]]:
+        """Signal the end of the document and return the remaining members.
+
+        Raises `json.JSONDecodeError` if the document is incomplete or invalid.
+
+        """
+        self._buffer = self._buffer[self._pos :] + self._text_decoder.decode(b"", final=True)
+        self._pos = 0
+        members = self._parse(final=True)
+
+        if self._state != "end":
+            raise json.JSONDecodeError("Unexpected end of document", self._buffer, len(self._buffer))
+
+        return members
+
+    def _parse(self, final: bool) -> list[tuple[str, Any]]:
+        members = []
+
+        while True:
+            self._skip_whitespace()
+            if self._pos >= len(self._buffer):
+                return members
+
+            char = self._buffer[self._pos]
+            state = self._state
+
+            if state == "start":
+                self._expect(char, "{")
+                self._state = "key_or_end"
+
+            elif state in ("key_or_end", "key"):
+                if (char == "}") and (state == "key_or_end"):
+                    self._pos += 1
+                    self._state = "end"
+                    continue
+
+                key = self._decode_value(final)
+                if key is None:
+                    return members
+                if not isinstance(key[0], str):
+                    raise json.JSONDecodeError("Expecting property name", self._buffer, self._pos)
+                self._key = key[0]
+                self._state = "colon"
+
+            elif state == "colon":
+                self._expect(char, ":")
+                self._state = "value_start"
+
+            elif state == "value_start":
+                # the streamed key may hold something other than an array, e.g., null, which is decoded as is.
+                if (self._key == self.stream_key) and (char == "["):
+                    self._pos += 1
+                    self._state = "element_or_end"
+                else:
+                    self._state = "value"
+
+            elif state == "value":
+                value = self._decode_value(final)
+                if value is None:
+                    return members
+                members.append((self._key, value[0]))
+                self._state = "comma_or_end"
+
+            elif state == "comma_or_end":
+                if char == "}":
+                    self._pos += 1
+                    self._state = "end"
+                else:
+                    self._expect(char, ",")
+                    self._state = "key"
+
+            elif state in ("element_or_end", "element"):
+                if (char == "]") and (state == "element_or_end"):
+                    self._pos += 1
+                    self._state = "comma_or_end"
+                    continue
+
+                element = self._decode_value(final)
+                if element is None:
+                    return members
+                members.append((self.stream_key, element[0]))
+                self._state = "element_comma_or_end"
+
+            elif state == "element_comma_or_end":
+                if char == "]":
+                    self._pos += 1
+                    self._state = "comma_or_end"
+                else:
+                    self._expect(char, ",")
+                    self._state = "element"
+
+            else:
+                raise json.JSONDecodeError("Extra data", self._buffer, self._pos)
+
+    def _decode_value(self, final: bool) -> tuple[Any] | None:
+        try:
+            value, end = _DECODER.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+
+        # values are always followed by a delimiter, so a value which isn't, e.g., the "1" of a truncated "1.5",
+        # may continue in the next chunk.
+        if (not final) and ((end >= len(self._buffer)) or (self._buffer[end] not in _DELIMITERS)):
+            return None
+
+        self._pos = end
+        return (value,)
+
+    def _expect(self, char: str, expected: str):
+        if char != expected:
+            raise json.JSONDecodeError(f"Expecting '{expected}'", self._buffer, self._pos)
+        self._pos += 1
+
+    def _skip_whitespace(self):
+        buffer = self._buffer
+        pos = self._pos
+        while (pos < len(buffer)) and (buffer[pos] in _WHITESPACE):
+            pos += 1
+        self._pos = pos
@@ -0,0 +1,390 @@
+"""Local mirror of the Semantic Scholar datasets, searched offline.
+
+`LocalBackend` loads the `papers` and `abstracts` datasets of Semantic Scholar, as the gzipped JSON lines shards of a
+release and the update/delete shards of the incremental diffs between releases, into an SQLite database with an FTS5
+index over titles and abstracts. It serves bulk search pages shaped like the API responses, so
+`fetcher.fetch_papers_from_query` can search the mirror instead of Semantic Scholar, e.g.,
+
+    backend = LocalBackend("mirror/papers.sqlite")
+    backend.load(glob.glob("shards/papers/*.jsonl.gz"), "papers")
+    backend.load(glob.glob("shards/abstracts/*.jsonl.gz"), "abstracts")
+
+    papers = fetch_papers_from_query('"single cell" + rna', since=datetime.date(2024, 1, 1), backend=backend)
+
+See `scripts/ingest_s2_datasets.py` to load shards from the command line.
+
+"""
+
+import contextlib
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+from typing import Any, Literal
+
+from paperbot.fetch import jsonio
+from paperbot.fetch.query import parse_query, to_fts
+
+Dataset = Literal["papers", "abstracts"]
+
+PAGE_SIZE = 1000
+BATCH_SIZE = 10_000
+
+# API field name -> column.
+_COLUMNS = {
+    "paperId": "paper_id",
+    "corpusId": "corpus_id",
+    "title": "title",
+    "url": "url",
+    "externalIds": "external_ids",
+    "publicationTypes": "publication_types",
+    "publicationDate": "publication_date",
+    "year": "year",
+    "citationCount": "citation_count",
+    "referenceCount": "reference_count",
+    "abstract": "abstract",
+}
+_JSON_FIELDS = ("externalIds", "publicationTypes")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS papers ("
+    " corpus_id INTEGER PRIMARY KEY,"
+    " paper_id TEXT,"
+    " title TEXT,"
+    " url TEXT,"
+    " external_ids TEXT,"
+    " publication_types TEXT,"
+    " publication_date TEXT,"
+    " year INTEGER,"
+    " publication_date_or_year TEXT,"
+    " citation_count INTEGER,"
+    " reference_count INTEGER,"
+    " abstract TEXT)",
+    "CREATE INDEX IF NOT EXISTS papers_publication_date_or_year ON papers (publication_date_or_year)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5("
+    " title, abstract, content='papers', content_rowid='corpus_id', tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TABLE IF NOT EXISTS releases (dataset TEXT PRIMARY KEY, release_id TEXT NOT NULL)",
+)
+
+# keep the external content FTS index in sync with the papers table.
+_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN"
+    " INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.corpus_id, new.title, new.abstract);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN"
+    " INSERT INTO papers_fts (papers_fts, rowid, title, abstract) VALUES ('delete', old.corpus_id, old.title, old.abstract);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN"
+    " INSERT INTO papers_fts (papers_fts, rowid, title, abstract) VALUES ('delete', old.corpus_id, old.title, old.abstract);"
+    " INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.corpus_id, new.title, new.abstract);"
+    " END",
+)
+
+_UPSERT_PAPERS = (
+    "INSERT INTO papers (corpus_id, paper_id, title, url, external_ids, publication_types, publication_date, year,"
+    " publication_date_or_year, citation_count, reference_count)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT (corpus_id) DO UPDATE SET"
+    " paper_id = excluded.paper_id, title = excluded.title, url = excluded.url,"
+    " external_ids = excluded.external_ids, publication_types = excluded.publication_types,"
+    " publication_date = excluded.publication_date, year = excluded.year,"
+    " publication_date_or_year = excluded.publication_date_or_year,"
+    " citation_count = excluded.citation_count, reference_count = excluded.reference_count"
+)
+_UPSERT_ABSTRACTS = (
+    "INSERT INTO papers (corpus_id, abstract) VALUES (?, ?)"
+    " ON CONFLICT (corpus_id) DO UPDATE SET abstract = excluded.abstract"
+)
+_DELETE_PAPERS = "DELETE FROM papers WHERE corpus_id = ?"
+_DELETE_ABSTRACTS = "UPDATE papers SET abstract = NULL WHERE corpus_id = ?"
+
+_PAPER_ID_URL = re.compile(r"/paper/([0-9a-f]{40})")
+
+
+class LocalBackend:
+    """SQLite mirror of the Semantic Scholar `papers` and `abstracts` datasets, with a full-text index.
+
+    Papers are keyed by corpus id. Abstracts may be loaded before or after their papers; papers without a title,
+    i.e., only known from the abstracts dataset, are never returned. A single instance can be shared by threads.
+
+    Parameters
+    ----------
+    path
+        Path to the SQLite database file, created if missing.
+    page_size
+        Max number of papers in a page of search results.
+
+    """
+
+    def __init__(self, path: str, page_size: int = PAGE_SIZE):
+        self.path = path
+        self.page_size = page_size
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # writes go through one connection; reads use a connection per thread, so pages can be streamed.
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._conn = self._connect()
+        for statement in (*_SCHEMA, *_TRIGGERS):
+            self._conn.execute(statement)
+
+    def load(self, paths: Iterable[str], dataset: Dataset, release_id: str = None) -> int:
+        """Insert or replace the records of the shards of a release, returning the number of records.
+
+        The full-text index is rebuilt once at the end instead of row by row, so prefer `apply_diff` for small updates.
+
+        """
+        with self._lock:
+            with self._index_deferred():
+                n_records = sum(self._upsert(_iter_records(path), dataset) for path in paths)
+
+            if release_id is not None:
+                self._set_release(dataset, release_id)
+
+        return n_records
+
+    def apply_diff(
+        self,
+        update_paths: Iterable[str],
+        delete_paths: Iterable[str],
+        dataset: Dataset,
+        release_id: str = None,
+    ) -> tuple[int, int]:
+        """Apply an incremental diff between releases, returning the number of updated and deleted records."""
+        statement = _DELETE_PAPERS if dataset == "papers" else _DELETE_ABSTRACTS
+
+        with self._lock:
+            n_updated = sum(self._upsert(_iter_records(path), dataset) for path in update_paths)
+
+            n_deleted = 0
+            for path in delete_paths:
+                for batch in _batched((record["corpusid"],) for record in _iter_records(path)):
+                    self._execute_batch(statement, batch)
+                    n_deleted += len(batch)
+
+            if release_id is not None:
+                self._set_release(dataset, release_id)
+
+        return n_updated, n_deleted
+
+    def release(self, dataset: Dataset) -> str | None:
+        """Id of the last release loaded or diffed into the mirror."""
+        row = self._reader().execute("SELECT release_id FROM releases WHERE dataset = ?", (dataset,)).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        """Number of papers in the mirror."""
+        return self._reader().execute("SELECT COUNT(*) FROM papers WHERE title IS NOT NULL").fetchone()[0]
+
+    def iter_papers_from_query(
+        self,
+        query: str,
+        fields: str = None,
+        publication_date_or_year: str = None,
+        publication_types: str = None,
+        sort: str = None,
+        max_pages: int = None,
+        max_papers: int = None,
+    ) -> Iterator[list[dict[str, Any]]]:
+        """Iterate over the pages of papers matching a bulk search query.
+
+        Mirrors `semantic_scholar.iter_papers_from_query`: papers are shaped like the API's paper objects, and
+        `publication_date_or_year` ranges, e.g., "2019-03-05:2020-06", and "publicationDate:desc" sorting are supported.
+        `publication_types` isn't supported.
+
+        """
+        if publication_types:
+            raise ValueError("Filtering by publication types isn't supported by the local mirror")
+
+        names = ["paperId", *(name for name in (fields or "title").split(",") if name != "paperId")]
+        unknown = [name for name in names if name not in _COLUMNS]
+        if unknown:
+            raise ValueError(f"Fields not stored in the local mirror: {', '.join(unknown)}")
+
+        sql, params = _search_sql(names, to_fts_query(query), publication_date_or_year, sort)
+        if max_papers is not None:
+            sql += f" LIMIT {int(max_papers)}"
+
+        cursor = self._reader().execute(sql, params)
+        try:
+            n_pages = 0
+            while (max_pages is None) or (n_pages < max_pages):
+                rows = cursor.fetchmany(self.page_size)
+                if not rows:
+                    return
+
+                yield [_to_paper(names, row) for row in rows]
+                n_pages += 1
+        finally:
+            cursor.close()
+
+    def close(self):
+        """Close the database connection of the writer, and of the calling thread's reader."""
+        with self._lock:
+            self._conn.close()
+
+        reader = getattr(self._local, "conn", None)
+        if reader is not None:
+            reader.close()
+            self._local.conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _upsert(self, records: Iterable[dict[str, Any]], dataset: Dataset) -> int:
+        if dataset == "papers":
+            statement, rows = _UPSERT_PAPERS, map(_paper_row, records)
+        elif dataset == "abstracts":
+            statement, rows = _UPSERT_ABSTRACTS, ((record["corpusid"], record.get("abstract")) for record in records)
+        else:
+            raise ValueError(f"Invalid dataset: {dataset}")
+
+        n_rows = 0
+        for batch in _batched(rows):
+            self._execute_batch(statement, batch)
+            n_rows += len(batch)
+        return n_rows
+
+    def _execute_batch(self, statement: str, batch: list[tuple]):
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(statement, batch)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def _index_deferred(self) -> Iterator[None]:
+        # rebuilding the index once is much faster than updating it for every inserted row.
+        for name in ("papers_ai", "papers_ad", "papers_au"):
+            self._conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        try:
+            yield
+        finally:
+            self._conn.execute("INSERT INTO papers_fts (papers_fts) VALUES ('rebuild')")
+            for statement in _TRIGGERS:
+                self._conn.execute(statement)
+
+    def _set_release(self, dataset: Dataset, release_id: str):
+        self._conn.execute("INSERT OR REPLACE INTO releases (dataset, release_id) VALUES (?, ?)", (dataset, release_id))
+
+
+_default_backend: LocalBackend | None = None
+
+
+def get_default_backend() -> LocalBackend | None:
+    """Get the module-level backend used by `fetcher.fetch_papers_from_query`, or None to use Semantic Scholar."""
+    return _default_backend
+
+
+def set_default_backend(backend: LocalBackend | None):
+    """Search `backend` instead of Semantic Scholar in `fetcher.fetch_papers_from_query`. None restores the API."""
+    global _default_backend
+    _default_backend = backend
+
+
+def to_fts_query(query: str) -> str:
+    """Translate a bulk search query into an FTS5 query, see `query.to_fts`.
+
+    Matches are exact, i.e., `~N` fuzziness is dropped. FTS5's NOT is binary, so a negation must be and-ed with a
+    term it's subtracted from; raises `QuerySyntaxError`, a `ValueError`, otherwise.
+
+    """
+    return to_fts(parse_query(query))
+
+
+def _search_sql(
+    names: list[str],
+    fts_query: str,
+    publication_date_or_year: str | None,
+    sort: str | None,
+) -> tuple[str, list[Any]]:
+    columns = ", ".join(f"p.{_COLUMNS[name]}" for name in names)
+    sql = (
+        f"SELECT {columns} FROM papers_fts JOIN papers p ON p.corpus_id = papers_fts.rowid"
+        " WHERE papers_fts MATCH ? AND p.title IS NOT NULL"
+    )
+    params: list[Any] = [fts_query]
+
+    if publication_date_or_year:
+        # e.g., "2019-03-05:2020-06", "2019:" or ":2020". A truncated upper bound includes the whole period.
+        since, _, until = publication_date_or_year.partition(":")
+        if since:
+            sql += " AND p.publication_date_or_year >= ?"
+            params.append(since)
+        if until:
+            sql += " AND substr(p.publication_date_or_year, 1, ?) <= ?"
+            params += [len(until), until]
+
+    if sort == "publicationDate:desc":
+        sql += " ORDER BY p.publication_date_or_year DESC, p.corpus_id"
+    elif sort is not None:
+        raise ValueError(f"Unsupported sort: {sort}")
+
+    return sql, params
+
+
+def _to_paper(names: list[str], row: tuple) -> dict[str, Any]:
+    paper = dict(zip(names, row, strict=True))
+    for name in _JSON_FIELDS:
+        if paper.get(name) is not None:
+            paper[name] = json.loads(paper[name])
+    return paper
+
+
+def _paper_row(record: dict[str, Any]) -> tuple:
+    url = record.get("url")
+    match = _PAPER_ID_URL.search(url) if url else None
+    external_ids = record.get("externalids")
+    publication_types = record.get("publicationtypes")
+    publication_date = record.get("publicationdate")
+    year = record.get("year")
+
+    return (
+        record["corpusid"],
+        match.group(1) if match else None,
+        record.get("title"),
+        url,
+        json.dumps(external_ids) if external_ids is not None else None,
+        json.dumps(publication_types) if publication_types is not None else None,
+        publication_date,
+        year,
+        publication_date or (f"{year}-01-01" if year else None),
+        record.get("citationcount"),
+        record.get("referencecount"),
+    )
+
+
+def _iter_records(path: str) -> Iterator[dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as file:
+        for line in file:
+            if line.strip():
+                yield jsonio.loads(line)
+
+
+def _batched(rows: Iterable[tuple], size: int = BATCH_SIZE) -> Iterator[list[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,175 @@
+"""In-memory cache of post-processed fetch results."""
+
+import functools
+import inspect
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+_MISSING = object()
+
+
+class ResultCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    Cached values are shared between callers and must not be mutated.
+
+    Parameters
+    ----------
+    max_entries
+        Max number of entries. Set to 0 to disable the cache.
+    max_bytes
+        Max estimated size of all entries.
+    ttl
+        Seconds an entry is valid.
+
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024**2, ttl: float = 10 * 60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get the value cached under `key`, or `default` if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if (entry is None) or (entry[0] < time.monotonic()):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key: Hashable, value: Any):
+        """Cache `value` under `key`, evicting the least recently used entries if the cache is full."""
+        if self.max_entries <= 0:
+            return
+
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._size += size
+
+            while (len(self._entries) > self.max_entries) or (self._size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """Hit/miss counters and current usage."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._size}
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+
+def cached(cache: ResultCache, ignore: tuple[str, ...] = ("client",)) -> Callable:
+    """Cache the results of a function or coroutine function in `cache`.
+
+    Calls are keyed by function name and normalized arguments (see `call_key`), so the sync and async variants
+    of a function share entries. Arguments named in `ignore` are not part of the key; calls passing them, e.g., an
+    injected client whose results may differ from the default client's, bypass the cache.
+
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if passes_any(fn, args, kwargs, ignore):
+                    return await fn(*args, **kwargs)
+
+                key = call_key(fn, args, kwargs, ignore)
+                value = cache.get(key, _MISSING)
+                if value is _MISSING:
+                    value = await fn(*args, **kwargs)
+                    cache.set(key, value)
+                return value
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if passes_any(fn, args, kwargs, ignore):
+                return fn(*args, **kwargs)
+
+            key = call_key(fn, args, kwargs, ignore)
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = fn(*args, **kwargs)
+                cache.set(key, value)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def call_key(fn: Callable, args: tuple, kwargs: dict[str, Any], ignore: tuple[str, ...] = ()) -> Hashable:
+    """Key of a call, with defaults applied and whitespace in string arguments collapsed."""
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    arguments = tuple(
+        (name, " ".join(value.split()) if isinstance(value, str) else value)
+        for name, value in bound.arguments.items()
+        if name not in ignore
+    )
+    return (fn.__name__, arguments)
+
+
+def passes_any(fn: Callable, args: tuple, kwargs: dict[str, Any], names: tuple[str, ...]) -> bool:
+    """Whether a call passes a value other than None for any of the arguments named in `names`."""
+    if not names:
+        return False
+    if any(kwargs.get(name) is not None for name in names):
+        return True
+    if not args:
+        return False
+
+    bound = inspect.signature(fn).bind_partial(*args)
+    return any(bound.arguments.get(name) is not None for name in names)
+
+
+def estimate_size(value: Any) -> int:
+    """Rough estimate of the memory held by `value` in bytes."""
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(v) for v in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(estimate_size(getattr(value, name)) for name in value.__slots__)
+
+    return size
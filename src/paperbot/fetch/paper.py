@@ -0,0 +1,157 @@
+"""Paper records built from Semantic Scholar responses."""
+
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, fields
+from typing import Any
+
+
+@dataclass(frozen=True, slots=True)
+class Paper:
+    """A paper fetched from Semantic Scholar.
+
+    Supports read-only dict-style access, e.g., `paper["title"]` or `paper.get("abstract")`.
+    Like the dicts papers used to be, fields which are None behave as missing keys.
+
+    """
+
+    title: str | None = None
+    id: str | None = None
+    url: str | None = None
+    publication_date: str | None = None
+    is_paper: bool = False
+    citation_count: int | None = None
+    reference_count: int | None = None
+    abstract: str | None = None
+
+    @classmethod
+    def from_json(cls, raw: dict[str, Any]) -> "Paper":
+        """Build a paper from a raw Semantic Scholar paper object."""
+        return cls(*_extract_fields(raw))
+
+    def __getitem__(self, key: str) -> Any:
+        value = getattr(self, key, None) if key in _FIELD_NAMES else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return (key in _FIELD_NAMES) and (getattr(self, key) is not None)  # type: ignore
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a field by name, or `default` if it is missing."""
+        value = getattr(self, key, None) if key in _FIELD_NAMES else None
+        return default if value is None else value
+
+    def keys(self) -> list[str]:
+        """Names of the fields which are not None."""
+        return [name for name in _FIELD_NAMES if getattr(self, name) is not None]
+
+    def items(self) -> list[tuple[str, Any]]:
+        """(name, value) of the fields which are not None."""
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to a dict without the fields which are None."""
+        return dict(self.items())
+
+
+_FIELD_NAMES = tuple(field.name for field in fields(Paper))
+
+
+class PaperBatch:
+    """Column-oriented batch of papers, e.g., a page of search results.
+
+    Stores one list per field instead of one object per paper. Papers are only materialized when indexed.
+
+    """
+
+    __slots__ = (
+        "titles",
+        "ids",
+        "urls",
+        "publication_dates",
+        "is_papers",
+        "citation_counts",
+        "reference_counts",
+        "abstracts",
+    )
+
+    def __init__(self):
+        self.titles: list[str | None] = []
+        self.ids: list[str | None] = []
+        self.urls: list[str | None] = []
+        self.publication_dates: list[str | None] = []
+        self.is_papers: list[bool] = []
+        self.citation_counts: list[int | None] = []
+        self.reference_counts: list[int | None] = []
+        self.abstracts: list[str | None] = []
+
+    @classmethod
+    def from_json(cls, raw_papers: Iterable[dict[str, Any]]) -> "PaperBatch":
+        """Build a batch from raw Semantic Scholar paper objects."""
+        batch = cls()
+
+        columns = (
+            batch.titles,
+            batch.ids,
+            batch.urls,
+            batch.publication_dates,
+            batch.is_papers,
+            batch.citation_counts,
+            batch.reference_counts,
+            batch.abstracts,
+        )
+
+        for raw in raw_papers:
+            for column, value in zip(columns, _extract_fields(raw), strict=True):
+                column.append(value)
+
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __getitem__(self, i: int) -> Paper:
+        return Paper(
+            self.titles[i],
+            self.ids[i],
+            self.urls[i],
+            self.publication_dates[i],
+            self.is_papers[i],
+            self.citation_counts[i],
+            self.reference_counts[i],
+            self.abstracts[i],
+        )
+
+    def __iter__(self) -> Iterator[Paper]:
+        return (self[i] for i in range(len(self)))
+
+
+def _extract_fields(raw: dict[str, Any]) -> tuple:
+    # in the order of the `Paper` fields.
+    get = raw.get
+
+    publication_date = get("publicationDate")
+    if not publication_date:
+        year = get("year")
+        publication_date = f"{year}-01-01" if year else None
+
+    external_ids = get("externalIds")
+    doi = external_ids.get("DOI") if external_ids else None
+
+    publication_types = get("publicationTypes")
+
+    return (
+        get("title"),
+        get("paperId"),
+        _get_url_from_doi(doi) if doi else get("url"),
+        publication_date,
+        ("JournalArticle" in publication_types) if publication_types else False,
+        get("citationCount"),
+        get("referenceCount"),
+        get("abstract"),
+    )
+
+
+def _get_url_from_doi(doi_id: str) -> str:
+    return f"https://doi.org/{doi_id}"
@@ -0,0 +1,211 @@
+"""Precomputed results of the template queries, refreshed by a batch job and served to `--template` commands.
+
+`refresh_templates` fetches the newest `limit` papers of every template published since a horizon date, through
+one bounded pool of workers, and stores them in a `TemplateStore`. The newest `n` papers published since any date
+after the horizon, for `n` up to `limit`, are then among the stored papers, so `lookup` answers a template command
+by filtering them locally instead of running the bulk search live. It returns None, and the command fetches live,
+when the stored results are stale, were computed for another version of the template, or don't cover the command.
+
+Run `scripts/refresh_templates.py` on a schedule to keep the store fresh.
+
+"""
+
+import copy
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import paperbot.fetch.semantic_scholar as ss
+from paperbot.fetch import fetcher, jsonio
+from paperbot.fetch.paper import Paper
+
+logger = logging.getLogger(__name__)
+
+HOUR = 60 * 60
+
+DEFAULT_MAX_AGE = 6 * HOUR
+DEFAULT_LIMIT = 1000
+DEFAULT_WORKERS = 4
+
+
+@dataclass(frozen=True, slots=True)
+class TemplateResults:
+    """Papers of a template published since `since`, the newest `limit` of them, sorted by publication date."""
+
+    name: str
+    query: str
+    since: datetime.date
+    limit: int
+    refreshed: float
+    papers: tuple[Paper, ...]
+
+    def covers(self, query: str, since: datetime.date, limit: int) -> bool:
+        """Whether the newest `limit` papers of `query` published since `since` are among the stored papers."""
+        return (query == self.query) and (since >= self.since) and (limit <= self.limit)
+
+    def select(self, since: datetime.date, limit: int) -> list[Paper]:
+        """Newest `limit` papers published since `since`, sorted by publication date like a live fetch."""
+        since_str = since.isoformat()
+        papers = [paper for paper in self.papers if (paper.publication_date or "") >= since_str]
+        return papers[-limit:] if limit else papers
+
+
+class TemplateStore:
+    """SQLite-backed store of precomputed template results.
+
+    The batch job and the bots may be separate processes sharing the file. Decoded results are kept in memory until
+    the batch job replaces them.
+
+    Parameters
+    ----------
+    path
+        Path to the SQLite database file.
+    max_age
+        Seconds after which results are stale and commands fetch live.
+
+    """
+
+    def __init__(self, path: str, max_age: float = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS templates ("
+            " name TEXT PRIMARY KEY,"
+            " query TEXT NOT NULL,"
+            " since TEXT NOT NULL,"
+            " max_papers INTEGER NOT NULL,"
+            " refreshed REAL NOT NULL,"
+            " payload BLOB NOT NULL)"
+        )
+
+        self._loaded: dict[str, TemplateResults] = {}
+
+    def get(self, name: str) -> TemplateResults | None:
+        """Stored results of a template, fresh or not, or None if it was never refreshed."""
+        with self._lock:
+            row = self._conn.execute("SELECT refreshed FROM templates WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+
+            results = self._loaded.get(name)
+            if (results is not None) and (results.refreshed == row[0]):
+                return results
+
+            row = self._conn.execute(
+                "SELECT query, since, max_papers, refreshed, payload FROM templates WHERE name = ?", (name,)
+            ).fetchone()
+
+        query, since, limit, refreshed, payload = row
+        papers = tuple(Paper(**paper) for paper in jsonio.loads(zlib.decompress(payload)))
+        results = TemplateResults(name, query, datetime.date.fromisoformat(since), limit, refreshed, papers)
+
+        with self._lock:
+            self._loaded[name] = results
+        return results
+
+    def put(self, results: TemplateResults):
+        """Store the results of a template, replacing the previous ones."""
+        payload = zlib.compress(jsonio.dumps([paper.to_dict() for paper in results.papers]))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO templates (name, query, since, max_papers, refreshed, payload)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (results.name, results.query, results.since.isoformat(), results.limit, results.refreshed, payload),
+            )
+            self._loaded[results.name] = results
+
+    def lookup(self, name: str, query: str, since: datetime.date, limit: int, now: float = None) -> list[Paper] | None:
+        """Papers of a template command, or None if the stored results are stale or don't cover it."""
+        results = self.get(name)
+        if (results is None) or not results.covers(query, since, limit):
+            return None
+
+        now = time.time() if now is None else now
+        if results.refreshed + self.max_age < now:
+            return None
+
+        return results.select(since, limit)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def refresh_templates(
+    store: TemplateStore,
+    templates: Mapping[str, str],
+    since: datetime.date,
+    limit: int = DEFAULT_LIMIT,
+    workers: int = DEFAULT_WORKERS,
+    client: ss.SemanticScholarClient = None,
+) -> dict[str, int | Exception]:
+    """Fetch the newest `limit` papers of every template published since `since` and store them.
+
+    Templates are fetched concurrently by at most `workers` threads. A failed template keeps its previous results.
+    Returns the number of papers stored, or the error, by template name.
+
+    Results are stamped with the time they are fetched, so they must not come from a cache. Templates are fetched by
+    `client`, which must not have a response cache, or by a copy of the default client without one. Passing a client
+    also bypasses the result cache of the fetch functions, see `memo.cached`.
+
+    """
+    if client is None:
+        client = copy.copy(ss.get_default_client())
+        client.cache = None
+
+    def refresh(name: str, query: str) -> int:
+        refreshed = time.time()
+        papers = fetcher.fetch_papers_from_query(query, since=since, limit=limit, client=client)
+        store.put(TemplateResults(name, query, since, limit, refreshed, tuple(papers)))
+        return len(papers)
+
+    outcomes: dict[str, int | Exception] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="paperbot-refresh") as executor:
+        futures = {name: executor.submit(refresh, name, query) for name, query in templates.items()}
+
+        for name, future in futures.items():
+            try:
+                outcomes[name] = future.result()
+            except Exception as err:
+                logger.exception(f"Refreshing template {name!r} failed")
+                outcomes[name] = err
+
+    return outcomes
+
+
+_default_store: TemplateStore | None = None
+
+
+def get_default_store() -> TemplateStore | None:
+    """Store of precomputed template results served to `--template` commands, or None to always fetch live."""
+    return _default_store
+
+
+def set_default_store(store: TemplateStore | None):
+    """Serve `--template` commands from `store`. None restores live fetching."""
+    global _default_store
+    _default_store = store
+
+
+def lookup(name: str, query: str, since: datetime.date, limit: int) -> list[Paper] | None:
+    """Papers of a template command from the default store, see `TemplateStore.lookup`."""
+    store = _default_store
+    if store is None:
+        return None
+    return store.lookup(name, query, since, limit)
@@ -0,0 +1,251 @@
+"""Parser of the Semantic Scholar bulk search query language.
+
+Queries, e.g., the templates in `queries/*.txt`, combine terms with
+
+- `+` (and), `|` (or) and `-` (not), where adjacent terms are and-ed,
+- `"..."` phrases, `*` prefixes, `~N` fuzziness of terms and slop of phrases,
+- parentheses.
+
+`parse_query` compiles a query into an AST of `Term`, `Phrase`, `And`, `Or` and `Not` nodes, e.g., to evaluate it
+against the papers already held, see `paperbot.fetch.index`, or to translate it for the local mirror, see `to_fts`.
+Not binds tightest, then and, then or.
+
+"""
+
+import re
+from dataclasses import dataclass
+
+DEFAULT_FUZZINESS = 2
+DEFAULT_SLOP = 0
+
+_TOKEN = re.compile(
+    r'\s*(?:(?P<phrase>"[^"]*")(?:~(?P<slop>\d*))?|(?P<op>[()|+-])|(?P<word>[^\s()|+"~]+)(?:~(?P<fuzziness>\d*))?)'
+)
+_WORD = re.compile(r"\w+")
+
+
+class QuerySyntaxError(ValueError):
+    """The query isn't valid bulk search syntax."""
+
+
+@dataclass(frozen=True, slots=True)
+class Term:
+    """A single word, matched exactly, as a prefix, or within an edit distance."""
+
+    text: str
+    prefix: bool = False
+    fuzziness: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Phrase:
+    """Consecutive words, or words at most `slop` extra positions apart."""
+
+    words: tuple[str, ...]
+    slop: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class And:
+    """Matches if all children match."""
+
+    children: tuple["Node", ...]
+
+
+@dataclass(frozen=True, slots=True)
+class Or:
+    """Matches if any child matches."""
+
+    children: tuple["Node", ...]
+
+
+@dataclass(frozen=True, slots=True)
+class Not:
+    """Matches if the child doesn't match."""
+
+    child: "Node"
+
+
+Node = Term | Phrase | And | Or | Not
+
+
+def parse_query(query: str) -> Node:
+    """Compile a bulk search query into an AST. Words are lower-cased; raises `QuerySyntaxError` if invalid."""
+    parser = _Parser(_tokenize(query), query)
+    node = parser.parse_or()
+
+    if parser.peek() is not None:
+        raise QuerySyntaxError(f"Unexpected {parser.peek()[1]!r} in query: {query}")
+    if node is None:
+        raise QuerySyntaxError(f"Empty query: {query!r}")
+
+    return node
+
+
+def is_narrowing(base: Node, refined: Node) -> bool:
+    """Whether `refined` only matches papers matched by `base`, i.e., it and-s more conditions to `base`.
+
+    Only recognizes the syntactic case, e.g., `base + term`, not all logically implied queries.
+
+    """
+    if refined == base:
+        return True
+
+    base_children = set(base.children) if isinstance(base, And) else {base}
+    refined_children = set(refined.children) if isinstance(refined, And) else {refined}
+    return base_children <= refined_children
+
+
+def to_fts(node: Node) -> str:
+    """Translate an AST into an FTS5 query.
+
+    FTS5 has no fuzziness, so fuzzy terms match exactly and slop becomes a NEAR group. Its NOT is binary, so a negation
+    must be and-ed with a term it's subtracted from, e.g., `a + -b` or `-b + a`; raises `QuerySyntaxError` otherwise.
+
+    """
+    if isinstance(node, Term):
+        return f'"{node.text}"*' if node.prefix else f'"{node.text}"'
+
+    if isinstance(node, Phrase):
+        if node.slop > 0:
+            return "NEAR(" + " ".join(f'"{word}"' for word in node.words) + f", {node.slop})"
+        return '"' + " ".join(node.words) + '"'
+
+    if isinstance(node, Or):
+        return "(" + " OR ".join(to_fts(child) for child in node.children) + ")"
+
+    if isinstance(node, And):
+        positives = [child for child in node.children if not isinstance(child, Not)]
+        negatives = [child.child for child in node.children if isinstance(child, Not)]
+        if not positives:
+            raise QuerySyntaxError("A negation must be and-ed with a term it's subtracted from")
+
+        text = "(" + " AND ".join(to_fts(child) for child in positives) + ")"
+        return text + "".join(f" NOT {to_fts(child)}" for child in negatives)
+
+    raise QuerySyntaxError("A negation must be and-ed with a term it's subtracted from")
+
+
+def _tokenize(query: str) -> list[tuple[str, str | Node]]:
+    tokens: list[tuple[str, str | Node]] = []
+    position = 0
+
+    for match in _TOKEN.finditer(query):
+        if match.start() != position:
+            break
+        position = match.end()
+
+        phrase, op, word = match.group("phrase", "op", "word")
+
+        if op is not None:
+            tokens.append(("op", op))
+        elif phrase is not None:
+            words = tuple(word.lower() for word in _WORD.findall(phrase))
+            slop = match.group("slop")
+            if words:
+                slop_value = (int(slop) if slop else DEFAULT_SLOP) if slop is not None else 0
+                tokens.append(("term", Phrase(words, slop_value) if len(words) > 1 else Term(words[0])))
+        else:
+            tokens += _word_tokens(word, match.group("fuzziness"))
+
+    if query[position:].strip():
+        raise QuerySyntaxError(f"Unexpected {query[position:].strip()[0]!r} in query: {query}")
+
+    return tokens
+
+
+def _word_tokens(word: str, fuzziness: str | None) -> list[tuple[str, Node]]:
+    # a word with inner punctuation, e.g., "single-cell", is the phrase of its parts, like the search engine splits it.
+    words = tuple(part.lower() for part in _WORD.findall(word))
+    if not words:
+        return []
+
+    if len(words) > 1:
+        return [("term", Phrase(words))]
+
+    fuzziness_value = (int(fuzziness) if fuzziness else DEFAULT_FUZZINESS) if fuzziness is not None else 0
+    return [("term", Term(words[0], prefix=word.endswith("*"), fuzziness=fuzziness_value))]
+
+
+def _flatten(children: list[Node], kind: type[And] | type[Or]) -> tuple[Node, ...]:
+    # "(a + b) + c" is "a + b + c", so that `is_narrowing` recognizes a parenthesized base query.
+    flat: list[Node] = []
+    for child in children:
+        flat += child.children if isinstance(child, kind) else [child]
+    return tuple(flat)
+
+
+class _Parser:
+    """Recursive descent parser of the tokens of a query.
+
+    or  := and ("|" and)*
+    and := not (["+"] not)*
+    not := "-" not | atom
+    atom := term | "(" or ")"
+
+    """
+
+    def __init__(self, tokens: list[tuple[str, str | Node]], query: str):
+        self.tokens = tokens
+        self.query = query
+        self.i = 0
+
+    def peek(self) -> tuple[str, str | Node] | None:
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def parse_or(self) -> Node | None:
+        children = [self.parse_and()]
+        while self._accept("|"):
+            children.append(self.parse_and())
+
+        children = [child for child in children if child is not None]
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else Or(_flatten(children, Or))
+
+    def parse_and(self) -> Node | None:
+        children = []
+
+        while True:
+            token = self.peek()
+            if token is None or token == ("op", "|") or token == ("op", ")"):
+                break
+            if self._accept("+"):
+                continue
+            children.append(self.parse_not())
+
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else And(_flatten(children, And))
+
+    def parse_not(self) -> Node:
+        if self._accept("-"):
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self) -> Node:
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError(f"Query ends with an operator: {self.query}")
+
+        kind, value = token
+        if kind == "term":
+            self.i += 1
+            return value  # type: ignore
+
+        if value == "(":
+            self.i += 1
+            node = self.parse_or()
+            if not self._accept(")"):
+                raise QuerySyntaxError(f"Unbalanced parentheses in query: {self.query}")
+            if node is None:
+                raise QuerySyntaxError(f"Empty parentheses in query: {self.query}")
+            return node
+
+        raise QuerySyntaxError(f"Unexpected {value!r} in query: {self.query}")
+
+    def _accept(self, op: str) -> bool:
+        if self.peek() == ("op", op):
+            self.i += 1
+            return True
+        return False
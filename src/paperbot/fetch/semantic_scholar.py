@@ -1,15 +1,306 @@
+import asyncio
+import contextlib
+import datetime
+import email.utils
+import logging
+import random
+import threading
+import time
+from collections.abc import Iterable, Iterator
 from typing import Any, Literal
 
 import requests
 import requests.adapters
 from requests.exceptions import HTTPError
 
+from paperbot import memory, metrics
+from paperbot.fetch import jsonio
+from paperbot.fetch.cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://api.semanticscholar.org"
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+BULK_SEARCH_PATH = "/graph/v1/paper/search/bulk"
+
+
+class RateLimiter:
+    """Token bucket rate limiter shared by threads and coroutines.
+
+    Callers reserve a token under a lock and then wait outside of it, so waiting threads never hold the lock
+    and waiting coroutines never block the event loop.
+
+    Parameters
+    ----------
+    rate
+        Number of requests allowed per second on average.
+    burst
+        Max number of requests allowed back-to-back.
+
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 5):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be sent."""
+        time.sleep(self._reserve())
+
+    async def acquire_async(self):
+        """Wait until a request may be sent without blocking the event loop."""
+        await asyncio.sleep(self._reserve())
+
+    def block_for(self, seconds: float):
+        """Hold back all requests for `seconds`, e.g., after the server asked us to slow down."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._blocked_until - now)
+
+
+RATE_LIMITER = RateLimiter()
+
+
+def get_retry_delay(retry_after: str | None, attempt: int, backoff_base: float, backoff_max: float) -> float:
+    """Seconds to wait before retry number `attempt` (0-indexed).
+
+    Honours the `Retry-After` header if present, otherwise uses exponential backoff with full jitter.
+
+    """
+    delay = _parse_retry_after(retry_after)
+    if delay is None:
+        delay = random.uniform(0, backoff_base * 2**attempt)
+    return min(delay, backoff_max)
+
+
+def _parse_retry_after(retry_after: str | None) -> float | None:
+    if retry_after is None:
+        return None
+
+    if retry_after.strip().isdigit():
+        return float(retry_after)
+
+    try:
+        date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class SemanticScholarClient:
+    """HTTP client for the Semantic Scholar API.
+
+    Keeps a pooled keep-alive `requests.Session`, so consecutive requests reuse the same TCP+TLS connections.
+
+    Parameters
+    ----------
+    connect_timeout
+        Seconds to wait for a connection to be established.
+    read_timeout
+        Seconds to wait between bytes received from the server.
+    pool_connections
+        Number of host connection pools to cache.
+    pool_maxsize
+        Max number of connections kept alive per host. Should be at least the number of worker threads.
+    base_url
+        Root of the Semantic Scholar API, e.g., the URL of a `standin.StandInServer`.
+    rate_limiter
+        Rate limiter to share with other clients. Defaults to the process-wide `RATE_LIMITER`.
+    max_retries
+        Max number of retries on rate limiting (429) and server errors (5xx).
+    backoff_base
+        Base delay in seconds of the exponential backoff between retries.
+    backoff_max
+        Max delay in seconds between retries.
+    cache
+        Optional on-disk cache of successful responses.
+    incremental
+        Decode the pages of bulk searches incrementally, so a page is never materialized as a whole,
+        see `iter_papers_from_query`. Lowers the peak memory of broad queries at a small CPU cost.
+    transport
+        Adapter sending the requests, e.g., to record or replay responses, see `transport.make_transport`.
+        Defaults to a pooled `HTTPAdapter`, in which case `pool_connections` and `pool_maxsize` apply.
+
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        base_url: str = BASE_URL,
+        rate_limiter: RateLimiter = None,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        cache: ResponseCache = None,
+        incremental: bool = False,
+        transport: requests.adapters.BaseAdapter = None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.base_url = base_url.rstrip("/")
+        self.rate_limiter = rate_limiter or RATE_LIMITER
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self.incremental = incremental
+
+        adapter = transport or requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        )
+
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate", "Accept": "application/json"})
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(
+        self,
+        path: str,
+        params: dict[str, Any] = None,
+        stream: bool = False,
+        endpoint: str = "other",
+    ) -> requests.Response:
+        """Send a GET request to `path` relative to the API root.
+
+        Waits for the rate limiter before each attempt and retries on 429 and 5xx responses.
+        If `stream` is set, the content is not downloaded until it is read, and the response must be closed.
+        Each attempt is recorded in `paperbot.metrics` under `endpoint`.
+
+        """
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+
+            start = time.perf_counter()
+            res = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout, stream=stream)
+
+            retry = (res.status_code in RETRY_STATUS_CODES) and (attempt < self.max_retries)
+            n_bytes = _get_response_size(res, stream)
+            metrics.record_request(endpoint, res.status_code, n_bytes, time.perf_counter() - start, retry)
+
+            if not retry:
+                return res
+
+            res.close()
+
+            delay = get_retry_delay(res.headers.get("Retry-After"), attempt, self.backoff_base, self.backoff_max)
+            logger.warning(f"{path} returned {res.status_code}, retrying in {delay:.1f}s")
+
+            if res.status_code == 429:
+                self.rate_limiter.block_for(delay)
+            else:
+                time.sleep(delay)
+
+            attempt += 1
+
+    def get_json(self, endpoint: str, path: str, params: dict[str, Any] = None) -> Any:
+        """Send a GET request and return the JSON content, serving it from the cache if possible.
+
+        Raises `requests.HTTPError` on error status codes.
+
+        """
+        if self.cache is not None:
+            content = self.cache.get(endpoint, path, params)
+            if content is not None:
+                metrics.record_cache_hit(endpoint)
+                return content
+
+        res = self.get(path, params, endpoint=endpoint)
+        res.raise_for_status()
+        content = jsonio.loads(res.content)
+
+        if self.cache is not None:
+            self.cache.set_raw(endpoint, path, params, res.content)
+
+        return content
+
+    def iter_json_members(
+        self,
+        endpoint: str,
+        path: str,
+        params: dict[str, Any] = None,
+        stream_key: str = "data",
+    ) -> Iterator[tuple[str, Any]]:
+        """Send a GET request and decode the JSON object while it is downloaded, see `jsonio.iter_object_members`.
+
+        The elements of the array under `stream_key` are yielded one by one. Like `get_json`, responses are served
+        from and stored in the cache, but only responses which have been read to the end are stored.
+        Raises `requests.HTTPError` on error status codes.
+
+        """
+        if self.cache is not None:
+            content = self.cache.get(endpoint, path, params)
+            if content is not None:
+                metrics.record_cache_hit(endpoint)
+                yield from _iter_members(content, stream_key)
+                return
+
+        with contextlib.closing(self.get(path, params, stream=True, endpoint=endpoint)) as res:
+            res.raise_for_status()
+            chunks: Iterable[bytes] = res.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+
+            # the compact raw bytes are kept for the cache rather than the decoded objects.
+            raw_chunks: list[bytes] = []
+            if self.cache is not None:
+                chunks = _tee_chunks(chunks, raw_chunks)
+
+            yield from jsonio.iter_object_members(chunks, stream_key)
+
+            if self.cache is not None:
+                self.cache.set_raw(endpoint, path, params, b"".join(raw_chunks))
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+
+_default_client: SemanticScholarClient | None = None
+
+
+def get_default_client() -> SemanticScholarClient:
+    """Get the module-level client shared by all fetch functions."""
+    global _default_client
+    if _default_client is None:
+        _default_client = SemanticScholarClient()
+    return _default_client
+
+
+def set_default_client(client: SemanticScholarClient):
+    """Replace the module-level client shared by all fetch functions."""
+    global _default_client
+    _default_client = client
+
 
 def fetch_similar_papers_from_id(
     paper_id: str,
     from_pool: Literal["recent", "all-cs"] = None,
     limit: int = None,
     fields: str = None,
+    client: SemanticScholarClient = None,
 ) -> dict[str, Any]:
     """Fetch papers similar to the paper with id `paper id`.
 
@@ -18,21 +309,22 @@ def fetch_similar_papers_from_id(
     https://api.semanticscholar.org/api-docs/recommendations#tag/Paper-Recommendations/operation/get_papers_for_paper
 
     """
-    res = requests.get(
-        f"https://api.semanticscholar.org/recommendations/v1/papers/forpaper/{paper_id}",
+    client = client or get_default_client()
+    return client.get_json(
+        "recommendations",
+        f"/recommendations/v1/papers/forpaper/{paper_id}",
         params={
             "from": from_pool,
             "limit": limit,
             "fields": fields,
         },
     )
-    res.raise_for_status()
-    return res.json()
 
 
 def fetch_paper_from_title(
     title: str,
     fields: str = None,
+    client: SemanticScholarClient = None,
 ) -> dict[str, Any] | None:
     """Fetch a single paper based on title.
 
@@ -41,22 +333,49 @@ def fetch_paper_from_title(
     https://api.semanticscholar.org/api-docs/graph#tag/Paper-Data/operation/get_graph_paper_title_search
 
     """
+    client = client or get_default_client()
     try:
-        res = requests.get(
-            "https://api.semanticscholar.org/graph/v1/paper/search/match",
+        return client.get_json(
+            "match",
+            "/graph/v1/paper/search/match",
             params={
                 "query": title,
                 "fields": fields,
             },
         )
-        res.raise_for_status()
 
     except HTTPError as err:
         if _is_no_paper_matching_title(err.response):
             return None
         raise err
 
-    return res.json()
+
+def fetch_paper_from_id(
+    paper_id: str,
+    fields: str = None,
+    client: SemanticScholarClient = None,
+) -> dict[str, Any] | None:
+    """Fetch a single paper based on id, e.g., a Semantic Scholar id, "DOI:<doi>" or "ARXIV:<id>".
+
+    References
+    ----------
+    https://api.semanticscholar.org/api-docs/graph#tag/Paper-Data/operation/get_graph_get_paper
+
+    """
+    client = client or get_default_client()
+    try:
+        return client.get_json(
+            "paper",
+            f"/graph/v1/paper/{paper_id}",
+            params={
+                "fields": fields,
+            },
+        )
+
+    except HTTPError as err:
+        if err.response.status_code == 404:
+            return None
+        raise err
 
 
 def fetch_papers_from_query(
@@ -65,6 +384,8 @@ def fetch_papers_from_query(
     publication_date_or_year: str = None,
     publication_types: str = None,
     token: str = None,
+    sort: str = None,
+    client: SemanticScholarClient = None,
 ) -> dict[str, Any]:
     """Fetch papers based on search query.
 
@@ -73,37 +394,187 @@ def fetch_papers_from_query(
     https://api.semanticscholar.org/api-docs/graph#tag/Paper-Data/operation/get_graph_paper_bulk_search
 
     """
-    res = requests.get(
-        "https://api.semanticscholar.org/graph/v1/paper/search/bulk",
-        params={
-            "query": query,
-            "fields": fields,
-            "publicationDateOrYear": publication_date_or_year,
-            "publicationTypes": publication_types,
-            "token": token,
-        },
+    client = client or get_default_client()
+    return client.get_json(
+        "bulk",
+        BULK_SEARCH_PATH,
+        params=_bulk_search_params(query, fields, publication_date_or_year, publication_types, token, sort),
     )
-    res.raise_for_status()
-    return res.json()
 
 
-def fetch_papers_citing(paper_id: str, limit: int = None, fields: str = None) -> dict[str, Any]:
-    """Fetch papers citing the paper with title `title`.
+def iter_papers_from_query(
+    query: str,
+    fields: str = None,
+    publication_date_or_year: str = None,
+    publication_types: str = None,
+    sort: str = None,
+    max_pages: int = None,
+    max_papers: int = None,
+    client: SemanticScholarClient = None,
+) -> Iterator[Iterable[dict[str, Any]]]:
+    """Iterate over the pages of papers matching a search query.
+
+    Follows the continuation token of the bulk search endpoint, requesting the next page only when the previous one
+    has been consumed. Stops when there are no more pages, or when `max_pages` pages or `max_papers` papers
+    have been yielded.
+
+    `sort` is passed on to the endpoint, e.g., "publicationDate:desc" yields the newest papers first.
+
+    If the client is `incremental`, pages are iterables which decode the papers while they are iterated,
+    and each page must be iterated at most once.
+
+    """
+    client = client or get_default_client()
+
+    token = None
+    n_pages = 0
+    n_papers = 0
+
+    while True:
+        remaining = None if max_papers is None else max_papers - n_papers
+        params = _bulk_search_params(query, fields, publication_date_or_year, publication_types, token, sort)
+
+        if client.incremental:
+            page = _StreamedPage(client.iter_json_members("bulk", BULK_SEARCH_PATH, params), remaining)
+        else:
+            page = _LoadedPage(client.get_json("bulk", BULK_SEARCH_PATH, params), remaining)
+
+        try:
+            yield page.papers
+
+            n_pages += 1
+            n_papers += page.n_papers
+
+            if (max_pages is not None) and (n_pages >= max_pages):
+                return
+            if (max_papers is not None) and (n_papers >= max_papers):
+                return
+
+            token = page.finish().get("token")
+            if token is None:
+                return
+
+            # the papers kept from the previous pages must leave room for the next one, see `paperbot.memory`.
+            memory.check_budget()
+
+        finally:
+            page.close()
+
+
+def fetch_papers_citing(
+    paper_id: str,
+    limit: int = None,
+    fields: str = None,
+    offset: int = None,
+    client: SemanticScholarClient = None,
+) -> dict[str, Any]:
+    """Fetch papers citing the paper with id `paper_id`. Pages of at most 1000 papers are selected by `offset`.
 
     References
     ----------
     https://api.semanticscholar.org/api-docs/graph#tag/Paper-Data/operation/get_graph_get_paper_citations
 
     """
-    res = requests.get(
-        f"https://api.semanticscholar.org/graph/v1/paper/{paper_id}/citations",
+    client = client or get_default_client()
+    return client.get_json(
+        "citations",
+        f"/graph/v1/paper/{paper_id}/citations",
         params={  # type: ignore
+            "offset": offset,
             "limit": limit,
             "fields": fields,
         },
     )
-    res.raise_for_status()
-    return res.json()
+
+
+def _bulk_search_params(
+    query: str,
+    fields: str = None,
+    publication_date_or_year: str = None,
+    publication_types: str = None,
+    token: str = None,
+    sort: str = None,
+) -> dict[str, Any]:
+    return {
+        "query": query,
+        "fields": fields,
+        "publicationDateOrYear": publication_date_or_year,
+        "publicationTypes": publication_types,
+        "token": token,
+        "sort": sort,
+    }
+
+
+class _LoadedPage:
+    # a bulk search page decoded as a whole.
+
+    def __init__(self, content: dict[str, Any], max_papers: int | None):
+        self.papers: list[dict[str, Any]] = content.pop("data", None) or []
+        if max_papers is not None:
+            self.papers = self.papers[:max_papers]
+
+        self.n_papers = len(self.papers)
+        self._fields = content
+
+    def finish(self) -> dict[str, Any]:
+        return self._fields
+
+    def close(self):
+        pass
+
+
+class _StreamedPage:
+    # a bulk search page decoded while its papers are iterated. The other members, e.g., the continuation token,
+    # may come after the papers, so they are only known once the page has been read to the end.
+
+    def __init__(self, members: Iterator[tuple[str, Any]], max_papers: int | None):
+        self.papers = self._iter_papers()
+        self.n_papers = 0
+
+        self._members = members
+        self._max_papers = max_papers
+        self._fields: dict[str, Any] = {}
+
+    def _iter_papers(self) -> Iterator[dict[str, Any]]:
+        for key, value in self._members:
+            if key != "data":
+                self._fields[key] = value
+            elif (self._max_papers is None) or (self.n_papers < self._max_papers):
+                self.n_papers += 1
+                yield value
+
+    def finish(self) -> dict[str, Any]:
+        for key, value in self._members:
+            if key != "data":
+                self._fields[key] = value
+        return self._fields
+
+    def close(self):
+        self.papers.close()
+        self._members.close()
+
+
+def _iter_members(content: dict[str, Any], stream_key: str) -> Iterator[tuple[str, Any]]:
+    for key, value in content.items():
+        if (key == stream_key) and isinstance(value, list):
+            for element in value:
+                yield key, element
+        else:
+            yield key, value
+
+
+def _tee_chunks(chunks: Iterable[bytes], raw_chunks: list[bytes]) -> Iterator[bytes]:
+    for chunk in chunks:
+        raw_chunks.append(chunk)
+        yield chunk
+
+
+def _get_response_size(response: requests.Response, stream: bool) -> int | None:
+    # bytes on the wire if the server sent them, otherwise the decoded content unless it hasn't been read yet.
+    content_length = response.headers.get("Content-Length")
+    if content_length is not None and content_length.isdigit():
+        return int(content_length)
+    return None if stream else len(response.content)
 
 
 def _is_no_paper_matching_title(response: requests.Response) -> bool:
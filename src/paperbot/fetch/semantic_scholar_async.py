@@ -0,0 +1,330 @@
+"""Asyncio variant of `paperbot.fetch.semantic_scholar`."""
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator
+from typing import Any, Literal
+
+import aiohttp
+
+from paperbot import memory, metrics
+from paperbot.fetch import jsonio
+from paperbot.fetch.cache import ResponseCache
+from paperbot.fetch.semantic_scholar import BASE_URL, RATE_LIMITER, RETRY_STATUS_CODES, RateLimiter, get_retry_delay
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSemanticScholarClient:
+    """Asyncio HTTP client for the Semantic Scholar API.
+
+    Keeps a pooled keep-alive `aiohttp.ClientSession`. The session is created lazily on first use,
+    so the client must be used from a single event loop.
+
+    Parameters
+    ----------
+    connect_timeout
+        Seconds to wait for a connection to be established.
+    read_timeout
+        Seconds to wait between bytes received from the server.
+    pool_maxsize
+        Max number of simultaneous connections.
+    base_url
+        Root of the Semantic Scholar API.
+    rate_limiter
+        Rate limiter to share with other clients. Defaults to the process-wide `semantic_scholar.RATE_LIMITER`.
+    max_retries
+        Max number of retries on rate limiting (429) and server errors (5xx).
+    backoff_base
+        Base delay in seconds of the exponential backoff between retries.
+    backoff_max
+        Max delay in seconds between retries.
+    cache
+        Optional on-disk cache of successful responses.
+
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        pool_maxsize: int = 16,
+        base_url: str = BASE_URL,
+        rate_limiter: RateLimiter = None,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        cache: ResponseCache = None,
+    ):
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.pool_maxsize = pool_maxsize
+        self.base_url = base_url.rstrip("/")
+        self.rate_limiter = rate_limiter or RATE_LIMITER
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if (self._session is None) or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+                timeout=self.timeout,
+                headers={"Accept-Encoding": "gzip, deflate", "Accept": "application/json"},
+            )
+        return self._session
+
+    async def get(
+        self,
+        path: str,
+        params: dict[str, Any] = None,
+        allow_not_found: bool = False,
+        endpoint: str = "other",
+    ) -> tuple[int, Any]:
+        """Send a GET request to `path` relative to the API root and return the status code and JSON content.
+
+        Waits for the rate limiter before each attempt and retries on 429 and 5xx responses.
+        Raises `aiohttp.ClientResponseError` on error status codes, except 404 if `allow_not_found` is set.
+        Each attempt is recorded in `paperbot.metrics` under `endpoint`.
+
+        """
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire_async()
+
+            start = time.perf_counter()
+            async with self._get_session().get(f"{self.base_url}{path}", params=params) as res:
+                retry = (res.status in RETRY_STATUS_CODES) and (attempt < self.max_retries)
+                body = await res.read()
+                metrics.record_request(endpoint, res.status, len(body), time.perf_counter() - start, retry)
+
+                if not retry:
+                    if not (allow_not_found and res.status == 404):
+                        res.raise_for_status()
+                    content = await res.json(content_type=None, loads=jsonio.loads)
+                    return res.status, content
+
+                status = res.status
+                retry_after = res.headers.get("Retry-After")
+
+            delay = get_retry_delay(retry_after, attempt, self.backoff_base, self.backoff_max)
+            logger.warning(f"{path} returned {status}, retrying in {delay:.1f}s")
+
+            if status == 429:
+                self.rate_limiter.block_for(delay)
+            else:
+                await asyncio.sleep(delay)
+
+            attempt += 1
+
+    async def get_json(
+        self,
+        endpoint: str,
+        path: str,
+        params: dict[str, Any] = None,
+        allow_not_found: bool = False,
+    ) -> tuple[int, Any]:
+        """Like `get`, but serves successful responses from the cache if possible."""
+        # the cache reads and writes SQLite and (de)compresses payloads, so it runs in a thread to keep the event loop
+        # responsive.
+        if self.cache is not None:
+            content = await asyncio.to_thread(self.cache.get, endpoint, path, params)
+            if content is not None:
+                metrics.record_cache_hit(endpoint)
+                return 200, content
+
+        status, content = await self.get(path, params, allow_not_found, endpoint)
+
+        if (self.cache is not None) and (status == 200):
+            await asyncio.to_thread(self.cache.set, endpoint, path, params, content)
+
+        return status, content
+
+    async def close(self):
+        """Close all pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+
+
+_default_client: AsyncSemanticScholarClient | None = None
+
+
+def get_default_client() -> AsyncSemanticScholarClient:
+    """Get the module-level client shared by all async fetch functions."""
+    global _default_client
+    if _default_client is None:
+        _default_client = AsyncSemanticScholarClient()
+    return _default_client
+
+
+def set_default_client(client: AsyncSemanticScholarClient):
+    """Replace the module-level client shared by all async fetch functions."""
+    global _default_client
+    _default_client = client
+
+
+async def fetch_similar_papers_from_id(
+    paper_id: str,
+    from_pool: Literal["recent", "all-cs"] = None,
+    limit: int = None,
+    fields: str = None,
+    client: AsyncSemanticScholarClient = None,
+) -> dict[str, Any]:
+    """Fetch papers similar to the paper with id `paper id`."""
+    client = client or get_default_client()
+    _, content = await client.get_json(
+        "recommendations",
+        f"/recommendations/v1/papers/forpaper/{paper_id}",
+        params={
+            "from": from_pool,
+            "limit": limit,
+            "fields": fields,
+        },
+    )
+    return content
+
+
+async def fetch_paper_from_title(
+    title: str,
+    fields: str = None,
+    client: AsyncSemanticScholarClient = None,
+) -> dict[str, Any] | None:
+    """Fetch a single paper based on title."""
+    client = client or get_default_client()
+    status, content = await client.get_json(
+        "match",
+        "/graph/v1/paper/search/match",
+        params={
+            "query": title,
+            "fields": fields,
+        },
+        allow_not_found=True,
+    )
+
+    if status == 404:
+        if content.get("error") == "Title match not found":
+            return None
+        raise aiohttp.ClientError(f"Title match failed: {content}")
+
+    return content
+
+
+async def fetch_paper_from_id(
+    paper_id: str,
+    fields: str = None,
+    client: AsyncSemanticScholarClient = None,
+) -> dict[str, Any] | None:
+    """Fetch a single paper based on id, e.g., a Semantic Scholar id, "DOI:<doi>" or "ARXIV:<id>"."""
+    client = client or get_default_client()
+    status, content = await client.get_json(
+        "paper",
+        f"/graph/v1/paper/{paper_id}",
+        params={
+            "fields": fields,
+        },
+        allow_not_found=True,
+    )
+
+    if status == 404:
+        return None
+
+    return content
+
+
+async def fetch_papers_from_query(
+    query: str,
+    fields: str = None,
+    publication_date_or_year: str = None,
+    publication_types: str = None,
+    token: str = None,
+    sort: str = None,
+    client: AsyncSemanticScholarClient = None,
+) -> dict[str, Any]:
+    """Fetch papers based on search query."""
+    client = client or get_default_client()
+    _, content = await client.get_json(
+        "bulk",
+        "/graph/v1/paper/search/bulk",
+        params={
+            "query": query,
+            "fields": fields,
+            "publicationDateOrYear": publication_date_or_year,
+            "publicationTypes": publication_types,
+            "token": token,
+            "sort": sort,
+        },
+    )
+    return content
+
+
+async def iter_papers_from_query(
+    query: str,
+    fields: str = None,
+    publication_date_or_year: str = None,
+    publication_types: str = None,
+    sort: str = None,
+    max_pages: int = None,
+    max_papers: int = None,
+    client: AsyncSemanticScholarClient = None,
+) -> AsyncGenerator[list[dict[str, Any]], None]:
+    """Iterate over the pages of papers matching a search query. See `semantic_scholar.iter_papers_from_query`."""
+    token = None
+    n_pages = 0
+    n_papers = 0
+
+    while True:
+        res = await fetch_papers_from_query(
+            query,
+            fields,
+            publication_date_or_year,
+            publication_types,
+            token,
+            sort,
+            client=client,
+        )
+        token = res.get("token")
+        papers = res.get("data", [])
+        del res
+
+        if max_papers is not None:
+            papers = papers[: max_papers - n_papers]
+
+        n_pages += 1
+        n_papers += len(papers)
+
+        yield papers
+
+        if token is None:
+            return
+        if (max_pages is not None) and (n_pages >= max_pages):
+            return
+        if (max_papers is not None) and (n_papers >= max_papers):
+            return
+
+        # the papers kept from the previous pages must leave room for the next one, see `paperbot.memory`.
+        memory.check_budget()
+
+
+async def fetch_papers_citing(
+    paper_id: str,
+    limit: int = None,
+    fields: str = None,
+    offset: int = None,
+    client: AsyncSemanticScholarClient = None,
+) -> dict[str, Any]:
+    """Fetch papers citing the paper with id `paper_id`. Pages of at most 1000 papers are selected by `offset`."""
+    client = client or get_default_client()
+    _, content = await client.get_json(
+        "citations",
+        f"/graph/v1/paper/{paper_id}/citations",
+        params={
+            "offset": offset,
+            "limit": limit,
+            "fields": fields,
+        },
+    )
+    return content
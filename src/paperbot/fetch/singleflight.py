@@ -0,0 +1,116 @@
+"""Coalescing of identical in-flight calls."""
+
+import asyncio
+import functools
+import inspect
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from paperbot.fetch.memo import call_key, passes_any
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share the result of a single call.
+
+    Threads wait on the thread that started the call. Coroutines await a task shared by all coroutines
+    of the same event loop, so cancelling one caller does not cancel the call for the others.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._tasks: dict[tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Call `fn`, unless a call with the same key is in flight, in which case wait for its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `fn()`, unless a call with the same key is in flight on this event loop, then await its result."""
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = loop.create_task(fn())
+                task.add_done_callback(functools.partial(self._remove_task, task_key))
+
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Number of calls currently in flight."""
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+    def _remove_task(self, task_key: tuple[asyncio.AbstractEventLoop, Hashable], task: asyncio.Task):
+        with self._lock:
+            del self._tasks[task_key]
+
+        # the error is re-raised to every awaiting caller; don't also log it as never retrieved.
+        if not task.cancelled():
+            task.exception()
+
+
+def coalesced(flight: SingleFlight, ignore: tuple[str, ...] = ("client",)) -> Callable:
+    """Coalesce concurrent calls of a function or coroutine function with the same normalized arguments.
+
+    Arguments named in `ignore` are not part of the key, see `memo.call_key`; calls passing them, e.g., an injected
+    client, aren't coalesced, since their results may differ from the default client's.
+
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if passes_any(fn, args, kwargs, ignore):
+                    return await fn(*args, **kwargs)
+
+                key = call_key(fn, args, kwargs, ignore)
+                return await flight.do_async(key, lambda: fn(*args, **kwargs))
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if passes_any(fn, args, kwargs, ignore):
+                return fn(*args, **kwargs)
+
+            key = call_key(fn, args, kwargs, ignore)
+            return flight.do(key, lambda: fn(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
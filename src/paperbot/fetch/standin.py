@@ -0,0 +1,362 @@
+"""Local stand-in for the Semantic Scholar API, serving a synthetic corpus.
+
+Serves the endpoints used by `paperbot.fetch.semantic_scholar` (title match, paper, bulk search, recommendations
+and citations) with configurable latency, page size and injected rate limiting, so the fetch path can be run and
+measured offline, e.g.,
+
+    with StandInServer(make_corpus(10_000), latency=0.05) as server:
+        client = SemanticScholarClient(base_url=server.url)
+
+`write_dataset_shards` writes the same corpus as sample shards of the Semantic Scholar datasets, for the local
+mirror of `paperbot.fetch.local`.
+
+"""
+
+import datetime
+import functools
+import gzip
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from typing import Any
+
+VOCABULARY = (
+    "learning deep neural network graph language model protein structure prediction single cell rna sequencing "
+    "transformer attention diffusion generative representation contrastive causal inference bayesian optimization "
+    "reinforcement policy robust adversarial federated privacy sparse efficient scalable benchmark dataset vision "
+    "segmentation detection molecular dynamics drug discovery genomics clustering embedding retrieval reasoning"
+).split()
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_MATCH_PATH = "/graph/v1/paper/search/match"
+_BULK_PATH = "/graph/v1/paper/search/bulk"
+_PAPER_PATH = re.compile(r"/graph/v1/paper/(.+)")
+_CITATIONS_PATH = re.compile(r"/graph/v1/paper/(.+)/citations")
+_RECOMMENDATIONS_PATH = re.compile(r"/recommendations/v1/papers/forpaper/(.+)")
+
+
+def make_corpus(
+    n_papers: int,
+    seed: int = 0,
+    start: datetime.date = datetime.date(2015, 1, 1),
+    end: datetime.date = datetime.date(2024, 12, 31),
+    max_citations: int = 3000,
+) -> list[dict[str, Any]]:
+    """Make `n_papers` synthetic raw papers, shaped like Semantic Scholar paper objects with all fields."""
+    rng = random.Random(seed)
+    n_days = (end - start).days
+
+    papers = []
+    for i in range(n_papers):
+        title = " ".join(rng.choices(VOCABULARY, k=rng.randint(4, 10))).capitalize() + f" {i}"
+        date = start + datetime.timedelta(days=rng.randint(0, n_days))
+        is_preprint = rng.random() < 0.4
+
+        papers.append(
+            {
+                "paperId": f"{i:040x}",
+                "title": title,
+                "url": f"https://www.semanticscholar.org/paper/{i:040x}",
+                "externalIds": {"ArXiv": f"{date:%y%m}.{i % 100000:05d}"} if is_preprint else {"DOI": f"10.5555/{i}"},
+                "publicationTypes": None if is_preprint else ["JournalArticle"],
+                "publicationDate": date.isoformat() if rng.random() < 0.9 else None,
+                "year": date.year,
+                "citationCount": rng.randint(0, min(max_citations, n_papers - 1)),
+                "referenceCount": rng.randint(0, 80),
+                "abstract": " ".join(rng.choices(VOCABULARY, k=rng.randint(30, 80))).capitalize() + ".",
+            }
+        )
+
+    return papers
+
+
+def write_dataset_shards(
+    corpus: list[dict[str, Any]],
+    directory: str,
+    n_shards: int = 2,
+    first_corpus_id: int = 1,
+) -> dict[str, list[str]]:
+    """Write raw papers as the gzipped JSON lines shards of the `papers` and `abstracts` datasets.
+
+    The records are shaped like those of the Semantic Scholar datasets, e.g., to load into a `local.LocalBackend`.
+    Paper `i` of the corpus gets the corpus id `first_corpus_id + i`. Returns the shard paths by dataset.
+
+    """
+    paths: dict[str, list[str]] = {"papers": [], "abstracts": []}
+
+    for dataset in paths:
+        os.makedirs(os.path.join(directory, dataset), exist_ok=True)
+
+        for shard in range(n_shards):
+            path = os.path.join(directory, dataset, f"{dataset}-part{shard}.jsonl.gz")
+            with gzip.open(path, "wt") as file:
+                for i in range(shard, len(corpus), n_shards):
+                    record = _dataset_record(corpus[i], first_corpus_id + i, dataset)
+                    file.write(json.dumps(record) + "\n")
+            paths[dataset].append(path)
+
+    return paths
+
+
+def _dataset_record(paper: dict[str, Any], corpus_id: int, dataset: str) -> dict[str, Any]:
+    if dataset == "abstracts":
+        return {"corpusid": corpus_id, "openaccessinfo": None, "abstract": paper.get("abstract")}
+
+    return {
+        "corpusid": corpus_id,
+        "externalids": {**(paper.get("externalIds") or {}), "CorpusId": str(corpus_id)},
+        "url": paper["url"],
+        "title": paper["title"],
+        "year": paper["year"],
+        "referencecount": paper["referenceCount"],
+        "citationcount": paper["citationCount"],
+        "publicationtypes": paper["publicationTypes"],
+        "publicationdate": paper["publicationDate"],
+    }
+
+
+class StandInServer:
+    """HTTP server mimicking the Semantic Scholar API over a corpus of raw papers.
+
+    Bulk search matches the papers having any of the query words in their title, and honors
+    "publicationDateOrYear" ranges and "publicationDate:desc" sorting. Papers are recommended and cite each other
+    deterministically, so repeated runs see the same responses.
+
+    Parameters
+    ----------
+    corpus
+        Raw papers, e.g., from `make_corpus`.
+    host
+        Host to bind.
+    port
+        Port to bind. 0 picks a free port.
+    latency
+        Seconds to wait before each response.
+    page_size
+        Max number of papers in a bulk search page.
+    rate_limit_every
+        Respond 429 to every n-th request. 0 disables injected rate limiting.
+    retry_after
+        Seconds sent in the "Retry-After" header of 429 responses.
+
+    """
+
+    def __init__(
+        self,
+        corpus: list[dict[str, Any]],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        page_size: int = 1000,
+        rate_limit_every: int = 0,
+        retry_after: float = 1.0,
+    ):
+        self.corpus = corpus
+        self.latency = latency
+        self.page_size = page_size
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+
+        self.n_requests = 0
+        self.n_rate_limited = 0
+
+        self._lock = threading.Lock()
+        self._by_id: dict[str, int] = {}
+        self._by_title: dict[str, int] = {}
+        self._by_word: dict[str, list[int]] = {}
+
+        for i, paper in enumerate(corpus):
+            self._by_id[paper["paperId"]] = i
+            for name, value in (paper.get("externalIds") or {}).items():
+                self._by_id[f"{name.upper()}:{value}"] = i
+            self._by_title[_normalize_title(paper["title"])] = i
+            for word in set(_WORD.findall(paper["title"].lower())):
+                self._by_word.setdefault(word, []).append(i)
+
+        self._search = functools.lru_cache(maxsize=64)(self._search_uncached)
+
+        self._httpd = http.server.ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to pass to the Semantic Scholar clients."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="paperbot-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve in the calling thread."""
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any):
+        self.stop()
+
+    def handle(self, path: str, params: dict[str, str]) -> tuple[int, dict[str, Any]]:
+        """Respond to a GET request with a status code and JSON content."""
+        fields = params.get("fields")
+
+        if path == _MATCH_PATH:
+            i = self._by_title.get(_normalize_title(params.get("query", "")))
+            if i is None:
+                return 404, {"error": "Title match not found"}
+            return 200, {"data": [{**self._paper(i, fields), "matchScore": 100.0}]}
+
+        if path == _BULK_PATH:
+            return 200, self._bulk_search(params)
+
+        if match := _CITATIONS_PATH.fullmatch(path):
+            i = self._by_id.get(match.group(1))
+            if i is None:
+                return 404, {"error": "Paper not found"}
+            return 200, self._citations(i, int(params.get("offset", 0)), int(params.get("limit", 100)), fields)
+
+        if match := _PAPER_PATH.fullmatch(path):
+            i = self._by_id.get(match.group(1))
+            if i is None:
+                return 404, {"error": f"Paper with id {match.group(1)} not found"}
+            return 200, self._paper(i, fields)
+
+        if match := _RECOMMENDATIONS_PATH.fullmatch(path):
+            i = self._by_id.get(match.group(1))
+            if i is None:
+                return 404, {"error": f"Paper with id {match.group(1)} not found"}
+            limit = min(int(params.get("limit", 100)), len(self.corpus) - 1)
+            similar = [(i + 1 + k * 7919) % len(self.corpus) for k in range(limit)]
+            return 200, {"recommendedPapers": [self._paper(j, fields) for j in similar]}
+
+        return 404, {"error": "Not found"}
+
+    def _bulk_search(self, params: dict[str, str]) -> dict[str, Any]:
+        matches = self._search(
+            params.get("query", ""),
+            params.get("publicationDateOrYear"),
+            params.get("sort"),
+        )
+
+        offset = int(params.get("token") or 0)
+        page = matches[offset : offset + self.page_size]
+
+        content: dict[str, Any] = {"total": len(matches)}
+        if offset + self.page_size < len(matches):
+            content["token"] = str(offset + self.page_size)
+        content["data"] = [self._paper(i, params.get("fields")) for i in page]
+
+        return content
+
+    def _search_uncached(self, query: str, publication_date_or_year: str | None, sort: str | None) -> list[int]:
+        words = set(_WORD.findall(query.lower()))
+        matches = sorted({i for word in words for i in self._by_word.get(word, ())})
+
+        if publication_date_or_year:
+            # e.g., "2019-03-05:2020-06", "2019:" or ":2020". A truncated upper bound includes the whole period.
+            since, _, until = publication_date_or_year.partition(":")
+            until = until or "9999"
+            matches = [
+                i
+                for i in matches
+                if since <= (date := _publication_date(self.corpus[i])) and date[: len(until)] <= until
+            ]
+
+        if sort == "publicationDate:desc":
+            matches.sort(key=lambda i: self.corpus[i]["publicationDate"] or "", reverse=True)
+
+        return matches
+
+    def _citations(self, i: int, offset: int, limit: int, fields: str | None) -> dict[str, Any]:
+        n_citations = self.corpus[i]["citationCount"]
+        end = min(offset + limit, n_citations)
+
+        citing = [(i + 1 + k) % len(self.corpus) for k in range(offset, end)]
+
+        content: dict[str, Any] = {"offset": offset}
+        if end < n_citations:
+            content["next"] = end
+        content["data"] = [{"citingPaper": self._paper(j, fields)} for j in citing]
+
+        return content
+
+    def _paper(self, i: int, fields: str | None) -> dict[str, Any]:
+        # like Semantic Scholar, the paper id is always included.
+        paper = self.corpus[i]
+        names = fields.split(",") if fields else ["title"]
+
+        content = {"paperId": paper["paperId"]}
+        content.update((name, paper.get(name)) for name in names if name != "paperId")
+        return content
+
+    def _count_request(self) -> bool:
+        # returns whether the request is rate limited.
+        with self._lock:
+            self.n_requests += 1
+            limited = (self.rate_limit_every > 0) and (self.n_requests % self.rate_limit_every == 0)
+            self.n_rate_limited += limited
+            return limited
+
+    def _make_handler(self) -> type[http.server.BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = urllib.parse.urlsplit(self.path)
+                params = dict(urllib.parse.parse_qsl(parts.query))
+                path = urllib.parse.unquote(parts.path)
+
+                if server.latency > 0:
+                    time.sleep(server.latency)
+
+                if server._count_request():
+                    self._respond(429, {"message": "Too Many Requests"}, {"Retry-After": f"{server.retry_after:g}"})
+                    return
+
+                status, content = server.handle(path, params)
+                self._respond(status, content)
+
+            def _respond(self, status: int, content: dict[str, Any], headers: dict[str, str] = None):
+                body = json.dumps(content).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any):
+                pass
+
+        return Handler
+
+
+def _normalize_title(title: str) -> str:
+    return " ".join(_WORD.findall(title.lower()))
+
+
+def _publication_date(paper: dict[str, Any]) -> str:
+    return paper["publicationDate"] or f"{paper['year']}-01-01"
@@ -0,0 +1,190 @@
+"""Porter stemmer, matching the `porter` tokenizer of SQLite FTS5 used by the local mirror, see `paperbot.fetch.local`.
+
+Follows the reference implementation of M. F. Porter, "An algorithm for suffix stripping", 1980, including its
+departures from the paper, e.g., "-bli" and "-logi". Words are expected in lower case.
+
+"""
+
+import functools
+
+_STEP2 = (
+    ("ational", "ate"),
+    ("tional", "tion"),
+    ("enci", "ence"),
+    ("anci", "ance"),
+    ("izer", "ize"),
+    ("bli", "ble"),
+    ("alli", "al"),
+    ("entli", "ent"),
+    ("eli", "e"),
+    ("ousli", "ous"),
+    ("ization", "ize"),
+    ("ation", "ate"),
+    ("ator", "ate"),
+    ("alism", "al"),
+    ("iveness", "ive"),
+    ("fulness", "ful"),
+    ("ousness", "ous"),
+    ("aliti", "al"),
+    ("iviti", "ive"),
+    ("biliti", "ble"),
+    ("logi", "log"),
+)
+_STEP3 = (
+    ("icate", "ic"),
+    ("ative", ""),
+    ("alize", "al"),
+    ("iciti", "ic"),
+    ("ical", "ic"),
+    ("ful", ""),
+    ("ness", ""),
+)
+_STEP4 = (
+    "al",
+    "ance",
+    "ence",
+    "er",
+    "ic",
+    "able",
+    "ible",
+    "ant",
+    "ement",
+    "ment",
+    "ent",
+    "ion",
+    "ou",
+    "ism",
+    "ate",
+    "iti",
+    "ous",
+    "ive",
+    "ize",
+)
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Stem of a lower-case word. Words of up to two letters are kept."""
+    if len(word) <= 2:
+        return word
+
+    word = _step1a(word)
+    word = _step1b(word)
+    word = _step1c(word)
+    word = _replace_longest(word, _STEP2, 0)
+    word = _replace_longest(word, _STEP3, 0)
+    word = _step4(word)
+    return _step5(word)
+
+
+def _is_consonant(word: str, i: int) -> bool:
+    char = word[i]
+    if char in "aeiou":
+        return False
+    if char == "y":
+        return (i == 0) or not _is_consonant(word, i - 1)
+    return True
+
+
+def _measure(stem: str) -> int:
+    # m in [C](VC)^m[V].
+    m = 0
+    previous_is_vowel = False
+    for i in range(len(stem)):
+        is_vowel = not _is_consonant(stem, i)
+        if previous_is_vowel and not is_vowel:
+            m += 1
+        previous_is_vowel = is_vowel
+    return m
+
+
+def _has_vowel(stem: str) -> bool:
+    return any(not _is_consonant(stem, i) for i in range(len(stem)))
+
+
+def _ends_with_double_consonant(stem: str) -> bool:
+    return (len(stem) >= 2) and (stem[-1] == stem[-2]) and _is_consonant(stem, len(stem) - 1)
+
+
+def _ends_with_cvc(stem: str) -> bool:
+    # consonant-vowel-consonant, where the last consonant isn't w, x or y, e.g., "hop" but not "snow".
+    if len(stem) < 3:
+        return False
+    return (
+        _is_consonant(stem, len(stem) - 3)
+        and not _is_consonant(stem, len(stem) - 2)
+        and _is_consonant(stem, len(stem) - 1)
+        and stem[-1] not in "wxy"
+    )
+
+
+def _step1a(word: str) -> str:
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("ies"):
+        return word[:-2]
+    if word.endswith("ss"):
+        return word
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _step1b(word: str) -> str:
+    if word.endswith("eed"):
+        return word[:-1] if _measure(word[:-3]) > 0 else word
+
+    for suffix in ("ed", "ing"):
+        if word.endswith(suffix) and _has_vowel(word[: -len(suffix)]):
+            word = word[: -len(suffix)]
+            if word.endswith(("at", "bl", "iz")):
+                return word + "e"
+            if _ends_with_double_consonant(word) and word[-1] not in "lsz":
+                return word[:-1]
+            if (_measure(word) == 1) and _ends_with_cvc(word):
+                return word + "e"
+            return word
+
+    return word
+
+
+def _step1c(word: str) -> str:
+    if word.endswith("y") and _has_vowel(word[:-1]):
+        return word[:-1] + "i"
+    return word
+
+
+def _replace_longest(word: str, rules: tuple[tuple[str, str], ...], min_measure: int) -> str:
+    # only the longest matching suffix is considered, even if its stem is too short.
+    matches = [(suffix, replacement) for suffix, replacement in rules if word.endswith(suffix)]
+    if not matches:
+        return word
+
+    suffix, replacement = max(matches, key=lambda rule: len(rule[0]))
+    stem = word[: -len(suffix)]
+    return stem + replacement if _measure(stem) > min_measure else word
+
+
+def _step4(word: str) -> str:
+    matches = [suffix for suffix in _STEP4 if word.endswith(suffix)]
+    if not matches:
+        return word
+
+    suffix = max(matches, key=len)
+    stem = word[: -len(suffix)]
+    if (suffix == "ion") and not stem.endswith(("s", "t")):
+        return word
+    return stem if _measure(stem) > 1 else word
+
+
+def _step5(word: str) -> str:
+    if word.endswith("e"):
+        stem = word[:-1]
+        m = _measure(stem)
+        if (m > 1) or ((m == 1) and not _ends_with_cvc(stem)):
+            word = stem
+
+    if word.endswith("ll") and _measure(word) > 1:
+        word = word[:-1]
+
+    return word
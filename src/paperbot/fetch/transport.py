@@ -0,0 +1,142 @@
+"""Transports which record Semantic Scholar responses to fixtures, and replay them offline.
+
+Pass an adapter as the `transport` of a `semantic_scholar.SemanticScholarClient`, e.g.,
+
+    client = SemanticScholarClient(transport=make_transport("replay", "fixtures/"))
+
+To target a local stand-in server instead, see `paperbot.fetch.standin`, pass its URL as `base_url`.
+
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import urllib.parse
+from typing import Any, Literal
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+
+TransportMode = Literal["live", "record", "replay"]
+
+# headers which affect how the client handles a response.
+RECORDED_HEADERS = ("Content-Type", "Retry-After")
+
+
+class FixtureNotFoundError(requests.ConnectionError):
+    """No response was recorded for a replayed request."""
+
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """Sends requests over the network like `HTTPAdapter`, and records every response to `fixture_dir`.
+
+    A request sent again overwrites its fixture, so retried requests keep their final response.
+
+    Parameters
+    ----------
+    fixture_dir
+        Directory of the fixtures, created if missing.
+    **kwargs
+        Passed on to `HTTPAdapter`.
+
+    """
+
+    def __init__(self, fixture_dir: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        """Send the request and record its response."""
+        response = super().send(request, **kwargs)
+
+        # reading the content of a streamed response keeps it available to be iterated by the caller.
+        fixture = {
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+            "body": base64.b64encode(response.content).decode(),
+        }
+
+        path = fixture_path(self.fixture_dir, request.method, request.url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(fixture, file)
+        os.replace(tmp_path, path)
+
+        return response
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """Serves the responses recorded by `RecordingAdapter` without touching the network.
+
+    Raises `FixtureNotFoundError` for requests which were never recorded.
+
+    Parameters
+    ----------
+    fixture_dir
+        Directory of the fixtures.
+
+    """
+
+    def __init__(self, fixture_dir: str):
+        super().__init__()
+        self.fixture_dir = fixture_dir
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        """Serve the recorded response of the request."""
+        path = fixture_path(self.fixture_dir, request.method, request.url)
+
+        try:
+            with open(path) as file:
+                fixture = json.load(file)
+        except FileNotFoundError as err:
+            raise FixtureNotFoundError(
+                f"No fixture recorded for {request.method} {request.url}", request=request
+            ) from err
+
+        response = requests.Response()
+        response.status_code = fixture["status"]
+        response.reason = fixture["reason"]
+        response.headers = CaseInsensitiveDict(fixture["headers"])
+        response.raw = io.BytesIO(base64.b64decode(fixture["body"]))
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+
+        return response
+
+    def close(self):
+        """Nothing to close."""
+
+
+def make_transport(mode: TransportMode, fixture_dir: str = None, **kwargs: Any) -> requests.adapters.BaseAdapter:
+    """Make the transport of a mode. `kwargs` are passed on to the `HTTPAdapter` of the "live" and "record" modes."""
+    if mode == "live":
+        return requests.adapters.HTTPAdapter(**kwargs)
+
+    if fixture_dir is None:
+        raise ValueError(f"The {mode} transport needs a fixture directory")
+
+    if mode == "record":
+        return RecordingAdapter(fixture_dir, **kwargs)
+    if mode == "replay":
+        return ReplayAdapter(fixture_dir)
+
+    raise ValueError(f"Invalid transport mode: {mode}")
+
+
+def fixture_path(fixture_dir: str, method: str, url: str) -> str:
+    """Path of the fixture of a request. Requests are identified by method, path and sorted query parameters."""
+    parts = urllib.parse.urlsplit(url)
+    query = sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    key = json.dumps([method, parts.path, query], separators=(",", ":"))
+
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(fixture_dir, f"{digest}.json")
@@ -0,0 +1,131 @@
+"""Opt-in memory accounting of commands, with an optional memory budget.
+
+Once `configure` starts tracemalloc, `paperbot.metrics` records the peak and retained bytes of every command and
+stage. Bytes are counted from the start of the command or stage, so a peak of 10MB means that it allocated up to
+10MB on top of what the process held when it started. tracemalloc traces the whole process, so concurrent commands
+count each other's allocations.
+
+With a budget, `check_budget` raises `MemoryBudgetExceeded` once the traced memory exceeds it. The fetch functions
+check the budget after decoding each page of results, and the clients after formatting, so that a command can give up
+or degrade, e.g., with a lower limit or fewer papers formatted, before the process runs out of memory. tracemalloc
+only sees allocations made by Python, so leave headroom below the memory of the process, e.g., a budget of half the
+memory of a Lambda.
+
+"""
+
+import contextlib
+import gc
+import logging
+import os
+import threading
+import tracemalloc
+from collections.abc import Iterator
+
+logger = logging.getLogger(__name__)
+
+DEGRADED_LIMIT_FACTOR = 0.25
+
+_budget: int | None = None
+
+# measurements in progress, see `measure`. They share the single peak of tracemalloc.
+_measurements: list["_Measurement"] = []
+_lock = threading.Lock()
+
+
+class MemoryBudgetExceeded(Exception):
+    """The traced memory exceeds the memory budget."""
+
+    def __init__(self, current: int, budget: int):
+        super().__init__(f"Traced memory of {current / 1024**2:.1f}MB exceeds the budget of {budget / 1024**2:.1f}MB")
+        self.current = current
+        self.budget = budget
+
+
+class _Measurement:
+    def __init__(self, start: int):
+        self.start = start
+        self.peak = start
+
+
+def configure(budget: int = None, n_frames: int = 1):
+    """Start tracing memory allocations, with `budget` bytes if set."""
+    global _budget
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(n_frames)
+    _budget = budget
+
+
+def configure_from_env():
+    """Configure from `PAPERBOT_MEMORY_TRACKING` and `PAPERBOT_MEMORY_BUDGET_MB`. A budget implies tracking."""
+    budget_mb = os.environ.get("PAPERBOT_MEMORY_BUDGET_MB")
+    budget = int(float(budget_mb) * 1024**2) if budget_mb else None
+
+    if budget is not None or os.environ.get("PAPERBOT_MEMORY_TRACKING", "").lower() in ("1", "true", "yes"):
+        configure(budget)
+        logger.info(f"Tracking memory (budget: {budget_mb + 'MB' if budget_mb else 'none'})")
+
+
+def is_tracking() -> bool:
+    """Whether memory allocations are traced."""
+    return tracemalloc.is_tracing()
+
+
+def check_budget():
+    """Raise `MemoryBudgetExceeded` if the traced memory exceeds the budget. Does nothing without a budget."""
+    if (_budget is None) or not tracemalloc.is_tracing():
+        return
+
+    current, _ = tracemalloc.get_traced_memory()
+    if current <= _budget:
+        return
+
+    # unreachable reference cycles, e.g., of a failed attempt and its traceback, count until they are collected.
+    gc.collect()
+
+    current, _ = tracemalloc.get_traced_memory()
+    if current > _budget:
+        raise MemoryBudgetExceeded(current, _budget)
+
+
+def degrade_limit(limit: int) -> int:
+    """Lower limit of a command retried after exceeding the budget."""
+    return max(1, int(limit * DEGRADED_LIMIT_FACTOR))
+
+
+@contextlib.contextmanager
+def measure() -> Iterator[dict[str, int]]:
+    """Measure the peak and retained bytes of a block, filling the yielded dict on exit.
+
+    Yields an empty dict if memory isn't traced.
+
+    """
+    usage: dict[str, int] = {}
+    if not tracemalloc.is_tracing():
+        yield usage
+        return
+
+    with _lock:
+        current = _update_peaks()
+        measurement = _Measurement(current)
+        _measurements.append(measurement)
+
+    try:
+        yield usage
+    finally:
+        with _lock:
+            current = _update_peaks()
+            _measurements.remove(measurement)
+
+        usage["peak"] = measurement.peak - measurement.start
+        usage["retained"] = current - measurement.start
+
+
+def _update_peaks() -> int:
+    # folds the peak since the last reset into the measurements in progress, so the peak can be reset for new ones.
+    current, peak = tracemalloc.get_traced_memory()
+    for measurement in _measurements:
+        measurement.peak = max(measurement.peak, peak)
+
+    tracemalloc.reset_peak()
+    return current
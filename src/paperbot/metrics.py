@@ -0,0 +1,354 @@
+"""Lightweight instrumentation of the command handlers.
+
+Commands and their stages are timed with the `command` and `stage` context managers, and Semantic Scholar requests
+are recorded by the clients with `record_request`. The measurements are aggregated into counters and latency
+histograms, which `start_http_server` exposes in the Prometheus text format, and each command emits one structured
+log line with its stage timings and requests, e.g., for CloudWatch on AWS Lambda.
+
+"""
+
+import bisect
+import contextlib
+import contextvars
+import functools
+import http.server
+import inspect
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator
+from typing import Any
+
+from paperbot import memory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = tuple(float(2**i) for i in range(16, 32, 2))  # 64KB to 1GB
+
+LabelValues = tuple[str, ...]
+
+
+class Counter:
+    """Monotonically increasing value per combination of label values."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        """Increase the value of the given labels by `amount`."""
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """Current value of the given labels."""
+        with self._lock:
+            return self._values.get(_label_values(self.labelnames, labels), 0.0)
+
+    def render(self) -> list[str]:
+        """Lines of the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets per combination of label values."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+
+        # per label values: count in each bucket (the last is +Inf), and the sum of the observed values.
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any):
+        """Record an observed value of the given labels."""
+        key = _label_values(self.labelnames, labels)
+        i = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[i] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: Any) -> int:
+        """Number of observed values of the given labels."""
+        with self._lock:
+            return sum(self._counts.get(_label_values(self.labelnames, labels), ()))
+
+    def render(self) -> list[str]:
+        """Lines of the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float("inf")), counts, strict=True):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels((*self.labelnames, "le"), (*key, le))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {self._sums[key]:g}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Counter | Histogram) -> Any:
+        """Add a metric, returning it."""
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(line + "\n" for metric in metrics for line in metric.render())
+
+
+REGISTRY = Registry()
+
+COMMANDS = REGISTRY.register(
+    Counter("paperbot_commands_total", "Commands handled.", ("client", "command", "outcome")),
+)
+COMMAND_SECONDS = REGISTRY.register(
+    Histogram("paperbot_command_seconds", "End-to-end duration of commands.", ("client", "command")),
+)
+STAGE_SECONDS = REGISTRY.register(
+    Histogram("paperbot_stage_seconds", "Duration of the stages of commands.", ("stage",)),
+)
+COMMAND_PEAK_BYTES = REGISTRY.register(
+    Histogram(
+        "paperbot_command_peak_bytes",
+        "Peak traced memory allocated by commands.",
+        ("client", "command"),
+        buckets=BYTES_BUCKETS,
+    ),
+)
+STAGE_PEAK_BYTES = REGISTRY.register(
+    Histogram(
+        "paperbot_stage_peak_bytes", "Peak traced memory allocated by stages.", ("stage",), buckets=BYTES_BUCKETS
+    ),
+)
+S2_REQUESTS = REGISTRY.register(
+    Counter("paperbot_s2_requests_total", "Semantic Scholar requests sent, including retries.", ("endpoint", "status")),
+)
+S2_REQUEST_SECONDS = REGISTRY.register(
+    Histogram("paperbot_s2_request_seconds", "Duration of Semantic Scholar requests.", ("endpoint",)),
+)
+S2_RESPONSE_BYTES = REGISTRY.register(
+    Counter("paperbot_s2_response_bytes_total", "Bytes received from Semantic Scholar.", ("endpoint",)),
+)
+S2_RETRIES = REGISTRY.register(
+    Counter("paperbot_s2_retries_total", "Semantic Scholar requests retried.", ("endpoint",)),
+)
+S2_CACHE_HITS = REGISTRY.register(
+    Counter("paperbot_s2_cache_hits_total", "Semantic Scholar responses served from the cache.", ("endpoint",)),
+)
+
+# measurements of the command running in the current thread or task, see `command`.
+_trace: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar("paperbot_trace", default=None)
+_last_trace: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar("paperbot_last_trace", default=None)
+
+
+@contextlib.contextmanager
+def command(client: str, name: str, arguments: str = None) -> Iterator[dict[str, Any]]:
+    """Time a command, aggregating its stages and requests into one structured log line.
+
+    Yields the trace of the command, to which extra fields can be added, e.g., `trace["outcome"] = "usage"`.
+
+    """
+    trace: dict[str, Any] = {"client": client, "command": name, "arguments": arguments, "outcome": "ok"}
+    trace["stages"] = {}
+    trace["requests"] = []
+
+    token = _trace.set(trace)
+    start = time.perf_counter()
+    usage: dict[str, int] = {}
+
+    try:
+        with memory.measure() as usage:
+            yield trace
+    except BaseException:
+        trace["outcome"] = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _trace.reset(token)
+        _last_trace.set(trace)
+
+        trace["seconds"] = round(seconds, 6)
+        COMMAND_SECONDS.observe(seconds, client=client, command=name)
+        COMMANDS.inc(client=client, command=name, outcome=trace["outcome"])
+
+        if usage:
+            trace["peak_bytes"] = usage["peak"]
+            trace["retained_bytes"] = usage["retained"]
+            COMMAND_PEAK_BYTES.observe(usage["peak"], client=client, command=name)
+
+        logger.info(json.dumps({"event": "command", **trace}, default=str))
+
+
+def timed_command(client: str, name: str) -> Callable:
+    """Time every call of a command handler, a function or coroutine function, see `command`."""
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with command(client, name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with command(client, name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def last_trace() -> dict[str, Any] | None:
+    """Trace of the last command finished in the current thread or task, see `command`."""
+    return _last_trace.get()
+
+
+def annotate(**fields: Any):
+    """Add fields to the trace of the current command, e.g., its arguments or `outcome="usage"`."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current command, e.g., "parse", "fetch" or "send".
+
+    If memory is traced, see `paperbot.memory`, its peak and retained bytes are recorded as well. Over repeated
+    stages of the same name, the max peak and the total retained bytes are kept.
+
+    """
+    start = time.perf_counter()
+    try:
+        with memory.measure() as usage:
+            yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=name)
+        if usage:
+            STAGE_PEAK_BYTES.observe(usage["peak"], stage=name)
+
+        trace = _trace.get()
+        if trace is not None:
+            stages = trace["stages"]
+            stages[name] = round(stages.get(name, 0.0) + seconds, 6)
+
+            if usage:
+                stage_usage = trace.setdefault("memory", {}).setdefault(name, {"peak": 0, "retained": 0})
+                stage_usage["peak"] = max(stage_usage["peak"], usage["peak"])
+                stage_usage["retained"] += usage["retained"]
+
+
+def record_request(endpoint: str, status: int, n_bytes: int | None, seconds: float, retried: bool = False):
+    """Record an attempt of a Semantic Scholar request. `n_bytes` is None if the size isn't known yet."""
+    S2_REQUESTS.inc(endpoint=endpoint, status=status)
+    S2_REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    if n_bytes is not None:
+        S2_RESPONSE_BYTES.inc(n_bytes, endpoint=endpoint)
+    if retried:
+        S2_RETRIES.inc(endpoint=endpoint)
+
+    trace = _trace.get()
+    if trace is not None:
+        trace["requests"].append(
+            {"endpoint": endpoint, "status": status, "bytes": n_bytes, "seconds": round(seconds, 6), "retried": retried}
+        )
+
+
+def record_cache_hit(endpoint: str):
+    """Record a Semantic Scholar response served from the cache."""
+    S2_CACHE_HITS.inc(endpoint=endpoint)
+
+    trace = _trace.get()
+    if trace is not None:
+        trace["requests"].append({"endpoint": endpoint, "cached": True})
+
+
+def start_http_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> http.server.HTTPServer:
+    """Serve the metrics in the Prometheus text format on `http://host:port/metrics` from a daemon thread."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="paperbot-metrics", daemon=True).start()
+
+    return server
+
+
+def _label_values(labelnames: tuple[str, ...], labels: dict[str, Any]) -> LabelValues:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: tuple[str, ...], values: LabelValues) -> str:
+    if not labelnames:
+        return ""
+
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values, strict=True))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,188 @@
+"""Opt-in profiling of slow commands.
+
+A `Profiler` runs commands under cProfile and a stack sampler, and keeps the profile of every command slower than a
+threshold, and of a random sample of commands. Each kept profile is written to a directory as
+
+- `<name>.prof`, a pstats dump, e.g., for `python -m pstats` or snakeviz,
+- `<name>.collapsed`, sampled stacks in the collapsed format of flamegraph.pl and speedscope,
+- `<name>.json`, the command, its arguments and timings, including the stages recorded by `paperbot.metrics`.
+
+The entry points configure it from the environment, see `Profiler.from_env`, and wrap each command, e.g.,
+
+    profiler = Profiler.from_env()
+
+    with profiler.profile("paperfind", text):
+        client.paperfind(app, body)
+
+Only the thread running the command is profiled; on an event loop, tasks interleaved with the command are profiled
+along with it. A thread profiles one command at a time, overlapping commands on the same thread run unprofiled.
+
+"""
+
+import collections
+import contextlib
+import cProfile
+import datetime
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from paperbot import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+_UNSAFE_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+class Profiler:
+    """Profiles commands, keeping the profiles of slow and sampled commands.
+
+    Disabled, i.e., `profile` does nothing, unless `directory` is set together with `threshold` or `sample_rate`.
+
+    Parameters
+    ----------
+    directory
+        Directory of the profiles, created if missing.
+    threshold
+        Keep the profile of commands taking at least this many seconds.
+    sample_rate
+        Fraction of commands whose profile is kept regardless of their duration, e.g., 0.01.
+    sample_interval
+        Seconds between stack samples of the collapsed stack file.
+
+    """
+
+    def __init__(
+        self,
+        directory: str = None,
+        threshold: float = None,
+        sample_rate: float = 0.0,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.sample_interval = sample_interval
+
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        """Configure from `PAPERBOT_PROFILE_DIR`, `PAPERBOT_PROFILE_THRESHOLD` and `PAPERBOT_PROFILE_SAMPLE_RATE`."""
+        threshold = os.environ.get("PAPERBOT_PROFILE_THRESHOLD")
+        sample_rate = os.environ.get("PAPERBOT_PROFILE_SAMPLE_RATE")
+
+        return cls(
+            directory=os.environ.get("PAPERBOT_PROFILE_DIR") or None,
+            threshold=float(threshold) if threshold else None,
+            sample_rate=float(sample_rate) if sample_rate else 0.0,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any command can be profiled."""
+        return (self.directory is not None) and ((self.threshold is not None) or (self.sample_rate > 0))
+
+    @contextlib.contextmanager
+    def profile(self, command: str, arguments: Any = None) -> Iterator[None]:
+        """Profile a command, writing its profile if it's slow or sampled."""
+        sampled = random.random() < self.sample_rate
+        if not self.enabled or (self.threshold is None and not sampled) or getattr(self._local, "active", False):
+            yield
+            return
+
+        self._local.active = True
+        previous_trace = metrics.last_trace()
+        profile = cProfile.Profile()
+        sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+
+        start_time = datetime.datetime.now(datetime.timezone.utc)
+        start = time.perf_counter()
+        sampler.start()
+        profile.enable()
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+            seconds = time.perf_counter() - start
+            self._local.active = False
+
+            slow = (self.threshold is not None) and (seconds >= self.threshold)
+            if slow or sampled:
+                info = {
+                    "command": command,
+                    "arguments": arguments,
+                    "reason": "slow" if slow else "sampled",
+                    "start": start_time.isoformat(),
+                    "seconds": round(seconds, 6),
+                    "threshold": self.threshold,
+                    "trace": trace if (trace := metrics.last_trace()) is not previous_trace else None,
+                }
+                try:
+                    self._write(profile, sampler, info)
+                except OSError:
+                    logger.exception(f"Failed to write the profile of {command}")
+
+    def _write(self, profile: cProfile.Profile, sampler: "_StackSampler", info: dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+
+        start = datetime.datetime.fromisoformat(info["start"])
+        command = _UNSAFE_CHARACTERS.sub("_", info["command"])
+        name = f"{start:%Y%m%dT%H%M%S.%f}_{command}_{info['seconds'] * 1e3:.0f}ms"
+        path = os.path.join(self.directory, name)
+
+        profile.dump_stats(f"{path}.prof")
+
+        with open(f"{path}.collapsed", "w") as file:
+            for stack, count in sampler.stacks.items():
+                file.write(f"{stack} {count}\n")
+
+        with open(f"{path}.json", "w") as file:
+            json.dump(info, file, indent=2, default=str)
+
+        logger.info(f"Profile of {info['command']} ({info['reason']}, {info['seconds']:.3f}s) written to {path}.*")
+
+
+class _StackSampler:
+    """Counts the stacks of a thread, sampled from a background thread every `interval` seconds."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: collections.Counter[str] = collections.Counter()
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="paperbot-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+
+            # collapsed stacks list the frames from the root, separated by ";".
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+
+            self.stacks[";".join(reversed(names))] += 1
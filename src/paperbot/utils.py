@@ -1,5 +1,11 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 
+from paperbot.fetch.query import Node, parse_query
+
 
 def read_queries_from_dir(dir: str) -> dict[str, str]:
     """Read queries from text files in a directory and store them in a dictionary."""
@@ -14,3 +20,135 @@ def read_queries_from_dir(dir: str) -> dict[str, str]:
         queries[filename_no_ext] = query
 
     return queries
+
+
+@dataclass
+class Template:
+    """A template query read from `<name>.txt`.
+
+    `text` is the file as written, for showing. `query` is the text with whitespace collapsed, for searching.
+
+    """
+
+    name: str
+    text: str
+    query: str
+    mtime_ns: int
+    size: int
+    _compiled: Node | None = field(default=None, repr=False)
+
+    @property
+    def compiled(self) -> Node:
+        """The query parsed into an AST, see `paperbot.fetch.query`. Raises `QuerySyntaxError` if it's invalid."""
+        if self._compiled is None:
+            self._compiled = parse_query(self.query)
+        return self._compiled
+
+
+class TemplateRegistry:
+    """Template queries of a directory, read once and revalidated by modification times.
+
+    Looking up a template stats the directory, and rescans the file names only if it changed, i.e., a template was
+    added, removed or renamed. It then stats the template's file and only reads it again if it changed. A lookup
+    thus costs two stats however many templates there are. On slow filesystems, `revalidate_after` skips the stats
+    of lookups within that many seconds of the last check.
+
+    Parameters
+    ----------
+    directory
+        Directory of the `<name>.txt` templates.
+    revalidate_after
+        Seconds during which templates are served without checking the filesystem.
+
+    """
+
+    def __init__(self, directory: str, revalidate_after: float = 0.0):
+        self.directory = directory
+        self.revalidate_after = revalidate_after
+
+        self._lock = threading.Lock()
+        self._directory_mtime_ns: int | None = None
+        self._names: set[str] = set()
+        self._templates: dict[str, Template] = {}
+        self._checked: dict[str, float] = {}
+
+    def get(self, name: str) -> Template | None:
+        """The template `name`, or None if the directory has no `<name>.txt`."""
+        with self._lock:
+            now = time.monotonic()
+            checked = self._checked.get(name)
+            if (checked is not None) and (now - checked < self.revalidate_after):
+                return self._templates.get(name)
+
+            # only known names are recorded, so unknown names typed by users don't grow `_checked`.
+            self._revalidate_directory()
+            if name not in self._names:
+                self._templates.pop(name, None)
+                self._checked.pop(name, None)
+                return None
+
+            self._checked[name] = now
+            return self._revalidate_template(name)
+
+    def names(self) -> list[str]:
+        """Names of the templates, sorted."""
+        with self._lock:
+            self._revalidate_directory()
+            return sorted(self._names)
+
+    def queries(self) -> dict[str, str]:
+        """Normalized queries by template name, like `read_queries_from_dir`."""
+        templates = {name: self.get(name) for name in self.names()}
+        return {name: template.query for name, template in templates.items() if template is not None}
+
+    def _revalidate_directory(self):
+        try:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+
+        if (mtime_ns == self._directory_mtime_ns) and (mtime_ns is not None):
+            return
+
+        self._directory_mtime_ns = mtime_ns
+        names = set()
+        if mtime_ns is not None:
+            with os.scandir(self.directory) as entries:
+                names = {entry.name[:-4] for entry in entries if entry.name.endswith(".txt") and entry.is_file()}
+
+        self._names = names
+        for name in set(self._templates) - names:
+            del self._templates[name]
+
+    def _revalidate_template(self, name: str) -> Template | None:
+        path = os.path.join(self.directory, f"{name}.txt")
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._templates.pop(name, None)
+            return None
+
+        template = self._templates.get(name)
+        if (template is not None) and (template.mtime_ns, template.size) == (stat.st_mtime_ns, stat.st_size):
+            return template
+
+        with open(path) as f:
+            text = f.read()
+
+        template = Template(name, text, " ".join(text.split()), stat.st_mtime_ns, stat.st_size)
+        self._templates[name] = template
+        return template
+
+
+_registries: dict[str, TemplateRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_template_registry(directory: str) -> TemplateRegistry:
+    """Registry of a template directory, shared by all the handlers using it."""
+    key = os.path.abspath(directory)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = TemplateRegistry(directory)
+        return registry
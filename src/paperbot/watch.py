@@ -0,0 +1,230 @@
+"""Watch subscriptions, re-running a query per channel and posting only the papers not posted before.
+
+A subscription stores the channel, the query and a high-water mark: the newest publication date posted so far and
+the IDs of the papers posted since shortly before it. Each run fetches papers from the high-water date minus
+`lookback_days`, since Semantic Scholar indexes some papers days after their publication date, and skips the IDs
+already posted. A weekly run of a template subscribed to since 2022 then fetches a few weeks of papers instead of
+the years of papers a `/paperfind` fetches.
+
+Subscriptions are kept in an SQLite database, see `WatchStore`. The socket mode bots check for due subscriptions
+periodically when `PAPERBOT_WATCH_PATH` is set.
+
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from paperbot.fetch.paper import Paper
+
+DAY = 24 * 60 * 60
+
+DEFAULT_INTERVAL = 7 * DAY
+DEFAULT_LOOKBACK_DAYS = 30
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS subscriptions ("
+    " id INTEGER PRIMARY KEY,"
+    " client TEXT NOT NULL,"
+    " channel TEXT NOT NULL,"
+    " query TEXT NOT NULL,"
+    " name TEXT NOT NULL,"
+    " high_water TEXT NOT NULL,"
+    " interval REAL NOT NULL,"
+    " last_run REAL)",
+    "CREATE INDEX IF NOT EXISTS subscriptions_channel ON subscriptions (client, channel)",
+    "CREATE TABLE IF NOT EXISTS seen ("
+    " subscription_id INTEGER NOT NULL REFERENCES subscriptions (id) ON DELETE CASCADE,"
+    " paper_id TEXT NOT NULL,"
+    " publication_date TEXT,"
+    " PRIMARY KEY (subscription_id, paper_id)) WITHOUT ROWID",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Subscription:
+    """A query watched by a channel.
+
+    `name` is the template name or the query as typed, for listing. `high_water` is the newest publication date
+    posted so far, or the date subscribed from before the first run.
+
+    """
+
+    id: int
+    client: str
+    channel: str
+    query: str
+    name: str
+    high_water: datetime.date
+    interval: float
+    last_run: float | None
+
+    def is_due(self, now: float) -> bool:
+        """Whether the subscription should run at `now`, a Unix timestamp."""
+        return (self.last_run is None) or (self.last_run + self.interval <= now)
+
+    def fetch_since(self, lookback_days: int = DEFAULT_LOOKBACK_DAYS) -> datetime.date:
+        """Date to fetch papers from, i.e., the high-water date minus the lookback."""
+        if self.last_run is None:
+            return self.high_water
+        return self.high_water - datetime.timedelta(days=lookback_days)
+
+
+class WatchStore:
+    """SQLite-backed store of watch subscriptions and the papers they posted.
+
+    A single instance can be shared by threads and coroutines.
+
+    Parameters
+    ----------
+    path
+        Path to the SQLite database file.
+    lookback_days
+        Days before the high-water date papers are fetched from, to catch papers indexed late.
+
+    """
+
+    def __init__(self, path: str, lookback_days: int = DEFAULT_LOOKBACK_DAYS):
+        self.path = path
+        self.lookback_days = lookback_days
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+
+    def add(
+        self,
+        client: str,
+        channel: str,
+        query: str,
+        since: datetime.date,
+        name: str = None,
+        interval: float = DEFAULT_INTERVAL,
+    ) -> Subscription:
+        """Subscribe a channel to a query, posting papers published from `since` on the first run."""
+        name = name or query
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO subscriptions (client, channel, query, name, high_water, interval)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (client, channel, query, name, since.isoformat(), interval),
+            )
+        return Subscription(cursor.lastrowid, client, channel, query, name, since, interval, None)  # type: ignore
+
+    def remove(self, client: str, channel: str, subscription_id: int) -> bool:
+        """Unsubscribe a channel. Returns False if the channel has no such subscription."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM subscriptions WHERE id = ? AND client = ? AND channel = ?",
+                (subscription_id, client, channel),
+            )
+        return cursor.rowcount > 0
+
+    def subscriptions(self, client: str, channel: str = None) -> list[Subscription]:
+        """Subscriptions of a client, or of one of its channels."""
+        sql = "SELECT * FROM subscriptions WHERE client = ?"
+        params: list[str] = [client]
+        if channel is not None:
+            sql += " AND channel = ?"
+            params.append(channel)
+
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY id", params).fetchall()
+        return [_to_subscription(row) for row in rows]
+
+    def due(self, client: str, now: float = None) -> list[Subscription]:
+        """Subscriptions of a client which should run now."""
+        now = time.time() if now is None else now
+        return [subscription for subscription in self.subscriptions(client) if subscription.is_due(now)]
+
+    def unseen(self, subscription: Subscription, papers: Iterable[Paper]) -> list[Paper]:
+        """Papers the subscription hasn't posted, in the given order."""
+        papers = list(papers)
+        with self._lock:
+            seen = {
+                paper_id
+                for (paper_id,) in self._conn.execute(
+                    "SELECT paper_id FROM seen WHERE subscription_id = ?", (subscription.id,)
+                )
+            }
+        return [paper for paper in papers if paper.get("id") not in seen]
+
+    def mark_posted(self, subscription: Subscription, papers: Iterable[Paper], now: float = None) -> Subscription:
+        """Record the posted papers and the run, raising the high-water mark to the newest of them.
+
+        IDs of papers published before the next lookback window are dropped, since they won't be fetched again. IDs of
+        papers without a publication date are kept, since a search from a date also matches papers of its year.
+
+        """
+        now = time.time() if now is None else now
+
+        rows = [(subscription.id, paper["id"], paper.get("publication_date")) for paper in papers if paper.get("id")]
+        dates = [datetime.date.fromisoformat(date) for _, _, date in rows if date]
+        high_water = max([subscription.high_water, *dates])
+        updated = Subscription(
+            subscription.id,
+            subscription.client,
+            subscription.channel,
+            subscription.query,
+            subscription.name,
+            high_water,
+            subscription.interval,
+            now,
+        )
+        oldest_fetched = updated.fetch_since(self.lookback_days).isoformat()
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?, ?)", rows)
+                self._conn.execute(
+                    "DELETE FROM seen WHERE subscription_id = ? AND publication_date < ?",
+                    (subscription.id, oldest_fetched),
+                )
+                self._conn.execute(
+                    "UPDATE subscriptions SET high_water = ?, last_run = ? WHERE id = ?",
+                    (high_water.isoformat(), now, subscription.id),
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+        return updated
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: WatchStore | None = None
+
+
+def get_default_store() -> WatchStore | None:
+    """Store of the `/paperwatch` commands, or None if watches are disabled."""
+    return _default_store
+
+
+def set_default_store(store: WatchStore | None):
+    """Keep the subscriptions of the `/paperwatch` commands in `store`. None disables watches."""
+    global _default_store
+    _default_store = store
+
+
+def _to_subscription(row: tuple) -> Subscription:
+    subscription_id, client, channel, query, name, high_water, interval, last_run = row
+    return Subscription(
+        subscription_id, client, channel, query, name, datetime.date.fromisoformat(high_water), interval, last_run
+    )
@@ -0,0 +1,102 @@
+import datetime
+import random
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+
+import paperbot.fetch.semantic_scholar as ss
+from paperbot.fetch import fetcher
+
+
+def make_raw_papers(n_dated: int, n_year_only: int, n_undated: int, seed: int = 0) -> list[dict[str, Any]]:
+    """Raw papers with a publication date, with only a year, and with neither, in random order."""
+    rng = random.Random(seed)
+    papers = []
+
+    for i in range(n_dated + n_year_only + n_undated):
+        date = datetime.date(2015, 1, 1) + datetime.timedelta(days=rng.randint(0, 3650))
+        papers.append(
+            {
+                "paperId": f"{i:040x}",
+                "title": f"Paper {i}",
+                "publicationDate": date.isoformat() if i < n_dated else None,
+                "year": date.year if i < n_dated + n_year_only else None,
+            }
+        )
+
+    rng.shuffle(papers)
+    return papers
+
+
+def fake_iter_papers_from_query(raw_papers: list[dict[str, Any]], page_size: int = 20):
+    """Stands in for `semantic_scholar.iter_papers_from_query`, filtering and sorting papers like Semantic Scholar."""
+
+    def iter_papers_from_query(
+        query: str,
+        fields: str = None,
+        publication_date_or_year: str = None,
+        publication_types: str = None,
+        sort: str = None,
+        max_pages: int = None,
+        max_papers: int = None,
+        client: ss.SemanticScholarClient = None,
+    ) -> Iterator[list[dict[str, Any]]]:
+        papers = raw_papers
+
+        if publication_date_or_year:
+            since, _, until = publication_date_or_year.partition(":")
+            until = until or "9999"
+            papers = [
+                paper
+                for paper in papers
+                if (date := _get_date_or_year(paper)) and (since <= date) and (date[: len(until)] <= until)
+            ]
+
+        # papers without publication date are sorted last, even the ones with a year.
+        if sort == "publicationDate:desc":
+            papers = sorted(papers, key=lambda paper: paper["publicationDate"] or "", reverse=True)
+
+        for start in range(0, len(papers), page_size):
+            yield papers[start : start + page_size]
+
+    return iter_papers_from_query
+
+
+def _get_date_or_year(paper: dict[str, Any]) -> str | None:
+    if paper["publicationDate"]:
+        return paper["publicationDate"]
+    return f"{paper['year']}-01-01" if paper["year"] else None
+
+
+def _get_dates(papers: list[Any]) -> list[str | None]:
+    return [paper.get("publication_date") for paper in papers]
+
+
+@pytest.mark.parametrize("limit", [1, 10, 100, 400])
+@pytest.mark.parametrize(
+    ("since", "until"),
+    [(None, None), (datetime.date(2017, 3, 1), None), (datetime.date(2017, 3, 1), datetime.date(2021, 6, 30))],
+)
+def test_limited_fetch_keeps_newest_papers(monkeypatch: pytest.MonkeyPatch, limit, since, until):
+    """The papers of a limited fetch are the newest papers of the unlimited fetch."""
+    raw_papers = make_raw_papers(n_dated=300, n_year_only=60, n_undated=10)
+    monkeypatch.setattr(ss, "iter_papers_from_query", fake_iter_papers_from_query(raw_papers))
+
+    papers = fetcher.fetch_papers_from_query(f"limited {limit}", since=since, until=until, limit=limit)
+    all_papers = fetcher.fetch_papers_from_query(f"unlimited {limit}", since=since, until=until)
+
+    assert len(papers) == min(limit, len(all_papers))
+    assert _get_dates(papers) == _get_dates(all_papers[-limit:])
+
+
+@pytest.mark.parametrize("limit", [5, 30, 45])
+def test_limited_fetch_keeps_newest_papers_after_undated_papers(monkeypatch: pytest.MonkeyPatch, limit):
+    """Same, when papers without publication date nor year are found before `limit` dated papers."""
+    raw_papers = make_raw_papers(n_dated=20, n_year_only=20, n_undated=10)
+    monkeypatch.setattr(ss, "iter_papers_from_query", fake_iter_papers_from_query(raw_papers, page_size=7))
+
+    papers = fetcher.fetch_papers_from_query(f"limited {limit}", limit=limit)
+    all_papers = fetcher.fetch_papers_from_query(f"unlimited {limit}")
+
+    assert _get_dates(papers) == _get_dates(all_papers[-limit:])
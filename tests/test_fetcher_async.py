@@ -0,0 +1,37 @@
+import asyncio
+import datetime
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pytest
+from test_fetcher import fake_iter_papers_from_query, make_raw_papers
+
+import paperbot.fetch.semantic_scholar_async as ss
+from paperbot.fetch import fetcher_async
+
+
+def fake_aiter_papers_from_query(raw_papers: list[dict[str, Any]], page_size: int = 20):
+    """Stands in for `semantic_scholar_async.iter_papers_from_query`, see `fake_iter_papers_from_query`."""
+    iter_papers_from_query = fake_iter_papers_from_query(raw_papers, page_size)
+
+    async def aiter_papers_from_query(*args: Any, **kwargs: Any) -> AsyncIterator[list[dict[str, Any]]]:
+        for page in iter_papers_from_query(*args, **kwargs):
+            yield page
+
+    return aiter_papers_from_query
+
+
+@pytest.mark.parametrize("limit", [1, 10, 100, 400])
+@pytest.mark.parametrize("since", [None, datetime.date(2017, 3, 1)])
+def test_limited_fetch_keeps_newest_papers(monkeypatch: pytest.MonkeyPatch, limit, since):
+    """The papers of a limited fetch are the newest papers of the unlimited fetch."""
+    raw_papers = make_raw_papers(n_dated=300, n_year_only=60, n_undated=10)
+    monkeypatch.setattr(ss, "iter_papers_from_query", fake_aiter_papers_from_query(raw_papers))
+
+    papers = asyncio.run(fetcher_async.fetch_papers_from_query(f"limited {limit}", since=since, limit=limit))
+    all_papers = asyncio.run(fetcher_async.fetch_papers_from_query(f"unlimited {limit}", since=since))
+
+    assert len(papers) == min(limit, len(all_papers))
+    assert [paper.get("publication_date") for paper in papers] == [
+        paper.get("publication_date") for paper in all_papers[-limit:]
+    ]
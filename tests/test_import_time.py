@@ -0,0 +1,14 @@
+import pathlib
+import runpy
+
+import pytest
+
+CHECK_IMPORT_TIME = runpy.run_path(str(pathlib.Path(__file__).parents[1] / "scripts" / "check_import_time.py"))
+BUDGETS = CHECK_IMPORT_TIME["BUDGETS"]
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_import_time_within_budget(module: str):
+    """The module imports within its budget of `check_import_time.py`, without importing its forbidden modules."""
+    budget, forbidden = BUDGETS[module]
+    assert CHECK_IMPORT_TIME["check"](module, budget, forbidden, repeat=3)
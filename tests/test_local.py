@@ -0,0 +1,36 @@
+import pathlib
+import re
+import subprocess
+import sys
+
+from paperbot.fetch.local import LocalBackend
+from paperbot.fetch.standin import make_corpus
+
+INGEST_SCRIPT = pathlib.Path(__file__).parents[1] / "scripts" / "ingest_s2_datasets.py"
+
+
+def test_sample_shards_are_ingested(tmp_path: pathlib.Path):
+    """The sample shards of `ingest_s2_datasets.py` load the papers and abstracts of the corpus into a mirror."""
+    database = tmp_path / "mirror.sqlite"
+    subprocess.run(
+        [sys.executable, INGEST_SCRIPT, database, "sample", tmp_path / "shards", "--papers", "500", "--shards", "3"],
+        check=True,
+    )
+
+    backend = LocalBackend(str(database))
+    try:
+        assert backend.count() == 500
+        assert backend.release("papers") == backend.release("abstracts") == "sample"
+
+        pages = backend.iter_papers_from_query("protein", "title,abstract")
+        papers = {paper["title"]: paper["abstract"] for page in pages for paper in page}
+    finally:
+        backend.close()
+
+    expected_papers = {
+        paper["title"]: paper["abstract"]
+        for paper in make_corpus(500)
+        if "protein" in re.findall(r"\w+", f"{paper['title']} {paper['abstract']}".lower())
+    }
+    assert expected_papers
+    assert papers == expected_papers
@@ -0,0 +1,37 @@
+import pathlib
+
+import pytest
+
+import paperbot.fetch.semantic_scholar as ss
+from paperbot.fetch import fetcher
+from paperbot.fetch.standin import StandInServer, make_corpus
+from paperbot.fetch.transport import FixtureNotFoundError, make_transport
+
+
+def _make_client(base_url: str, mode: str, fixture_dir: pathlib.Path) -> ss.SemanticScholarClient:
+    return ss.SemanticScholarClient(
+        base_url=base_url,
+        rate_limiter=ss.RateLimiter(rate=1000.0, burst=1000),
+        max_retries=0,
+        transport=make_transport(mode, str(fixture_dir)),
+    )
+
+
+def _fetch(client: ss.SemanticScholarClient) -> list[list[dict]]:
+    papers = fetcher.fetch_papers_from_query("learning", limit=50, client=client)
+    paper, citing_papers = fetcher.fetch_papers_citing(papers[-1]["id"], limit=30, client=client)
+    return [[p.to_dict() for p in papers], [paper.to_dict()], [p.to_dict() for p in citing_papers]]
+
+
+def test_recorded_responses_are_replayed_offline(tmp_path: pathlib.Path):
+    """Responses recorded from the stand-in server are replayed after it stopped, and only those."""
+    with StandInServer(make_corpus(500), page_size=20) as server:
+        recorded = _fetch(_make_client(server.url, "record", tmp_path))
+
+    assert any(tmp_path.iterdir())
+
+    replaying_client = _make_client(server.url, "replay", tmp_path)
+    assert _fetch(replaying_client) == recorded
+
+    with pytest.raises(FixtureNotFoundError):
+        fetcher.fetch_papers_from_query("diffusion", limit=50, client=replaying_client)